@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Benchmarks
+
+This package contains reproducible benchmarks for the TreeNode package.
+They run in-process against SQLite (no project is required) and are not
+installed with the package.
+
+Usage:
+    python -m benchmarks <name> [options]
+    python -m benchmarks <name> --help
+
+Benchmarks:
+- `import_casting`: type casting of imported records.
+- `tree_operations`: tree operations on wide, deep and balanced trees.
+
+Set TREENODE_BENCH_DB=postgresql (and the PG* variables) to run against
+PostgreSQL instead of SQLite.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Benchmarks Entry Point
+
+Sets up Django with the benchmark settings and runs the chosen benchmark.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+import argparse
+import importlib
+import os
+import sys
+
+BENCHMARKS = ["import_casting", "tree_operations"]
+
+
+def main(argv=None):
+    """Parse the arguments and run the benchmark."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+    import django
+    django.setup()
+
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    modules = {}
+    for name in BENCHMARKS:
+        modules[name] = importlib.import_module(f"benchmarks.{name}")
+        modules[name].add_arguments(subparsers.add_parser(name))
+    options = vars(parser.parse_args(argv))
+
+    modules[options.pop("benchmark")].run(**options)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Benchmarks Admin
+
+Admin registration used to benchmark the changelist rendering.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from django.contrib import admin
+
+from treenode.admin import TreeNodeAdminModel
+
+from .models import BenchNode
+
+
+@admin.register(BenchNode)
+class BenchNodeAdmin(TreeNodeAdminModel):
+    """BenchNode admin."""
+
+    list_display = ("name", "code")
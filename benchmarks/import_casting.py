@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Import Type Casting Benchmark
+
+Measures how many rows per second TreeNodeImporter converts for each input
+format: the per-record cast_record_types() path versus the column-wise
+conversion plan with and without NumPy. File parsing is excluded.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+import io
+import time
+from datetime import datetime, timezone
+
+from treenode.utils import TreeNodeExporter, TreeNodeImporter
+
+from .models import BenchNode
+
+FORMATS = ["csv", "tsv", "json", "yaml", "xlsx"]
+
+
+def add_arguments(parser):
+    """Add the benchmark options."""
+    parser.add_argument("--rows", type=int, default=10000)
+
+
+def make_rows(rows):
+    """Generate exporter-like records for a flat list of nodes."""
+    created = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            "id": i + 1,
+            "tn_parent": (i // 10) or None,
+            "tn_priority": i % 10,
+            "name": f"Node {i}",
+            "code": i * 7,
+            "rank": i * 1000,
+            "weight": i / 3,
+            "active": bool(i % 2),
+            "created": created.isoformat(),
+            "note": "",
+        }
+        for i in range(rows)
+    ]
+
+
+def make_file(records, format):
+    """Serialize records with the exporter writers."""
+    exporter = TreeNodeExporter.__new__(TreeNodeExporter)
+    exporter.filename = "bench"
+    exporter.fields = list(records[0].keys())
+    exporter.get_data = lambda: records
+    return io.BytesIO(exporter.export(format).content)
+
+
+def measure(func):
+    """Return the duration of the call in seconds."""
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+def run(rows=10000):
+    """Run the benchmark and print rows per second."""
+    records = make_rows(rows)
+    print(f"Import type casting, {rows} rows (rows/sec)")
+    print(f"{'format':<8}{'per record':>14}{'plan':>14}{'plan+numpy':>14}")
+    for format in FORMATS:
+        file = make_file(records, format)
+        importer = TreeNodeImporter(BenchNode, file, format)
+        raw_data = getattr(importer, f"from_{format}")()
+
+        def per_record():
+            for row in raw_data:
+                record = importer.filter_fields(row)
+                record = importer.process_complex_fields(record)
+                importer.cast_record_types(record)
+
+        def plan(use_numpy):
+            importer.use_numpy = use_numpy
+            importer.process_batch(raw_data)
+
+        results = [
+            measure(per_record),
+            measure(lambda: plan(False)),
+            measure(lambda: plan(True)),
+        ]
+        print(f"{format:<8}" + "".join(
+            f"{rows / duration:>14,.0f}" for duration in results
+        ))
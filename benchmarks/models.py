@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Benchmarks Models
+
+Models used by the benchmarks.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from django.db import models
+from django.utils import timezone
+
+from treenode.models import TreeNodeModel
+
+
+class BenchNode(TreeNodeModel):
+    """A tree node with a few fields of the most common types."""
+
+    treenode_display_field = "name"
+
+    name = models.CharField(max_length=255)
+    code = models.IntegerField(default=0)
+    rank = models.BigIntegerField(default=0)
+    weight = models.FloatField(null=True, blank=True)
+    active = models.BooleanField(default=True)
+    created = models.DateTimeField(default=timezone.now)
+    note = models.TextField(blank=True, default="")
+
+    class Meta(TreeNodeModel.Meta):
+        """Meta Class."""
+
+        app_label = "benchmarks"
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Tree Operations Benchmark
+
+Builds wide, deep and balanced trees of the given sizes and measures the
+tree operations on each of them: single and bulk inserts, moves, reorders,
+deletes, ancestors/descendants/siblings queries, update_tree(), import,
+export and the admin changelist rendering.
+
+For every operation the wall time, the number of SQL queries and the peak
+Python memory (tracemalloc) are reported. Tracing memory slows Python code
+down; use --no-memory to get cleaner timings. The results can be written
+to a JSON file to track trends between runs.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+import io
+import json
+import platform
+import random
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from django import get_version
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client
+
+from treenode import utils
+from treenode.version import __version__
+
+from .models import BenchNode
+from .trees import SHAPES, build_tree
+
+OPERATIONS = [
+    "ancestors",
+    "descendants",
+    "siblings",
+    "insert",
+    "bulk_insert",
+    "move",
+    "reorder",
+    "update_tree",
+    "export",
+    "import",
+    "admin",
+    "delete",
+]
+
+BULK_INSERT_SIZE = 1000
+
+
+def add_arguments(parser):
+    """Add the benchmark options."""
+    parser.add_argument(
+        "--sizes", default="1000,10000",
+        help="comma separated tree sizes (up to 1000000)")
+    parser.add_argument(
+        "--shapes", default=",".join(SHAPES),
+        help="comma separated tree shapes")
+    parser.add_argument(
+        "--operations", default=",".join(OPERATIONS),
+        help="comma separated operations")
+    parser.add_argument(
+        "--samples", type=int, default=100,
+        help="number of nodes used by the per-node operations")
+    parser.add_argument(
+        "--seed", type=int, default=0)
+    parser.add_argument(
+        "--no-memory", dest="memory", action="store_false",
+        help="do not trace the peak memory")
+    parser.add_argument(
+        "--output", help="write the results to this JSON file")
+
+
+# ---------------------------------------------------
+# Measurement
+# ---------------------------------------------------
+
+class QueryCounter:
+    """Database execute wrapper counting the queries."""
+
+    def __init__(self):
+        """Init."""
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """Count the query and execute it."""
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(func, memory=True):
+    """Run the callable and return its wall time, queries and peak memory."""
+    BenchNode.clear_cache()
+    BenchNode.closure_model.clear_cache()
+    # The debug query log is capped, so the queries are counted directly
+    counter = QueryCounter()
+    if memory:
+        tracemalloc.start()
+    try:
+        with connection.execute_wrapper(counter):
+            started = time.perf_counter()
+            func()
+            duration = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if memory else None
+    finally:
+        if memory:
+            tracemalloc.stop()
+    return dict(
+        wall_time=duration,
+        queries=counter.count,
+        peak_memory=peak,
+    )
+
+
+class TreeSample:
+    """Random but reproducible samples of the nodes of the current tree."""
+
+    def __init__(self, samples, seed):
+        """Init."""
+        self.samples = samples
+        self.random = random.Random(seed)
+
+    def pks(self, count=None, roots=True):
+        """Return a sample of node pks."""
+        queryset = BenchNode.objects.order_by()
+        if not roots:
+            queryset = queryset.filter(tn_parent__isnull=False)
+        pks = list(queryset.values_list("pk", flat=True))
+        return self.random.sample(pks, min(count or self.samples, len(pks)))
+
+    def nodes(self, count=None, roots=True):
+        """Return a sample of nodes."""
+        pks = self.pks(count, roots)
+        nodes = BenchNode.objects.in_bulk(pks)
+        return [nodes[pk] for pk in pks]
+
+
+# ---------------------------------------------------
+# Operations
+#
+# Each function prepares the data and returns the callable to measure
+# and the number of the operations it performs.
+# ---------------------------------------------------
+
+def prepare_ancestors(sample):
+    """Get the ancestors of the sampled nodes."""
+    nodes = sample.nodes()
+    return lambda: [node.get_ancestors() for node in nodes], len(nodes)
+
+
+def prepare_descendants(sample):
+    """Get the descendants of the sampled nodes."""
+    nodes = sample.nodes()
+    return lambda: [node.get_descendants() for node in nodes], len(nodes)
+
+
+def prepare_siblings(sample):
+    """Get the siblings of the sampled nodes."""
+    nodes = sample.nodes()
+    return lambda: [node.get_siblings() for node in nodes], len(nodes)
+
+
+def prepare_insert(sample):
+    """Create a new node under each sampled node."""
+    parents = sample.nodes()
+
+    def run():
+        for parent in parents:
+            BenchNode.objects.create(name="Inserted", tn_parent=parent)
+    return run, len(parents)
+
+
+def prepare_bulk_insert(sample):
+    """Create nodes in bulk under the sampled nodes."""
+    parents = sample.nodes()
+    nodes = [
+        BenchNode(name="Bulk", tn_parent=parents[i % len(parents)])
+        for i in range(BULK_INSERT_SIZE)
+    ]
+    return lambda: BenchNode.objects.bulk_create(nodes), len(nodes)
+
+
+def prepare_move(sample):
+    """Move the sampled nodes to the other sampled nodes."""
+    closure_model = BenchNode.closure_model
+    nodes = sample.nodes(roots=False)
+    targets = sample.nodes()
+    # The moves are applied one after another, so a node must not contain
+    # any of the targets: a subtree without targets never gets one
+    ancestors = set(closure_model.objects.filter(
+        child_id__in=[target.pk for target in targets]
+    ).values_list("parent_id", flat=True))
+    pairs = [
+        (node, target)
+        for node, target in zip(nodes, targets)
+        if node.pk not in ancestors
+    ]
+
+    def run():
+        for node, target in pairs:
+            node.tn_parent = target
+            node.save()
+    return run, len(pairs)
+
+
+def prepare_reorder(sample):
+    """Move each sampled node to the first place among its siblings."""
+    nodes = sample.nodes()
+
+    def run():
+        for node in nodes:
+            node.tn_priority = 0 if node.tn_priority else 1
+            node.save()
+    return run, len(nodes)
+
+
+def prepare_update_tree(sample):
+    """Rebuild the Closure table."""
+    return BenchNode.update_tree, 1
+
+
+def prepare_export(sample):
+    """Export the whole tree to CSV."""
+    exporter = utils.TreeNodeExporter(BenchNode.objects.all())
+    return lambda: exporter.export("csv"), BenchNode.objects.count()
+
+
+def prepare_import(sample):
+    """Import the exported tree into an empty table."""
+    exporter = utils.TreeNodeExporter(BenchNode.objects.all())
+    content = exporter.export("csv").content
+    count = BenchNode.objects.count()
+    BenchNode.delete_tree()
+
+    def run():
+        file = io.BytesIO(content)
+        importer = utils.TreeNodeImporter(BenchNode, file, "csv")
+        importer.finalize(importer.import_data())
+    return run, count
+
+
+def prepare_admin(sample):
+    """Render the first page of the admin changelist."""
+    user_model = get_user_model()
+    user = user_model.objects.filter(username="bench").first()
+    if user is None:
+        user = user_model.objects.create_superuser("bench", "", "bench")
+    client = Client()
+    client.force_login(user)
+
+    def run():
+        response = client.get("/admin/benchmarks/benchnode/")
+        assert response.status_code == 200, response.status_code
+    return run, 1
+
+
+def prepare_delete(sample):
+    """Delete the sampled nodes with their subtrees."""
+    nodes = sample.nodes(roots=False)
+    return lambda: [node.delete() for node in nodes], len(nodes)
+
+
+# ---------------------------------------------------
+# Runner
+# ---------------------------------------------------
+
+def run(sizes, shapes, operations, samples, seed, memory, output):
+    """Run the benchmark and print the results."""
+    call_command("migrate", run_syncdb=True, verbosity=0)
+
+    sizes = [int(size) for size in sizes.split(",")]
+    shapes = shapes.split(",")
+    operations = operations.split(",")
+    unknown = set(shapes) - set(SHAPES) | set(operations) - set(OPERATIONS)
+    if unknown:
+        raise SystemExit(f"Unknown shapes/operations: {sorted(unknown)}")
+    if not utils.__all__:
+        # Import and export require the optional packages
+        operations = [o for o in operations if o not in ("export", "import")]
+
+    results = []
+    print(
+        f"{'shape':<10}{'size':>9}  {'operation':<13}{'ops':>6}"
+        f"{'total, s':>11}{'per op, ms':>12}{'queries':>9}{'peak, MB':>10}"
+    )
+    for shape in shapes:
+        for size in sizes:
+            build_tree(BenchNode, shape, size)
+            for operation in operations:
+                sample = TreeSample(samples, seed)
+                prepare = globals()[f"prepare_{operation}"]
+                func, count = prepare(sample)
+                result = measure(func, memory)
+                result.update(
+                    shape=shape, size=size, operation=operation, ops=count)
+                results.append(result)
+                print_result(result)
+
+    if output:
+        report = dict(meta=get_meta(samples, seed), results=results)
+        with open(output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"Results written to {output}")
+
+
+def print_result(result):
+    """Print a row of the results table."""
+    per_op = result["wall_time"] * 1000 / (result["ops"] or 1)
+    peak = result["peak_memory"]
+    peak = "-" if peak is None else f"{peak / 2 ** 20:.1f}"
+    print(
+        f"{result['shape']:<10}{result['size']:>9}  "
+        f"{result['operation']:<13}{result['ops']:>6}"
+        f"{result['wall_time']:>11.3f}{per_op:>12.2f}"
+        f"{result['queries']:>9}{peak:>10}"
+    )
+
+
+def get_meta(samples, seed):
+    """Return the environment description stored with the results."""
+    return dict(
+        timestamp=datetime.now(timezone.utc).isoformat(),
+        treenode=__version__,
+        django=get_version(),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        database=connection.vendor,
+        samples=samples,
+        seed=seed,
+    )
+
+
+# The End
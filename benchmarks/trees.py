@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark Tree Generator
+
+Generates trees of a given shape and size directly in the database: the
+nodes and their closure rows are computed in Python and written with plain
+bulk inserts, so building a 1M-node tree does not depend on the speed of
+the code being measured.
+
+Shapes:
+- `wide`: a single root with all the other nodes as its children.
+- `balanced`: every node has `BALANCED_FAN` children.
+- `deep`: chains of `DEEP_LEVELS` nodes, each chain is a separate tree.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from collections import defaultdict
+from datetime import datetime, timezone
+from django.db import models, transaction
+
+SHAPES = ["wide", "balanced", "deep"]
+
+BALANCED_FAN = 10
+DEEP_LEVELS = 100
+BATCH_SIZE = 10000
+
+
+def get_parent(shape, index):
+    """Return the parent index of the node (None for a root)."""
+    if index == 0:
+        return None
+    if shape == "wide":
+        return 0
+    if shape == "balanced":
+        return (index - 1) // BALANCED_FAN
+    if shape == "deep":
+        return None if index % DEEP_LEVELS == 0 else index - 1
+    raise ValueError(f"Unknown tree shape: {shape}")
+
+
+def iter_nodes(shape, size):
+    """Yield (pk, parent_pk, priority) tuples; parents come first."""
+    priorities = defaultdict(int)
+    for index in range(size):
+        parent = get_parent(shape, index)
+        parent_pk = None if parent is None else parent + 1
+        yield index + 1, parent_pk, priorities[parent_pk]
+        priorities[parent_pk] += 1
+
+
+def build_tree(model, shape, size):
+    """Replace the tree of the model with a generated one."""
+    closure_model = model.closure_model
+    model.delete_tree()
+
+    nodes = []
+    links = []
+    ancestors = {}
+    created = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    with transaction.atomic():
+        for pk, parent_pk, priority in iter_nodes(shape, size):
+            path = (pk,) + ancestors.get(parent_pk, ())
+            ancestors[pk] = path
+            # The last node of the path is the root of the tree
+            tree_id = path[-1]
+            nodes.append(model(
+                pk=pk,
+                tn_parent_id=parent_pk,
+                tn_priority=priority,
+                tn_tree_id=tree_id,
+                name=f"Node {pk}",
+                code=pk,
+                created=created,
+            ))
+            links.extend(
+                closure_model(
+                    parent_id=ancestor,
+                    child_id=pk,
+                    depth=depth,
+                    tree_id=tree_id
+                )
+                for depth, ancestor in enumerate(path)
+            )
+            if len(links) >= BATCH_SIZE:
+                flush(model, nodes, links)
+        flush(model, nodes, links)
+    model.objects.update_auto_increment()
+    model.clear_cache()
+    closure_model.clear_cache()
+
+
+def flush(model, nodes, links):
+    """Write the accumulated nodes and closure rows and empty the lists."""
+    # Plain querysets: the closure rows are already computed
+    models.QuerySet(model).bulk_create(nodes, batch_size=BATCH_SIZE)
+    models.QuerySet(model.closure_model).bulk_create(
+        links, batch_size=BATCH_SIZE)
+    nodes.clear()
+    links.clear()
+
+
+# The End
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Tests
+
+The test suite of the TreeNode package. It runs in-process against an
+in-memory SQLite database (no project is required) and is not installed
+with the package.
+
+Usage:
+    python -m pytest
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
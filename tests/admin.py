@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Tests Admin
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from django.contrib import admin
+
+from treenode.admin import TreeNodeAdminModel
+
+from .models import Category
+
+admin.site.register(Category, TreeNodeAdminModel)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Tests Configuration
+
+Sets Django up and creates the test databases once per session; the test
+cases are Django TestCase classes run by pytest.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+import os
+
+import django
+import pytest
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+django.setup()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def django_databases():
+    """Create the test databases."""
+    from django.test.utils import (
+        setup_databases, setup_test_environment,
+        teardown_databases, teardown_test_environment
+    )
+
+    setup_test_environment()
+    config = setup_databases(verbosity=0, interactive=False)
+    yield
+    teardown_databases(config, verbosity=0)
+    teardown_test_environment()
+
+
+@pytest.fixture(autouse=True)
+def treenode_cache():
+    """Clear the tree cache: the pks are reused after each test."""
+    from treenode.cache import treenode_cache
+
+    treenode_cache.clear()
+    yield treenode_cache
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Tests Models
+
+Models used by the tests.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+import uuid
+from django.db import models
+
+from treenode.models import TreeNodeModel
+
+
+class Category(TreeNodeModel):
+    """A tree node with an integer pk."""
+
+    treenode_display_field = "name"
+
+    name = models.CharField(max_length=255)
+
+    class Meta(TreeNodeModel.Meta):
+        """Meta Class."""
+
+        app_label = "tests"
+
+
+class UUIDCategory(TreeNodeModel):
+    """A tree node with a UUID pk."""
+
+    treenode_display_field = "name"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    name = models.CharField(max_length=255)
+
+    class Meta(TreeNodeModel.Meta):
+        """Meta Class."""
+
+        app_label = "tests"
+
+
+class Tag(models.Model):
+    """A tag of the tagged nodes."""
+
+    name = models.CharField(max_length=255)
+
+    class Meta:
+        """Meta Class."""
+
+        app_label = "tests"
+
+
+class TaggedCategory(TreeNodeModel):
+    """A tree node with a many-to-many field."""
+
+    treenode_display_field = "name"
+
+    name = models.CharField(max_length=255)
+    tags = models.ManyToManyField(Tag, blank=True)
+
+    class Meta(TreeNodeModel.Meta):
+        """Meta Class."""
+
+        app_label = "tests"
+
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Tests Routers
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+class PrimaryReplicaRouter:
+    """Router of a primary database and its read replica."""
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Allow the relations between the nodes of both databases."""
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Create the tables on the primary only."""
+        return db == "default"
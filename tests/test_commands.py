@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Management Commands Tests
+
+Tests of the management commands for the maintenance of the trees.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+from django.core.management import CommandError, call_command
+from django.db import connections
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from .models import Category
+from .utils import build_tree, get_closure
+
+
+class RenumberCommandTest(TestCase):
+    """The treenode_renumber command."""
+
+    def setUp(self):
+        """Build the tree."""
+        self.nodes = build_tree(Category, fan=2, depth=3)
+
+    def test_renumber_command(self):
+        """The priorities of all the siblings are renumbered."""
+        Category.objects.filter(tn_parent__isnull=True).update(
+            tn_priority=5)
+        call_command("treenode_renumber", "tests.Category", stdout=StringIO())
+        priorities = Category.objects.filter(
+            tn_parent__isnull=True).values_list("tn_priority", flat=True)
+        self.assertEqual(sorted(priorities), [0, 1])
+
+
+class LoadCommandTest(TestCase):
+    """The treenode_dump and treenode_load commands."""
+
+    def setUp(self):
+        """Build the tree and a directory for the snapshots."""
+        self.nodes = build_tree(Category, fan=2, depth=3)
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        self.path = os.path.join(self.tempdir.name, "tree.jsonl.gz")
+
+    def dump_and_load(self, *args):
+        """Dump the tree, change it and load the snapshot back."""
+        nodes = dict(Category.objects.values_list("pk", "tn_parent_id"))
+        closure = get_closure(Category)
+        call_command("treenode_dump", "tests.Category", self.path, *args,
+                     stdout=StringIO())
+        self.nodes["1"].delete()
+        call_command("treenode_load", self.path, "--replace",
+                     stdout=StringIO())
+        self.assertEqual(
+            dict(Category.objects.values_list("pk", "tn_parent_id")), nodes)
+        self.assertEqual(get_closure(Category), closure)
+        self.assertTrue(Category.check_tree().is_valid)
+
+    def test_load(self):
+        """The tree is restored with its Closure table."""
+        self.dump_and_load()
+
+    def test_load_without_closure(self):
+        """The Closure table is rebuilt if the snapshot has none."""
+        self.dump_and_load("--no-closure")
+
+    def test_not_empty(self):
+        """A tree is replaced only with --replace."""
+        call_command("treenode_dump", "tests.Category", self.path,
+                     stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command("treenode_load", self.path, stdout=StringIO())
+
+
+class LoadDatabaseTest(TransactionTestCase):
+    """The treenode_load command on the write database of the model."""
+
+    databases = {"default", "replica"}
+
+    def test_load_using(self):
+        """All the queries of the load go to the write database."""
+        build_tree(Category, fan=2, depth=3)
+        closure = get_closure(Category)
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "tree.jsonl")
+            call_command("treenode_dump", "tests.Category", path,
+                         stdout=StringIO())
+            # The replica mirrors the primary: it stands for another
+            # write database
+            with mock.patch(
+                "treenode.management.commands.treenode_load.db_for_write",
+                return_value="replica"
+            ), CaptureQueriesContext(connections["default"]) as queries:
+                call_command("treenode_load", path, "--replace",
+                             stdout=StringIO())
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(get_closure(Category), closure)
+
+
+# The End
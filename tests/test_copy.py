@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Subtree Copy Tests
+
+Tests of the bulk copies of subtrees.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from .models import Category
+from .utils import TreeTestCase
+
+
+class CopyTest(TreeTestCase):
+    """Subtree copies (Model.copy_to)."""
+
+    def test_copy(self):
+        """The subtree is copied under the target, at the position."""
+        copy = self.get("0.1").copy_to(
+            self.nodes["2"], position=1,
+            field_overrides={"name": lambda node: f"copy-{node.name}"})
+        self.assertEqual(
+            self.names(self.nodes["2"]), ["2.0", "copy-0.1", "2.1", "2.2"])
+        self.assertEqual(
+            self.names(copy), ["copy-0.1.0", "copy-0.1.1", "copy-0.1.2"])
+        self.assertEqual(copy.tn_tree_id, self.nodes["2"].pk)
+        self.assertTreeValid()
+
+    def test_copy_into_own_descendant(self):
+        """A subtree can be copied into itself; the copy isn't copied."""
+        count = Category.objects.count()
+        copy = self.get("0").copy_to(self.nodes["0.1.1"])
+        self.assertEqual(Category.objects.count(), count + 13)
+        self.assertEqual(copy.get_descendants_count(), 12)
+        self.assertEqual(copy.tn_tree_id, self.nodes["0"].pk)
+        self.assertTreeValid()
+
+    def test_copy_as_root(self):
+        """A copy made a root is a tree of its own."""
+        copy = self.get("1.2").copy_to(None, position=0)
+        self.assertEqual(self.names(None), ["1.2", "0", "1", "2"])
+        self.assertEqual(copy.tn_tree_id, copy.pk)
+        child = Category.objects.get(tn_parent=copy, name="1.2.0")
+        self.assertEqual(child.tn_tree_id, copy.pk)
+        self.assertTreeValid()
+
+
+# The End
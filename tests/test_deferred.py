@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Deferred Updates Tests
+
+Tests of the deferred (write-behind) tree updates.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from .models import Category
+from .utils import TreeTestCase, get_closure
+
+
+class DeferredUpdatesTest(TreeTestCase):
+    """Deferred tree updates (Model.deferred_tree_updates)."""
+
+    def test_burst(self):
+        """The changes of the block are applied when it exits."""
+        with Category.deferred_tree_updates():
+            node = self.get("0.2")
+            node.tn_parent = self.get("1")
+            node.tn_priority = 0
+            node.save()
+            Category(name="new", tn_parent=node).save()
+            root = self.get("2")
+            root.tn_priority = 0
+            root.save()
+        self.assertEqual(
+            self.names(self.nodes["1"]), ["0.2", "1.0", "1.1", "1.2"])
+        self.assertEqual(self.names(None), ["2", "0", "1"])
+        self.assertEqual(
+            Category.objects.get(name="new").tn_tree_id, self.nodes["1"].pk)
+        self.assertTreeValid()
+
+    def test_cycle(self):
+        """A cycle created in the block is detected and rolled back."""
+        closure = get_closure(Category)
+        with self.assertRaises(ValueError):
+            with Category.deferred_tree_updates():
+                first = self.get("1.0")
+                first.tn_parent = self.get("2.1")
+                first.save()
+                last = self.get("2")
+                last.tn_parent = self.get("1.0.2")
+                last.save()
+        self.assertIsNone(self.get("2").tn_parent_id)
+        self.assertEqual(get_closure(Category), closure)
+
+
+# The End
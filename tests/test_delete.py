@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Delete Tests
+
+Tests of the non-cascading delete and of the bulk subtree deletion.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from django.db.models.signals import pre_delete
+from django.test import TestCase
+
+from .models import Category, Tag, TaggedCategory
+from .utils import TreeTestCase, build_tree, get_closure, get_expected_closure
+
+
+class DeleteTest(TreeTestCase):
+    """Deletes of nodes and of subtrees."""
+
+    def test_delete_root_without_cascade(self):
+        """The children of a deleted root become trees of their own."""
+        self.get("1").delete(cascade=False)
+        self.assertEqual(self.names(None), ["0", "1.0", "1.1", "1.2", "2"])
+        self.assertEqual(self.get("1.1.0").tn_tree_id, self.nodes["1.1"].pk)
+        self.assertTreeValid()
+
+    def test_delete_without_cascade(self):
+        """The children take the place of the deleted node."""
+        self.get("0.1").delete(cascade=False)
+        self.assertEqual(
+            self.names(self.nodes["0"]),
+            ["0.0", "0.1.0", "0.1.1", "0.1.2", "0.2"])
+        self.assertTreeValid()
+
+    def test_queryset_delete(self):
+        """The siblings of the deleted subtrees are renumbered."""
+        Category.objects.filter(
+            pk__in=[self.nodes["0"].pk, self.nodes["2.1"].pk]).delete()
+        self.assertEqual(self.names(None), ["1", "2"])
+        self.assertEqual(self.names(self.nodes["2"]), ["2.0", "2.2"])
+        self.assertTreeValid()
+
+
+class CollectorDeleteTest(TestCase):
+    """Deletes that fall back to Django's collector."""
+
+    def setUp(self):
+        """Build the tree with tagged nodes."""
+        self.nodes = build_tree(TaggedCategory, fan=2, depth=3)
+        self.tag = Tag.objects.create(name="tag")
+        for node in self.nodes.values():
+            node.tags.add(self.tag)
+
+    def test_can_raw_delete(self):
+        """Many-to-many fields and signals disable the raw delete."""
+        self.assertTrue(Category.objects.all().can_raw_delete())
+        self.assertFalse(TaggedCategory.objects.all().can_raw_delete())
+
+        def receiver(**kwargs):
+            pass
+
+        pre_delete.connect(receiver, sender=Category)
+        try:
+            self.assertFalse(Category.objects.all().can_raw_delete())
+        finally:
+            pre_delete.disconnect(receiver, sender=Category)
+
+    def test_delete(self):
+        """The many-to-many rows of the deleted subtrees are removed."""
+        through = TaggedCategory.tags.through
+        deleted, rows = TaggedCategory.objects.filter(
+            pk=self.nodes["0"].pk).delete()
+        self.assertEqual(rows[TaggedCategory._meta.label], 7)
+        self.assertEqual(rows[through._meta.label], 7)
+        self.assertEqual(through.objects.count(), 7)
+        self.assertEqual(
+            list(TaggedCategory.objects.filter(
+                tn_parent=None).values_list("name", flat=True)), ["1"])
+        self.assertEqual(get_closure(TaggedCategory),
+                         get_expected_closure(TaggedCategory))
+
+    def test_delete_all(self):
+        """Deleting all the nodes removes their many-to-many rows."""
+        TaggedCategory.objects.delete_all()
+        self.assertFalse(TaggedCategory.objects.exists())
+        self.assertFalse(TaggedCategory.closure_model.objects.exists())
+        self.assertFalse(TaggedCategory.tags.through.objects.exists())
+
+    def test_signals(self):
+        """The delete signals are sent for every node of the subtree."""
+        deleted = []
+
+        def receiver(instance, **kwargs):
+            deleted.append(instance.name)
+
+        pre_delete.connect(receiver, sender=Category)
+        try:
+            nodes = build_tree(Category, fan=2, depth=2)
+            Category.objects.filter(pk=nodes["1"].pk).delete()
+        finally:
+            pre_delete.disconnect(receiver, sender=Category)
+        self.assertEqual(sorted(deleted), ["1", "1.0", "1.1"])
+        self.assertEqual(get_closure(Category), get_expected_closure(Category))
+
+
+# The End
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Forests Tests
+
+Tests of the maintenance of the tree ids of the nodes and of the Closure
+table rows.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from django.db import models
+from django.test import TestCase
+
+from treenode.models.factory import get_tree_id_field
+
+from .models import Category, UUIDCategory
+from .utils import TreeTestCase, build_tree
+
+
+class TreeIdsTest(TreeTestCase):
+    """Maintenance of the tree ids."""
+
+    def test_save(self):
+        """New nodes and moved subtrees get the pk of their root."""
+        root = Category(name="root")
+        root.save()
+        self.assertEqual(root.tn_tree_id, root.pk)
+
+        node = self.get("0.1")
+        node.tn_parent = root
+        node.save()
+        self.assertEqual(self.get("0.1.2").tn_tree_id, root.pk)
+
+        node.tn_parent = None
+        node.save()
+        self.assertEqual(self.get("0.1.2").tn_tree_id, node.pk)
+        self.assertTreeValid(gaps=True)
+
+    def test_bulk_create(self):
+        """Nodes created in bulk get the pk of their root."""
+        parent = self.get("2.1")
+        Category.objects.bulk_create([
+            Category(name="child", tn_parent=parent),
+            Category(name="grandchild", tn_parent=self.get("2.1.0")),
+        ])
+        Category.objects.bulk_create([Category(name="root")])
+        self.assertEqual(
+            Category.objects.get(name="child").tn_tree_id, self.nodes["2"].pk)
+        self.assertEqual(
+            Category.objects.get(name="grandchild").tn_tree_id,
+            self.nodes["2"].pk)
+        root = Category.objects.get(name="root")
+        self.assertEqual(root.tn_tree_id, root.pk)
+        self.assertTreeValid(gaps=True)
+
+    def test_repair(self):
+        """Wrong tree ids of the nodes and of the rows are repaired."""
+        node = self.nodes["1.2.0"]
+        Category.objects.filter(pk=node.pk).update(tn_tree_id=None)
+        Category.closure_model.objects.filter(
+            child_id=self.nodes["2.0"].pk).update(tree_id=0)
+
+        report = Category.check_tree()
+        self.assertEqual(report.counts["tree_ids"], 2)
+        self.assertTrue(Category.check_tree(repair=True).is_valid)
+        node.refresh_from_db()
+        self.assertEqual(node.tn_tree_id, self.nodes["1"].pk)
+
+
+class UUIDTreeIdsTest(TestCase):
+    """Tree ids of a model with UUID pks."""
+
+    def test_tree_ids_have_the_type_of_the_pk(self):
+        """The tree ids are the UUIDs of the roots."""
+        nodes = build_tree(UUIDCategory, fan=2, depth=3)
+        self.assertEqual(nodes["1.0.1"].tn_tree_id, nodes["1"].pk)
+        self.assertTrue(UUIDCategory.check_tree().is_valid)
+
+
+class TreeIdFieldTest(TestCase):
+    """Types of the tree id fields."""
+
+    def test_big_pks(self):
+        """The tree ids of big integer pks are big integers."""
+        self.assertIsInstance(Category._meta.pk, models.BigAutoField)
+        for field in (Category._meta.get_field("tn_tree_id"),
+                      Category.closure_model._meta.get_field("tree_id")):
+            self.assertIsInstance(field, models.PositiveBigIntegerField)
+            self.assertTrue(field.null)
+        Category.objects.bulk_create([Category(pk=2 ** 40, name="root")])
+        root = Category.objects.get(pk=2 ** 40)
+        self.assertEqual(root.tn_tree_id, 2 ** 40)
+        child = Category.objects.create(name="child", tn_parent=root)
+        self.assertEqual(child.tn_tree_id, 2 ** 40)
+        self.assertTrue(Category.check_tree().is_valid)
+
+    def test_field_types(self):
+        """Other integer pks keep the default tree id field."""
+        for pk, expected in (
+            (models.AutoField(primary_key=True), None),
+            (models.SmallAutoField(primary_key=True), None),
+            (models.BigIntegerField(primary_key=True),
+             models.PositiveBigIntegerField),
+            (models.UUIDField(primary_key=True), models.UUIDField),
+        ):
+            field = get_tree_id_field(pk)
+            if expected is None:
+                self.assertIsNone(field)
+            else:
+                self.assertIsInstance(field, expected)
+                self.assertFalse(field.primary_key)
+
+
+# The End
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Import and Export Tests
+
+Tests of the export of the trees with their Closure Table rows, of the
+restore of such files and of the conversion of the imported columns.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+import io
+import json
+from unittest import mock
+from django.db import models
+from django.test import SimpleTestCase, TestCase
+
+from treenode.utils import TreeNodeExporter, TreeNodeImporter
+from treenode.utils.importer import CastPlan
+
+from .models import Category
+from .utils import build_tree, get_closure, get_expected_closure
+
+
+def import_tree(content, format):
+    """Import the file content and return the result of finalize()."""
+    importer = TreeNodeImporter(Category, io.BytesIO(content), format)
+    return importer.finalize(importer.import_data())
+
+
+class RestoreTest(TestCase):
+    """Restore of the trees exported with their closure rows."""
+
+    def setUp(self):
+        """Build the tree and remember its Closure table."""
+        self.nodes = build_tree(Category, fan=2, depth=3)
+        self.closure = get_closure(Category)
+
+    def export(self, format):
+        """Export the tree with its closure rows."""
+        exporter = TreeNodeExporter(
+            Category.objects.all(), include_closure=True)
+        return exporter.export(format).content
+
+    def test_restore(self):
+        """The nodes and the closure rows are loaded as they are."""
+        for format in ("csv", "json"):
+            content = self.export(format)
+            Category.delete_tree()
+            with mock.patch.object(
+                    TreeNodeImporter, "restore",
+                    autospec=True, side_effect=TreeNodeImporter.restore
+            ) as restore:
+                result = import_tree(content, format)
+            self.assertTrue(restore.called)
+            self.assertEqual(result["errors"], [])
+            self.assertEqual(len(result["create"]), len(self.nodes))
+            self.assertEqual(get_closure(Category), self.closure)
+            self.assertTrue(Category.check_tree().is_valid)
+
+    def test_wrong_closure_is_rolled_back(self):
+        """A restore failing the closure check leaves the table empty."""
+        records = json.loads(self.export("json"))
+        for record in records:
+            ancestors = json.loads(record["tn_closure"])
+            if ancestors:
+                # Drop the link to the parent of one node
+                record["tn_closure"] = json.dumps(ancestors[1:])
+                break
+        Category.delete_tree()
+
+        result = import_tree(json.dumps(records).encode(), "json")
+        self.assertEqual(len(result["errors"]), 1)
+        self.assertIn("missing_links", result["errors"][0])
+        self.assertFalse(Category.objects.exists())
+        self.assertFalse(Category.closure_model.objects.exists())
+
+    def test_import_into_tree(self):
+        """Into a tree with nodes the closure is calculated again."""
+        content = self.export("csv")
+        Category.objects.filter(pk=self.nodes["1"].pk).delete()
+
+        result = import_tree(content, "csv")
+        self.assertEqual(result["errors"], [])
+        self.assertEqual(Category.objects.count(), len(self.nodes))
+        self.assertEqual(
+            get_closure(Category), get_expected_closure(Category))
+
+
+class CastPlanTest(SimpleTestCase):
+    """Column conversion of the imported records."""
+
+    columns = {
+        "tn_priority": [
+            "12", " 7 ", "-3", "1e3", "1.0", "inf", "", None, 4, 2.0, 2.5,
+            True,
+        ],
+        "tn_parent": ["1", "1e3", "nan", 5, None],
+    }
+
+    def setUp(self):
+        """Compile the plan."""
+        self.plan = CastPlan(Category)
+
+    def test_numpy_path(self):
+        """The NumPy path gives the same values as the per-value one."""
+        for name, values in self.columns.items():
+            expected = self.plan.apply({name: values}, use_numpy=False)
+            for count in range(1, len(values) + 1):
+                # The column may be converted in one pass or value by value
+                column = {name: values[:count]}
+                result = self.plan.apply(column, use_numpy=True)
+                self.assertEqual(
+                    {key: value[:count] for key, value in expected.items()},
+                    result)
+
+    def test_integers(self):
+        """Integer columns are parsed like int()."""
+        for values, expected in (
+                (["12", " 7 ", None], [12, 7, None]),
+                (["1e3", "2"], [None, 2]),
+                (["1.0"], [None]),
+                ([3.0, 4], [3, 4]),
+        ):
+            result = self.plan.apply({"tn_priority": values})
+            self.assertEqual(result["tn_priority"], expected)
+
+    def get_plan(self, field, kind):
+        """Return a plan with an extra `value` column of the field."""
+        field.set_attributes_from_name("value")
+        plan = CastPlan(Category)
+        plan.columns["value"] = ("value", kind, field.to_python)
+        return plan
+
+    def test_booleans(self):
+        """Boolean columns accept the tokens of BooleanField.to_python()."""
+        plan = self.get_plan(models.BooleanField(), CastPlan.BOOLEAN)
+        values = ["True", "f", "1", 0, True, "null", "true", "1.0", 1.0]
+        result = plan.apply({"value": values})
+        self.assertEqual(
+            result["value"],
+            [True, False, True, False, True, None, None, None, True])
+        self.assertEqual(result, plan.apply({"value": values}, False))
+
+    def test_floats(self):
+        """Float columns are parsed like float()."""
+        plan = self.get_plan(models.FloatField(), CastPlan.FLOAT)
+        values = ["1e3", " 2.5 ", "1_0", 3, None]
+        result = plan.apply({"value": values})
+        self.assertEqual(result["value"], [1000.0, 2.5, 10.0, 3.0, None])
+        self.assertEqual(result, plan.apply({"value": values}, False))
+
+
+# The End
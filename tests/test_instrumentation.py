@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Instrumentation Tests
+
+Tests of the statistics collected by collect_stats().
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from treenode.instrumentation import collect_stats, tree_operation
+
+from .models import Category
+from .utils import TreeTestCase
+
+
+class CollectStatsTest(TreeTestCase):
+    """Statistics of the tree operations."""
+
+    def test_move(self):
+        """The queries and the rows of a move are recorded."""
+        node, parent = self.get("0.1"), self.get("1")
+        with collect_stats() as stats, \
+                CaptureQueriesContext(connection) as queries:
+            Category.objects.move_nodes([(node, parent, 0)])
+        self.assertEqual(self.names(self.nodes["1"])[0], "0.1")
+
+        [outer] = stats.filter(nested=False)
+        self.assertEqual(outer.operation, "move_nodes")
+        self.assertEqual(outer.model, Category)
+        self.assertEqual(stats.queries, len(queries))
+        self.assertGreater(stats.duration, 0)
+        writes = [
+            query for query in queries
+            if query["sql"].startswith(("INSERT", "UPDATE", "DELETE"))
+        ]
+        self.assertGreaterEqual(outer.rows, len(writes))
+        # The inner calls are included in the outer one
+        for inner in stats.filter(nested=True):
+            self.assertLessEqual(inner.queries, outer.queries)
+            self.assertLessEqual(inner.rows, outer.rows)
+        self.assertIn(
+            "tests.Category.move_nodes", stats.summary())
+
+    def test_bulk_create(self):
+        """The inserted nodes and closure rows are counted."""
+        parent = self.get("1.0")
+        nodes = [
+            Category(name=f"1.0.{index}", tn_parent=parent)
+            for index in range(3, 8)
+        ]
+        with collect_stats() as stats, \
+                CaptureQueriesContext(connection) as queries:
+            Category.objects.bulk_create(nodes)
+
+        [outer] = stats.filter(nested=False)
+        self.assertEqual(outer.operation, "bulk_create")
+        self.assertEqual(stats.queries, len(queries))
+        # 5 nodes and 5 * 3 closure rows (self, parent and root)
+        self.assertEqual(outer.rows, 20)
+        [closure] = stats.filter(
+            "bulk_create", model=Category.closure_model)
+        self.assertEqual(closure.rows, 15)
+        self.assertTreeValid(gaps=True)
+
+    def test_cache_hits(self):
+        """The cached calls are recorded as cache hits."""
+        node = self.get("2.1.0")
+        node.clear_cache()
+        with collect_stats() as stats:
+            node.get_ancestors_pks()
+            node.get_ancestors_pks()
+        first, second = stats.filter("get_ancestors_pks", model=Category)
+        self.assertEqual((first.cache_misses, first.queries), (1, 1))
+        self.assertEqual((second.cache_hits, second.queries), (1, 0))
+
+    def test_disconnected(self):
+        """The receiver is disconnected at the end of the block."""
+        receivers = len(tree_operation.receivers)
+        with collect_stats() as stats:
+            pass
+        self.get("0").get_ancestors_pks()
+        self.assertEqual(len(stats), 0)
+        self.assertEqual(len(tree_operation.receivers), receivers)
+
+
+# The End
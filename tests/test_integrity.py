@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Integrity Tests
+
+Tests of the tree integrity checker, its repair and the treenode_check
+command.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from treenode.integrity import TreeIntegrityChecker
+
+from .models import Category, UUIDCategory
+from .utils import build_tree, get_closure, get_expected_closure
+
+
+class IntegrityCheckTest(TestCase):
+    """Checks of a corrupted tree."""
+
+    def setUp(self):
+        """Build the tree."""
+        self.nodes = build_tree(Category)
+
+    def test_valid_tree(self):
+        """A tree built with save() has no problems."""
+        report = Category.check_tree()
+        self.assertTrue(report.is_valid)
+        self.assertEqual(set(report.counts), set(TreeIntegrityChecker.checks))
+
+    def test_missing_and_extra_links(self):
+        """Missing and extra rows are found and repaired."""
+        node = self.nodes["0.1.2"]
+        closure = Category.closure_model.objects
+        closure.filter(child_id=node.pk, depth=1).delete()
+        closure.create(
+            parent_id=self.nodes["1"].pk,
+            child_id=node.pk,
+            depth=2,
+            tree_id=node.tn_tree_id
+        )
+
+        report = Category.check_tree()
+        self.assertFalse(report.is_valid)
+        self.assertEqual(report.counts["missing_links"], 1)
+        self.assertEqual(report.counts["extra_links"], 1)
+        self.assertIn(node.pk, report.affected)
+
+        report = Category.check_tree(repair=True)
+        self.assertTrue(report.is_valid)
+        self.assertEqual(
+            get_closure(Category), get_expected_closure(Category))
+
+    def test_missing_self_link(self):
+        """A node without its self-link is found and repaired."""
+        node = self.nodes["2"]
+        Category.closure_model.objects.filter(
+            child_id=node.pk, depth=0).delete()
+
+        report = Category.check_tree()
+        self.assertEqual(report.samples["missing_self_links"], [node.pk])
+        self.assertTrue(Category.check_tree(repair=True).is_valid)
+
+    def test_priority_gaps(self):
+        """Gaps between the priorities of the siblings are renumbered."""
+        parent = self.nodes["0"]
+        Category.objects.filter(pk=self.nodes["0.2"].pk).update(
+            tn_priority=7)
+
+        report = Category.check_tree()
+        self.assertEqual(report.samples["priority_gaps"], [parent.pk])
+        self.assertTrue(Category.check_tree(repair=True).is_valid)
+        priorities = Category.objects.filter(tn_parent=parent).order_by(
+            "tn_priority").values_list("name", "tn_priority")
+        self.assertEqual(
+            list(priorities), [("0.0", 0), ("0.1", 1), ("0.2", 2)])
+
+    def test_cycles(self):
+        """Nodes in a cycle are reported and left untouched by repair."""
+        first = self.nodes["0.1"]
+        last = self.nodes["0.1.2"]
+        Category.objects.filter(pk=first.pk).update(tn_parent=last)
+        # The whole subtree can't reach a root any more
+        cycles = {
+            node.pk for name, node in self.nodes.items()
+            if name.startswith("0.1")
+        }
+
+        report = Category.check_tree()
+        self.assertEqual(report.cycles, cycles)
+        report = Category.check_tree(repair=True)
+        self.assertEqual(report.cycles, cycles)
+        first.refresh_from_db()
+        self.assertEqual(first.tn_parent_id, last.pk)
+
+    def test_repair_rebuilds_affected_subtrees_only(self):
+        """Only the subtree of the affected node is rebuilt."""
+        node = self.nodes["1.1"]
+        Category.closure_model.objects.filter(
+            child_id=self.nodes["1.1.0"].pk, depth=1).delete()
+        Category.objects.filter(pk=node.pk).update(tn_tree_id=None)
+        checker = TreeIntegrityChecker(Category)
+        report = checker.check()
+
+        pks, parents = checker.get_adjacency()
+        roots = checker.get_subtree_roots(
+            parents, [pk in report.affected for pk in pks.tolist()])
+        self.assertEqual(pks[roots].tolist(), [node.pk])
+        self.assertTrue(checker.repair(report).is_valid)
+
+
+class IntegrityOptionsTest(TestCase):
+    """Options of the checker and of the commands."""
+
+    def setUp(self):
+        """Build the tree."""
+        self.nodes = build_tree(Category, fan=2, depth=3)
+
+    def test_selected_checks(self):
+        """Only the selected checks are run."""
+        report = TreeIntegrityChecker(Category).check(
+            checks=["missing_links", "cycles"])
+        self.assertEqual(set(report.counts), {"missing_links", "cycles"})
+
+    def test_check_command(self):
+        """The command fails while problems remain and can repair them."""
+        Category.closure_model.objects.filter(
+            child_id=self.nodes["1.0.1"].pk, depth=2).delete()
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command("treenode_check", "tests.Category", stdout=out)
+        self.assertIn("missing_links: 1", out.getvalue())
+
+        call_command(
+            "treenode_check", "tests.Category", "--repair", "--database",
+            "default", stdout=out)
+        self.assertTrue(Category.check_tree().is_valid)
+
+
+class UUIDIntegrityTest(TestCase):
+    """Checks of a tree with UUID pks."""
+
+    def setUp(self):
+        """Build the tree."""
+        self.nodes = build_tree(UUIDCategory, fan=2, depth=3)
+
+    def test_repair(self):
+        """Missing rows are found and repaired with UUID pks."""
+        node = self.nodes["0.1.1"]
+        UUIDCategory.closure_model.objects.filter(
+            child_id=node.pk, depth=1).delete()
+
+        report = UUIDCategory.check_tree()
+        self.assertEqual(report.counts["missing_links"], 1)
+        self.assertTrue(UUIDCategory.check_tree(repair=True).is_valid)
+        self.assertEqual(
+            get_closure(UUIDCategory), get_expected_closure(UUIDCategory))
+
+    def test_cycles(self):
+        """Cycles are found with UUID pks."""
+        first = self.nodes["1.0"]
+        last = self.nodes["1.0.0"]
+        UUIDCategory.objects.filter(pk=first.pk).update(tn_parent=last)
+
+        report = UUIDCategory.check_tree()
+        self.assertEqual(
+            report.cycles, {first.pk, last.pk, self.nodes["1.0.1"].pk})
+
+
+# The End
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Jobs Tests
+
+Tests of the import and export jobs of the admin and of the cleanup of
+the export files.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+import os
+import tempfile
+import time
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.test import TestCase
+
+from treenode import jobs
+from treenode.jobs import (
+    EXPORTS_DIR, TreeNodeJob, cleanup_exports, cleanup_exports_throttled
+)
+
+from .models import Category
+from .utils import build_tree
+
+
+class NoModifiedTimeStorage(FileSystemStorage):
+    """A storage that can't tell the age of its files."""
+
+    def get_modified_time(self, name):
+        """Raise NotImplementedError as many remote storages do."""
+        raise NotImplementedError
+
+
+class StorageMixin:
+    """Write the export files to a temporary folder."""
+
+    def setUp(self):
+        """Use a storage in a temporary folder."""
+        location = tempfile.TemporaryDirectory()
+        self.addCleanup(location.cleanup)
+        self.storage = FileSystemStorage(location=location.name)
+        for module in ("treenode.jobs", "treenode.admin"):
+            patcher = mock.patch(f"{module}.default_storage", self.storage)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class CleanupTest(StorageMixin, TestCase):
+    """Cleanup of the export files."""
+
+    def setUp(self):
+        """Forget the last cleanup."""
+        super().setUp()
+        TreeNodeJob.get_cache().delete(jobs.CLEANUP_KEY)
+
+    def save(self, job_id, age=0):
+        """Write an export file of the job, `age` seconds old."""
+        name = self.storage.save(
+            f"{EXPORTS_DIR}/{job_id}/tree.csv", ContentFile(b"id"))
+        mtime = time.time() - age
+        os.utime(self.storage.path(name), (mtime, mtime))
+        return name
+
+    def test_cleanup(self):
+        """Old files and their folders are deleted, new ones are kept."""
+        old = self.save("old", age=TreeNodeJob.timeout + 60)
+        new = self.save("new")
+        self.assertEqual(cleanup_exports(), 1)
+        self.assertFalse(self.storage.exists(old))
+        self.assertFalse(self.storage.exists(f"{EXPORTS_DIR}/old"))
+        self.assertTrue(self.storage.exists(new))
+
+    def test_storage_without_modified_time(self):
+        """Without the age of a file its job decides."""
+        kept = self.save("kept")
+        TreeNodeJob("export", job_id="kept").save()
+        expired = self.save("expired")
+        self.storage.__class__ = NoModifiedTimeStorage
+        self.assertEqual(cleanup_exports(), 1)
+        self.assertTrue(self.storage.exists(kept))
+        self.assertFalse(self.storage.exists(expired))
+
+    def test_missing_folder(self):
+        """Nothing is done before the first export."""
+        self.assertEqual(cleanup_exports(), 0)
+
+    def test_throttled(self):
+        """The exports look for old files once per interval."""
+        with mock.patch.object(jobs, "cleanup_exports") as cleanup:
+            cleanup_exports_throttled()
+            cleanup_exports_throttled()
+        self.assertEqual(cleanup.call_count, 1)
+
+
+class ExportViewTest(StorageMixin, TestCase):
+    """Export jobs started from the admin."""
+
+    url = "/admin/tests/category/export/"
+
+    def setUp(self):
+        """Build the tree and log in."""
+        super().setUp()
+        build_tree(Category, fan=2, depth=2)
+        user = get_user_model().objects.create_superuser(
+            "admin", "admin@example.com", "password")
+        self.client.force_login(user)
+
+    def test_export_job(self):
+        """The export runs in a job and its file is downloaded."""
+        response = self.client.get(self.url, {"format": "csv"})
+        job = response.context["job"]
+        self.assertEqual(job.status, TreeNodeJob.DONE)
+        self.assertTrue(self.storage.exists(job.result["file"]))
+
+        download_url = f"/admin/tests/category/jobs/{job.id}/download/"
+        status = self.client.get(f"/admin/tests/category/jobs/{job.id}/")
+        self.assertEqual(status.json()["download_url"], download_url)
+        response = self.client.get(download_url)
+        self.assertIn(b"0.1", b"".join(response.streaming_content))
+
+    def test_download_link(self):
+        """A download link runs a job too and redirects to its file."""
+        response = self.client.get(
+            self.url, {"format": "json", "download": ""})
+        self.assertRegex(
+            response.url, r"^/admin/tests/category/jobs/\w+/download/$")
+        response = self.client.get(response.url)
+        self.assertIn(b'"name": "0.1"', b"".join(response.streaming_content))
+
+# The End
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Locks Tests
+
+Tests of the locks of the trees taken by the structural writes.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from unittest import mock
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from treenode.locks import ROOTS, acquire, get_tree_keys, lock_trees, to_int32
+
+from .models import Category
+from .utils import build_tree
+
+
+class LocksTest(TestCase):
+    """Keys and order of the locks."""
+
+    def setUp(self):
+        """Build the tree."""
+        self.nodes = build_tree(Category, fan=2, depth=3)
+
+    def test_tree_keys(self):
+        """The keys are the pks of the roots of the nodes."""
+        pks = [self.nodes["0.1.1"].pk, self.nodes["1.0"].pk, None]
+        keys = get_tree_keys(Category, pks, "default")
+        self.assertEqual(keys, {self.nodes["0"].pk, self.nodes["1"].pk})
+
+        # Without the tree ids the roots are found in the Closure table
+        Category.objects.update(tn_tree_id=None)
+        self.assertEqual(get_tree_keys(Category, pks, "default"), keys)
+
+    def test_int32_keys(self):
+        """The keys fit into the advisory lock arguments."""
+        self.assertEqual(to_int32(ROOTS), -2 ** 31)
+        self.assertEqual(to_int32(2 ** 32 + 5), 5)
+        key = to_int32("6a2f41a3-c54b-4f9b-9e2e-d3b1a0c7e9b1")
+        self.assertTrue(-2 ** 31 <= key < 2 ** 31)
+        self.assertEqual(key, to_int32("6a2f41a3-c54b-4f9b-9e2e-d3b1a0c7e9b1"))
+
+    def test_advisory_locks_order(self):
+        """PostgreSQL advisory locks are always taken in the same order."""
+        fake = mock.MagicMock(vendor="postgresql")
+        cursor = fake.cursor.return_value.__enter__.return_value
+        acquire(Category, fake, {9, ROOTS, 2, 5})
+        keys = [call.args[1][1] for call in cursor.execute.call_args_list]
+        self.assertEqual(keys, [-2 ** 31, 2, 5, 9])
+
+    def test_row_locks_order(self):
+        """The root rows are locked in the order of their pks."""
+        with CaptureQueriesContext(connection) as queries:
+            acquire(Category, connection, {self.nodes["1"].pk, ROOTS})
+        self.assertEqual(len(queries), 1)
+        self.assertIn("ORDER BY", queries[0]["sql"])
+
+    def test_sqlite_write_lock(self):
+        """On SQLite the write lock is taken before any read."""
+        with CaptureQueriesContext(connection) as queries:
+            lock_trees(Category, [self.nodes["0.1"].pk], roots=True)
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(queries[0]["sql"].startswith("UPDATE"))
+
+    @override_settings(TREENODE_LOCKING=False)
+    def test_disabled(self):
+        """No lock is taken when the locking is disabled."""
+        with CaptureQueriesContext(connection) as queries:
+            lock_trees(Category, [self.nodes["0.1"].pk])
+        self.assertEqual(len(queries), 0)
+
+    def test_tree_changed_while_waiting(self):
+        """A tree attached to another one while waiting is locked too."""
+        node = self.nodes["0.1"]
+        first, second = self.nodes["0"].pk, self.nodes["1"].pk
+        calls = []
+
+        def fake_acquire(model, connection, keys):
+            if not calls:
+                # A concurrent move attaches the tree to another one
+                Category.objects.filter(
+                    pk=node.pk).update(tn_tree_id=second)
+            calls.append(set(keys))
+
+        fake = mock.MagicMock(vendor="postgresql", alias="default")
+        with mock.patch("treenode.locks.connections", {"default": fake}), \
+                mock.patch("treenode.locks.acquire", fake_acquire), \
+                transaction.atomic():
+            lock_trees(Category, [node.pk], using="default")
+        self.assertEqual(calls, [{first}, {second}])
+
+
+# The End
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Lookups Tests
+
+Tests of the depths, levels, counts and descendants of the nodes read
+from the Closure table.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from treenode.cache import treenode_cache
+
+from .models import Category
+from .utils import build_tree
+
+
+class DepthsTest(TestCase):
+    """Depths, levels and orders of many nodes at once."""
+
+    def setUp(self):
+        """Build the tree."""
+        self.nodes = build_tree(Category, fan=2, depth=3)
+        self.pks = [self.nodes[name].pk for name in ("0", "1.0", "1.0.1")]
+
+    def test_depths_and_levels(self):
+        """The depths and the levels are read with one query each."""
+        with self.assertNumQueries(2):
+            depths = Category.get_depths(self.pks)
+            levels = Category.get_levels(self.pks)
+        self.assertEqual([depths[pk] for pk in self.pks], [0, 1, 2])
+        self.assertEqual([levels[pk] for pk in self.pks], [1, 2, 3])
+        node = self.nodes["1.0.1"]
+        self.assertEqual((node.get_depth(), node.get_level()), (2, 3))
+
+    def test_orders(self):
+        """The orders sort the nodes like the materialized paths."""
+        pks = [node.pk for node in self.nodes.values()]
+        with self.assertNumQueries(1):
+            orders = Category.get_orders(pks)
+        names = {node.pk: name for name, node in self.nodes.items()}
+        self.assertEqual(
+            [names[pk] for pk in sorted(pks, key=orders.get)],
+            sorted(self.nodes))
+        self.assertEqual(orders[self.nodes["1.0"].pk], "000001000000")
+
+    def test_changelist(self):
+        """The changelist makes the same queries for any number of rows."""
+        user = get_user_model().objects.create_superuser(
+            "admin", "admin@example.com", "password")
+        self.client.force_login(user)
+        counts = []
+        for fan in (2, 3):
+            Category.delete_tree()
+            build_tree(Category, fan=fan, depth=3)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get("/admin/tests/category/")
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class DescendantsTest(TestCase):
+    """Descendants queryset and counts."""
+
+    def setUp(self):
+        """Build the tree and drop the cached pks lists."""
+        self.nodes = build_tree(Category, fan=2, depth=3)
+        treenode_cache.clear()
+
+    def names(self, queryset):
+        """Get the sorted names of the queryset."""
+        return sorted(queryset.values_list("name", flat=True))
+
+    def test_subquery(self):
+        """The closure table is queried inside the descendants query."""
+        node = self.nodes["0"]
+        queryset = node.get_descendants_queryset()
+        sql = str(queryset.query)
+        self.assertIn(Category.closure_model._meta.db_table, sql)
+        self.assertEqual(sql.count("SELECT"), 2)
+        with self.assertNumQueries(1):
+            names = self.names(queryset)
+        self.assertEqual(names, ["0.0", "0.0.0", "0.0.1", "0.1", "0.1.0",
+                                 "0.1.1"])
+
+    def test_options(self):
+        """The include_self and depth options limit the descendants."""
+        node = self.nodes["0"]
+        queryset = node.get_descendants_queryset(include_self=True, depth=1)
+        self.assertEqual(self.names(queryset), ["0", "0.0", "0.1"])
+
+    def test_cached_pks(self):
+        """A cached pks list is used instead of the subquery."""
+        node = self.nodes["0.1"]
+        pks = node.get_descendants_pks()
+        queryset = node.get_descendants_queryset()
+        self.assertEqual(str(queryset.query).count("SELECT"), 1)
+        self.assertEqual(sorted(queryset.values_list("pk", flat=True)),
+                         sorted(pks))
+        with override_settings(TREENODE_PK_LIST_LIMIT=1):
+            queryset = node.get_descendants_queryset()
+        self.assertEqual(str(queryset.query).count("SELECT"), 2)
+
+    def test_counts(self):
+        """The counts are read with COUNT(*) without loading the pks."""
+        root, leaf = self.nodes["0"], self.nodes["0.1.1"]
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(root.get_descendants_count(), 6)
+            self.assertEqual(root.get_descendants_count(True, 1), 3)
+            self.assertEqual(leaf.get_ancestors_count(), 3)
+            self.assertEqual(leaf.get_ancestors_count(False), 2)
+        self.assertEqual(len(queries), 4)
+        for query in queries:
+            self.assertIn("COUNT(*)", query["sql"])
+
+    def test_cached_counts(self):
+        """The counts of cached pks lists make no queries."""
+        leaf = self.nodes["0.1.1"]
+        leaf.get_ancestors_pks()
+        with self.assertNumQueries(0):
+            self.assertEqual(leaf.get_ancestors_count(), 3)
+
+
+# The End
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Batched Moves Tests
+
+Tests of the batched moves of nodes with their subtrees.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from .models import Category
+from .utils import TreeTestCase, get_closure
+
+
+class MoveNodesTest(TreeTestCase):
+    """Batched moves (Manager.move_nodes)."""
+
+    def test_moves(self):
+        """The nodes are moved with their subtrees and placed in order."""
+        count = Category.objects.move_nodes([
+            (self.nodes["0.1"], self.nodes["2"], 0),
+            (self.nodes["1.2"], None, None),
+            (self.nodes["2.0.0"].pk, self.nodes["0.0"].pk, 1),
+        ])
+        self.assertEqual(count, 3)
+        self.assertEqual(
+            self.names(self.nodes["2"]), ["0.1", "2.0", "2.1", "2.2"])
+        self.assertEqual(self.names(None), ["0", "1", "2", "1.2"])
+        self.assertEqual(
+            self.names(self.nodes["0.0"]),
+            ["0.0.0", "2.0.0", "0.0.1", "0.0.2"])
+        self.assertEqual(self.get("0.1.2").tn_tree_id, self.nodes["2"].pk)
+        self.assertEqual(self.get("1.2.0").tn_tree_id, self.nodes["1.2"].pk)
+        self.assertTreeValid()
+
+    def test_move_into_moved_subtree(self):
+        """A node may be moved into a subtree moved in the same batch."""
+        Category.objects.move_nodes([
+            (self.nodes["0"], self.nodes["1.1"], None),
+            (self.nodes["1.1"], self.nodes["2.2.2"], None),
+        ])
+        self.assertEqual(self.get("0.2.2").tn_tree_id, self.nodes["2"].pk)
+        self.assertTreeValid()
+
+    def test_cycle_in_batch(self):
+        """Two moves forming a cycle are rejected and nothing changes."""
+        closure = get_closure(Category)
+        with self.assertRaises(ValueError):
+            Category.objects.move_nodes([
+                (self.nodes["0.1"], self.nodes["1.1"], None),
+                (self.nodes["1"], self.nodes["0.1.0"], None),
+            ])
+        self.assertEqual(self.get("0.1").tn_parent_id, self.nodes["0"].pk)
+        self.assertEqual(get_closure(Category), closure)
+
+    def test_move_into_own_descendant(self):
+        """A node can't be moved into its own subtree."""
+        with self.assertRaises(ValueError):
+            Category.objects.move_nodes([
+                (self.nodes["1"], self.nodes["1.2.2"], None),
+            ])
+        with self.assertRaises(ValueError):
+            Category.objects.move_nodes([
+                (self.nodes["1"], self.nodes["1"], None),
+            ])
+        self.assertTreeValid()
+
+    def test_node_moved_twice(self):
+        """A node can be moved only once in a batch."""
+        with self.assertRaises(ValueError):
+            Category.objects.move_nodes([
+                (self.nodes["0.1"], self.nodes["1"], None),
+                (self.nodes["0.1"].pk, self.nodes["2"], None),
+            ])
+
+
+# The End
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Routing Tests
+
+Tests of the routing of the tree queries to the read replicas and of the
+structural writes to the primary database.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from django.db import connections, transaction
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from treenode import routing
+from treenode.integrity import TreeIntegrityChecker
+from treenode.routing import db_for_read, db_for_write, get_primary
+
+from .models import Category
+from .utils import build_tree
+
+
+@override_settings(TREENODE_READ_DATABASES={"default": ["replica"]})
+class RoutingTest(TransactionTestCase):
+    """Reads from the replica, writes to the primary."""
+
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        """Build the tree and forget the pins of the writes."""
+        self.nodes = build_tree(Category, fan=2, depth=3)
+        routing._pinned.clear()
+
+    def test_aliases(self):
+        """The lookups use the replica, the writes the primary."""
+        self.assertEqual(get_primary("replica"), "default")
+        self.assertEqual(get_primary("other"), "other")
+        self.assertEqual(db_for_read(Category), "replica")
+        self.assertEqual(db_for_write(Category), "default")
+
+    @override_settings(TREENODE_READ_DATABASES=None)
+    def test_without_replicas(self):
+        """Without replicas the routers decide."""
+        self.assertEqual(db_for_read(Category), "default")
+
+    def test_tree_lookups(self):
+        """The tree lookups of a node go to the replica."""
+        node = self.nodes["0.1"]
+        replica = connections["replica"]
+        with CaptureQueriesContext(replica) as queries:
+            self.assertEqual(node.get_children_count(), 2)
+            self.assertEqual(node.get_ancestors_count(include_self=False), 1)
+            self.assertEqual(node.get_descendants_count(), 2)
+        self.assertTrue(queries)
+
+    def test_pinned_after_write(self):
+        """After a change of the tree the lookups use the primary."""
+        node = self.nodes["1.0"]
+        node.tn_parent = self.nodes["0"]
+        node.save()
+        self.assertEqual(db_for_read(Category), "default")
+        with CaptureQueriesContext(connections["replica"]) as queries:
+            node.get_children_count()
+        self.assertEqual(len(queries), 0)
+
+    def test_pinned_on_commit(self):
+        """The pin starts when the change is committed."""
+        with transaction.atomic():
+            self.nodes["1.0"].save()
+            self.assertNotIn(Category._meta.label, routing._pinned)
+        self.assertTrue(routing.is_pinned(Category, "default"))
+
+    def test_not_pinned_after_rollback(self):
+        """A rolled back change doesn't pin the lookups."""
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                self.nodes["1.0"].save()
+                raise ValueError
+        self.assertEqual(routing._pinned, {})
+        self.assertEqual(db_for_read(Category), "replica")
+
+    @override_settings(TREENODE_REPLICA_PIN_SECONDS=0)
+    def test_pin_expires(self):
+        """The pin lasts TREENODE_REPLICA_PIN_SECONDS."""
+        self.nodes["1.0"].save()
+        self.assertEqual(db_for_read(Category), "replica")
+
+    def test_transaction(self):
+        """Inside a transaction on the primary the lookups stay there."""
+        with transaction.atomic():
+            self.assertEqual(db_for_read(Category), "default")
+        self.assertEqual(db_for_read(Category), "replica")
+
+    def test_node_read_from_replica(self):
+        """A node read from the replica is written to the primary."""
+        node = Category.objects.using("replica").get(name="1.1")
+        self.assertEqual(node._state.db, "replica")
+        self.assertEqual(db_for_write(Category, node), "default")
+
+        node.tn_parent = self.nodes["0.0"]
+        with CaptureQueriesContext(connections["replica"]) as queries:
+            node.save()
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(
+            Category.objects.using("default").get(pk=node.pk).tn_parent_id,
+            self.nodes["0.0"].pk)
+        self.assertTrue(Category.check_tree().is_valid)
+
+    def test_integrity_checker(self):
+        """The checks and the repair run on the write database."""
+        Category.closure_model.objects.filter(
+            child_id=self.nodes["0.1"].pk, depth=0).delete()
+        checker = TreeIntegrityChecker(Category)
+        self.assertEqual(checker.using, "default")
+        with CaptureQueriesContext(connections["replica"]) as queries:
+            report = checker.repair()
+        self.assertTrue(report.is_valid)
+        self.assertEqual(len(queries), 0)
+
+
+# The End
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Serializer Tests
+
+Tests of the serialization and of the display of the trees read with
+a single query.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+import json
+from django.test import TestCase
+
+from .models import Category
+from .utils import build_tree
+
+
+def get_names(trees):
+    """Return the nested names of serialized trees."""
+    return [
+        [tree["name"], get_names(tree.get("children", []))]
+        for tree in trees
+    ]
+
+
+class SerializerTest(TestCase):
+    """Trees serialized into nested dictionaries and JSON."""
+
+    def setUp(self):
+        """Build the tree."""
+        self.nodes = build_tree(Category, fan=2, depth=3)
+
+    def test_tree(self):
+        """The whole tree is read with one query."""
+        with self.assertNumQueries(1):
+            trees = Category.get_tree()
+        self.assertEqual(len(trees), 2)
+        node = trees[1]["children"][0]["children"][1]
+        self.assertEqual(node["name"], "1.0.1")
+        self.assertEqual(node["path"], "1.0.1")
+        self.assertEqual(node["tn_parent_id"], self.nodes["1.0"].pk)
+        self.assertNotIn("children", node)
+
+    def test_max_depth_and_fields(self):
+        """The depth and the fields of the result can be limited."""
+        with self.assertNumQueries(1):
+            trees = Category.get_tree(max_depth=1, fields=["name"])
+        self.assertEqual(
+            get_names(trees),
+            [["0", [["0.0", []], ["0.1", []]]],
+             ["1", [["1.0", []], ["1.1", []]]]])
+        self.assertEqual(
+            set(trees[0]["children"][0]), {"name", "path"})
+
+    def test_subtree(self):
+        """The subtree of a node keeps the paths of the whole tree."""
+        node = self.nodes["1.1"]
+        trees = Category.get_tree(node)
+        self.assertEqual(
+            get_names(trees), [["1.1", [["1.1.0", []], ["1.1.1", []]]]])
+        self.assertEqual(trees[0]["children"][1]["path"], "1.1.1")
+        self.assertEqual(
+            get_names(node.get_descendants_tree()),
+            [["1.1.0", []], ["1.1.1", []]])
+
+    def test_json_stream(self):
+        """The JSON chunks give the same result as the nested dictionaries."""
+        for root in (None, self.nodes["0"], self.nodes["0.1"]):
+            serializer = Category.get_tree_serializer(root, max_depth=2)
+            self.assertEqual(
+                json.loads("".join(serializer.iter_json())),
+                json.loads(serializer.to_json()))
+
+
+class DisplayTest(TestCase):
+    """Indented text display of the trees."""
+
+    def setUp(self):
+        """Build the tree."""
+        self.nodes = build_tree(Category, fan=2, depth=3)
+
+    def test_tree_display(self):
+        """The nodes are listed in pre-order, indented by their depth."""
+        with self.assertNumQueries(1):
+            lines = Category.get_tree_display(max_depth=1).split("\n")
+        self.assertEqual(
+            lines, ["0", "    0.0", "    0.1", "1", "    1.0", "    1.1"])
+
+    def test_descendants_display(self):
+        """The subtree of a node is displayed with or without the node."""
+        node = self.nodes["0.1"]
+        with self.assertNumQueries(1):
+            display = node.get_descendants_tree_display()
+        self.assertEqual(display, "0.1.0\n0.1.1")
+        self.assertEqual(
+            node.get_descendants_tree_display(include_self=True),
+            "0.1\n    0.1.0\n    0.1.1")
+
+
+# The End
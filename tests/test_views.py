@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Views Tests
+
+Tests of the AJAX endpoints of the widgets.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from unittest import mock
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from treenode.cache import treenode_cache
+
+from .models import Category
+from .utils import build_tree
+
+
+@override_settings(TREENODE_AUTOCOMPLETE_PAGE_SIZE=5)
+class AutocompleteTest(TestCase):
+    """The autocomplete endpoint."""
+
+    url = "/treenode/tree-autocomplete/"
+
+    def setUp(self):
+        """Build the tree."""
+        self.nodes = build_tree(Category, fan=3, depth=3)
+
+    def get(self, **params):
+        """Return the results and the pagination of a request."""
+        data = self.client.get(
+            self.url, {"model": "tests.Category", **params}).json()
+        return data["results"], data["pagination"]["more"]
+
+    def test_pages(self):
+        """The nodes are paginated; the first page starts with the root."""
+        with self.assertNumQueries(1):
+            results, more = self.get()
+        self.assertEqual(results[0]["id"], "")
+        self.assertEqual(
+            [row["text"] for row in results[1:]],
+            ["0", "0.0", "0.0.0", "0.0.1", "0.0.2"])
+        self.assertTrue(more)
+
+        results, more = self.get(page=8)
+        self.assertEqual(
+            [row["text"] for row in results],
+            ["2.2", "2.2.0", "2.2.1", "2.2.2"])
+        self.assertFalse(more)
+
+    @override_settings(TREENODE_AUTOCOMPLETE_SEARCH="istartswith")
+    def test_levels(self):
+        """The level and the leaf flag of each node are returned."""
+        results, more = self.get(q="1.2")
+        self.assertEqual(
+            [(row["text"], row["level"], row["is_leaf"]) for row in results],
+            [("Root", 0, True), ("1.2", 2, False), ("1.2.0", 3, True),
+             ("1.2.1", 3, True), ("1.2.2", 3, True)])
+
+    @override_settings(TREENODE_AUTOCOMPLETE_SEARCH="istartswith")
+    def test_prefix_search(self):
+        """In the prefix mode only the names starting with q match."""
+        results, more = self.get(q="2.1", page=2)
+        self.assertEqual(results, [])
+        results, more = self.get(q="2.1")
+        self.assertEqual(
+            [row["text"] for row in results[1:]],
+            ["2.1", "2.1.0", "2.1.1", "2.1.2"])
+
+    @override_settings(TREENODE_AUTOCOMPLETE_MAX_RESULTS=7)
+    def test_max_results(self):
+        """No more than the maximum number of results is returned."""
+        results, more = self.get(page=2)
+        self.assertEqual(len(results), 2)
+        self.assertFalse(more)
+
+    def test_exclude_subtree(self):
+        """The node and its descendants can be left out."""
+        results, more = self.get(q="0.1.")
+        self.assertEqual(len(results), 4)
+        results, more = self.get(
+            q="0.1.", exclude_subtree=self.nodes["0.1"].pk)
+        self.assertEqual(len(results), 1)
+
+    def test_errors(self):
+        """A missing or unknown model is rejected."""
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        response = self.client.get(self.url, {"model": "tests.Unknown"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConditionalResponsesTest(TransactionTestCase):
+    """ETag and Last-Modified of the endpoints keyed on the tree version."""
+
+    url = "/treenode/get-children-count/"
+
+    def setUp(self):
+        """Build the tree."""
+        self.nodes = build_tree(Category, fan=2, depth=2)
+        self.params = {
+            "model": "tests.Category",
+            "parent_id": self.nodes["0"].pk,
+        }
+
+    def test_not_modified(self):
+        """The response is revalidated until the tree changes."""
+        response = self.client.get(self.url, self.params)
+        self.assertEqual(response.json(), {"children_count": 2})
+        self.assertIn("no-cache", response["Cache-Control"])
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        response = self.client.get(
+            self.url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Category.objects.create(name="new", tn_parent=self.nodes["0"])
+        response = self.client.get(
+            self.url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"children_count": 3})
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_one_update_per_transaction(self):
+        """The version is updated once, when the transaction commits."""
+        with mock.patch.object(
+                treenode_cache, "update_tree_version") as update:
+            with transaction.atomic():
+                for name in ("a", "b", "c"):
+                    Category.objects.create(name=name)
+                self.assertEqual(update.call_count, 0)
+            self.assertEqual(update.call_count, 1)
+
+            # The next transaction queues its own update
+            with transaction.atomic():
+                Category.objects.create(name="d")
+            self.assertEqual(update.call_count, 2)
+
+    def test_rolled_back_update(self):
+        """An update dropped by a rollback is queued again."""
+        with mock.patch.object(
+                treenode_cache, "update_tree_version") as update:
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        Category.objects.create(name="a")
+                        raise ValueError
+                except ValueError:
+                    pass
+                Category.objects.create(name="b")
+            self.assertEqual(update.call_count, 1)
+
+            try:
+                with transaction.atomic():
+                    Category.objects.create(name="c")
+                    raise ValueError
+            except ValueError:
+                pass
+            with transaction.atomic():
+                Category.objects.create(name="d")
+            self.assertEqual(update.call_count, 2)
+
+# The End
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Tests URL Configuration
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from django.contrib import admin
+from django.urls import include, path
+
+urlpatterns = [
+    path("admin/", admin.site.urls),
+    path("treenode/", include("treenode.urls")),
+]
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Tests Utilities
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from django.test import TestCase
+
+from .models import Category
+
+
+def build_tree(model, fan=3, depth=3):
+    """
+    Build `fan` trees of the given depth with save().
+
+    The nodes are named by their path, e.g. "1.0.2" is the third child of
+    the first child of the second root. Returns {name: node}.
+    """
+    nodes = {}
+
+    def build(parent, prefix, level):
+        if level == depth:
+            return
+        for index in range(fan):
+            name = f"{prefix}.{index}" if prefix else str(index)
+            node = model(name=name, tn_parent=parent, tn_priority=index)
+            if node.pk is not None:
+                # UUID pks: let save() insert the node
+                node.pk = None
+            node.save()
+            nodes[name] = node
+            build(node, name, level + 1)
+
+    build(None, "", 0)
+    return nodes
+
+
+def get_closure(model):
+    """Return the rows of the Closure table as a set of tuples."""
+    return set(model.closure_model.objects.values_list(
+        "parent_id", "child_id", "depth"))
+
+
+def get_expected_closure(model):
+    """Return the Closure table rows derived from the adjacency list."""
+    parents = dict(model.objects.values_list("pk", "tn_parent_id"))
+    rows = set()
+    for pk in parents:
+        ancestor, depth = pk, 0
+        while ancestor is not None:
+            rows.add((ancestor, pk, depth))
+            ancestor, depth = parents[ancestor], depth + 1
+    return rows
+
+
+class TreeTestCase(TestCase):
+    """Base test case with a tree of three roots."""
+
+    def setUp(self):
+        """Build the tree."""
+        self.nodes = build_tree(Category)
+
+    def get(self, name):
+        """Return a node read again from the database."""
+        return Category.objects.get(pk=self.nodes[name].pk)
+
+    def names(self, parent):
+        """Return the names of the children in the order of priority."""
+        queryset = Category.objects.filter(
+            tn_parent=parent).order_by("tn_priority")
+        return list(queryset.values_list("name", flat=True))
+
+    def assertTreeValid(self, gaps=False):
+        """
+        Check the Closure table, the priorities and the tree ids.
+
+        If gaps is True, gaps between the priorities are allowed (save()
+        and bulk_create() don't renumber the siblings).
+        """
+        report = Category.check_tree()
+        if gaps:
+            report.counts.pop("priority_gaps")
+        self.assertTrue(report.is_valid, report.to_dict())
+        self.assertEqual(
+            get_closure(Category), get_expected_closure(Category))
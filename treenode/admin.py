@@ -14,10 +14,12 @@ Email: kaduevtr@gmail.com
 
 import os
 import importlib
-import numpy as np
 from datetime import datetime
 from django.contrib import admin
-from django.http import HttpResponseRedirect
+from django.core.exceptions import PermissionDenied
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponseRedirect
+from django.http import JsonResponse
 from django.contrib.admin.views.main import ChangeList
 from django.db import models
 from django.shortcuts import render, redirect
@@ -29,6 +31,7 @@ from django.contrib import messages
 from django.shortcuts import resolve_url
 
 from .forms import TreeNodeForm
+from .jobs import TreeNodeJob, get_job_runner, import_job, export_job
 from .widgets import TreeWidget
 
 import logging
@@ -61,14 +64,15 @@ class SortedChangeList(ChangeList):
         """Return sorted results for ChangeList rendering."""
         # Populate self.result_list with objects from the DB.
         super().get_results(request)
-        result_list = self.result_list
-        # Extract tn_order values from each object.
-        tn_orders = np.array([obj.tn_order for obj in result_list])
-        # Get sorted indices based on tn_order (ascending order).
-        # Reorder the original result_list based on the sorted indices.
-        self.result_list = [
-            result_list[int(i)] for i in np.argsort(tn_orders)
-        ]
+        # Sort keys (tn_order) of the whole page with a single query
+        orders = self.model.get_orders([obj.pk for obj in self.result_list])
+        self.result_list = sorted(
+            self.result_list, key=lambda obj: orders.get(obj.pk, '')
+        )
+        # Depths of the whole page with a single query
+        depths = self.model.get_depths([obj.pk for obj in self.result_list])
+        for obj in self.result_list:
+            obj.tn_depth = depths.get(obj.pk, 0)
 
 
 class TreeNodeAdminModel(admin.ModelAdmin):
@@ -220,6 +224,11 @@ not installed. Export and import functions are disabled.")
         field = getattr(self.model, 'treenode_display_field')
         return force_str(getattr(obj, field, obj.pk))
 
+    def _get_depth(self, obj):
+        """Return the node depth, preloaded by the changelist if possible."""
+        depth = getattr(obj, 'tn_depth', None)
+        return obj.get_depth() if depth is None else depth
+
     def _get_treenode_field_display(self, request, obj):
         """Define how to display nodes depending on the mode."""
         display_mode = self.treenode_display_mode
@@ -239,7 +248,7 @@ not installed. Export and import functions are disabled.")
         html = (
             f'<div class="treenode-wrapper" '
             f'data-treenode-pk="{obj.pk}" '
-            f'data-treenode-depth="{obj.depth}" '
+            f'data-treenode-depth="{self._get_depth(obj)}" '
             f'data-treenode-parent="{parent}">'
             f'<span class="treenode-content">{text}</span>'
             f'</div>'
@@ -261,7 +270,7 @@ not installed. Export and import functions are disabled.")
 
     def _display_with_indentation(self, obj):
         """Display tree with indents."""
-        indent = '&mdash;' * obj.get_depth()
+        indent = '&mdash;' * self._get_depth(obj)
         display = f'<span class="treenode-indentation">{indent}</span> {obj}'
         return mark_safe(display)
 
@@ -280,9 +289,28 @@ not installed. Export and import functions are disabled.")
         """
         urls = super().get_urls()
         if self.import_export:
+            admin_view = self.admin_site.admin_view
             custom_urls = [
-                path('import/', self.import_view, name='tree_node_import'),
-                path('export/', self.export_view, name='tree_node_export'),
+                path(
+                    'import/',
+                    admin_view(self.import_view),
+                    name='tree_node_import'
+                ),
+                path(
+                    'export/',
+                    admin_view(self.export_view),
+                    name='tree_node_export'
+                ),
+                path(
+                    'jobs/<str:job_id>/',
+                    admin_view(self.job_status_view),
+                    name='tree_node_job_status'
+                ),
+                path(
+                    'jobs/<str:job_id>/download/',
+                    admin_view(self.job_download_view),
+                    name='tree_node_job_download'
+                ),
             ]
         else:
             custom_urls = []
@@ -303,6 +331,10 @@ packages are not installed."
             )
             return redirect("..")
 
+        if not (self.has_add_permission(request)
+                and self.has_change_permission(request)):
+            raise PermissionDenied
+
         if request.method == 'POST':
             if 'file' not in request.FILES:
                 return render(
@@ -322,39 +354,12 @@ packages are not installed."
                     {"errors": [f"Unsupported file format: {ext}"]}
                 )
 
-            # Import data from file
+            # Import data from file in the background
             importer = self.TreeNodeImporter(self.model, file, ext)
-            raw_data = importer.import_data()
-            clean_result = importer.finalize(raw_data)
-
-            errors = clean_result.get("errors", [])
-            created_count = len(clean_result.get("create", []))
-            updated_count = len(clean_result.get("update", []))
-
-            if errors:
-                return render(
-                    request,
-                    "admin/tree_node_import_report.html",
-                    {
-                        "errors": errors,
-                        "created_count": created_count,
-                        "updated_count": updated_count,
-                    }
-                )
-
-            # If there are no errors, redirect to the list of objects with
-            # a message
-            messages.success(
-                request,
-                f"Successfully imported {created_count} records. "
-                f"Successfully updated {updated_count} records."
+            job = get_job_runner().submit(
+                self._new_job(request, "import"), import_job, importer
             )
-
-            app_label = self.model._meta.app_label
-            model_name = self.model._meta.model_name
-            admin_changelist_url = f"admin:{app_label}_{model_name}_changelist"
-            path = resolve_url(admin_changelist_url) + "?import_done=1"
-            return redirect(path)
+            return self._render_job(request, job)
 
         # If the request is not POST, simply display the import form
         return render(request, "admin/tree_node_import.html")
@@ -363,14 +368,13 @@ packages are not installed."
         """
         Export view.
 
-        - If the GET parameters include download, we send the file directly.
         - If the format parameter is missing, we render the format selection
           page.
-        - If the format is specified, we perform a test export to catch errors.
-
-        If there are no errors, we render the success page with a message, a
-        link for manual download,
-        and a button to go to the model page.
+        - If the format is specified, we start a background export job and
+          render the progress page. When the job is done, the file is
+          downloaded from the storage.
+        - If the GET parameters include download and the job is already
+          done (synchronous runners), we redirect to the file.
         """
         if not self.import_export:
             self.message_user(
@@ -380,65 +384,116 @@ packages are not installed."
             )
             return redirect("..")
 
-        # If the download parameter is present, we give the file directly
-        if 'download' in request.GET:
-            # Get file format
-            export_format = request.GET.get('format', 'csv')
-            # Filename
-            now = force_str(datetime.now().strftime("%Y-%m-%d %H-%M"))
-            filename = self.model._meta.label + " " + now
-            # Init
-            exporter = self.TreeNodeExporter(
-                self.get_queryset(request),
-                filename=filename
-            )
-            # Export working
-            response = exporter.export(export_format)
-            logger.debug("DEBUG: File response generated.")
-            return response
+        if not self.has_view_permission(request):
+            raise PermissionDenied
 
         # If the format parameter is not passed, we show the format
         # selection page
         if 'format' not in request.GET:
             return render(request, "admin/tree_node_export.html")
 
-        # If the format is specified, we try to perform a test export
-        # (without returning the file)
-        export_format = request.GET['format']
+        export_format = request.GET.get('format', 'csv')
+        # Filename
+        now = force_str(datetime.now().strftime("%Y-%m-%d %H-%M"))
+        filename = self.model._meta.label + " " + now
+        # Init
         exporter = self.TreeNodeExporter(
-            self.model.objects.all(),
-            filename=self.model._meta.model_name
+            self.get_queryset(request),
+            filename=filename,
+            include_closure='include_closure' in request.GET
         )
-        try:
-            # Test call to check for export errors (result not used)
-            exporter.export(export_format)
-        except Exception as e:
-            logger.error("Error during test export: %s", e)
-            errors = [str(e)]
-            return render(
-                request,
-                "admin/tree_node_export.html",
-                {"errors": errors}
-            )
 
-        # Form the correct download URL. If the URL already contains
-        # parameters, add them via &download=1, otherwise via ?download=1
-        current_url = request.build_absolute_uri()
-        if "?" in current_url:
-            download_url = current_url + "&download=1"
-        else:
-            download_url = current_url + "?download=1"
+        job = get_job_runner().submit(
+            self._new_job(request, "export"),
+            export_job,
+            exporter,
+            export_format
+        )
+        # Direct download links get the file as soon as it is ready
+        if 'download' in request.GET and job.status == TreeNodeJob.DONE:
+            return redirect(self._get_job_url(job) + "download/")
+        return self._render_job(request, job)
+
+    def job_status_view(self, request, job_id):
+        """Return the import/export job state as JSON."""
+        job = self._get_job(request, job_id)
+        if job is None:
+            return JsonResponse({"error": "Job not found"}, status=404)
+
+        data = job.to_dict()
+        result = data.pop("result")
+        del data["model"], data["user_id"]
+        if job.status == TreeNodeJob.DONE and job.kind == "export":
+            data["download_url"] = request.path + "download/"
+        if job.kind == "import":
+            data["created_count"] = result.get("created_count", 0)
+            data["updated_count"] = result.get("updated_count", 0)
+            if job.status == TreeNodeJob.DONE and not job.errors and \
+                    not result.get("notified"):
+                # Shown on the changelist page after the redirect
+                messages.success(
+                    request,
+                    f"Successfully imported {data['created_count']} records. "
+                    f"Successfully updated {data['updated_count']} records."
+                )
+                job.result["notified"] = True
+                job.save()
+        return JsonResponse(data)
+
+    def job_download_view(self, request, job_id):
+        """Send the file produced by an export job."""
+        job = self._get_job(request, job_id)
+        if job is None or job.status != TreeNodeJob.DONE or \
+                job.kind != "export":
+            raise Http404("Export file not found")
+
+        name = job.result["file"]
+        if not default_storage.exists(name):
+            raise Http404("Export file not found")
+        return FileResponse(
+            default_storage.open(name, "rb"),
+            as_attachment=True,
+            filename=job.result["filename"],
+            content_type=job.result["content_type"]
+        )
+
+    def _new_job(self, request, kind):
+        """Create a job of the current user for the model."""
+        return TreeNodeJob(
+            kind, model=self.model._meta.label, user_id=request.user.pk)
 
+    def _get_job(self, request, job_id):
+        """
+        Load a job of the current user for the model.
+
+        Returns None if the job is unknown, belongs to another user or
+        model, or the user may not view the model.
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        job = TreeNodeJob.get(job_id)
+        if job is None or not job.belongs_to(self.model, request.user):
+            return None
+        return job
+
+    def _get_changelist_url(self):
+        """Return the URL of the changelist of the model."""
+        app_label = self.model._meta.app_label
+        model_name = self.model._meta.model_name
+        return resolve_url(f"admin:{app_label}_{model_name}_changelist")
+
+    def _get_job_url(self, job):
+        """Return the URL of the job state."""
+        return f"{self._get_changelist_url()}jobs/{job.id}/"
+
+    def _render_job(self, request, job):
+        """Render the page polling the job state."""
         context = {
-            "download_url": download_url,
-            "message": "Your file is ready for export. \
-The download should start automatically.",
-            "manual_download_label": "If the download does not start, \
-click this link.",
-            # Can be replaced with the desired URL to return to the model
-            "redirect_url": "../",
-            "button_text": "Return to model"
+            "job": job,
+            "status_url": self._get_job_url(job),
+            "redirect_url": self._get_changelist_url(),
+            "button_text": "Return to model",
         }
-        return render(request, "admin/export_success.html", context)
+        return render(request, "admin/tree_node_job.html", context)
 
 # The End
@@ -20,4 +20,9 @@ class TreeNodeConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "treenode"
 
+    def ready(self):
+        """Connect the slow operation logger if it is configured."""
+        from .instrumentation import connect_slow_operation_logger
+        connect_slow_operation_logger()
+
 
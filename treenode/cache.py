@@ -11,6 +11,10 @@ Features:
 - Custom cache key generation using function parameters.
 - Automatic cache eviction when memory limits are exceeded.
 - Decorator `@cached_method` for caching method results.
+- Per-model tree version (timestamp of the last change) used for HTTP
+  caching.
+- Per-tree namespaces: a change in one tree of a forest keeps the cached
+  results of the other trees.
 
 Version: 2.0.0
 Author: Timur Kady
@@ -20,13 +24,18 @@ Email: timurkady@yandex.com
 
 from django.core.cache import caches
 from django.conf import settings
+from django.db import connections, transaction
+import functools
 import threading
+import weakref
 import hashlib
 import json
 import logging
+import time
 from pympler import asizeof
 
 from .utils.base36 import to_base36
+from .instrumentation import record_cache
 
 logger = logging.getLogger(__name__)
 
@@ -123,16 +132,69 @@ class TreeNodeCache:
         """Get from cache."""
         return self.cache.get(cache_key)
 
-    def invalidate(self, label):
-        """Clear cache for a specific model only."""
-        prefix = f"{label}_"
-        keys_to_remove = [key for key in self._keys if key.startswith(prefix)]
+    def invalidate(self, label, tree_ids=None):
+        """
+        Clear cache for a specific model only.
+
+        If tree_ids is given, only the keys of these trees and the keys of
+        the model itself (not bound to a tree) are removed.
+        """
+        if tree_ids is None:
+            prefixes = (f"{label}_", f"{label}#")
+        else:
+            prefixes = (f"{label}_",) + tuple(
+                f"{label}#{tree_id}_" for tree_id in tree_ids)
+        keys_to_remove = [
+            key for key in self._keys if key.startswith(prefixes)
+        ]
         for key in keys_to_remove:
             self.cache.delete(key)
             self._total_size -= self._keys.pop(key, 0)
             if self._total_size < 0:
                 self._total_size = 0
 
+    def get_tree_version(self, label):
+        """
+        Return the tree version for a model.
+
+        The version is the timestamp of the last change of the tree. If it
+        is unknown (e.g. the cache was cleared), the current time is used.
+        """
+        key = f"treenode_version_{label}"
+        version = self.cache.get(key)
+        if version is None:
+            self.cache.add(key, time.time(), timeout=None)
+            version = self.cache.get(key)
+        return version
+
+    def update_tree_version(self, label):
+        """Set a new tree version for a model."""
+        key = f"treenode_version_{label}"
+        self.cache.set(key, time.time(), timeout=None)
+
+    def queue_tree_version_update(self, label, using):
+        """
+        Set a new tree version for a model when the transaction commits.
+
+        Only one update per model is queued in a transaction of the
+        database `using`. The queued updates are tracked per connection:
+        an update is forgotten when it runs, or when the rollback of the
+        transaction (or of its savepoint) drops it, so that the next
+        change queues it again.
+        """
+        connection = connections[using]
+        queued = getattr(connection, "treenode_version_updates", None)
+        if queued is None:
+            # Only the on_commit queue holds the updates
+            queued = weakref.WeakValueDictionary()
+            connection.treenode_version_updates = queued
+        if label in queued:
+            return
+        update = TreeVersionUpdate(self, queued, label)
+        if connection.in_atomic_block:
+            queued[label] = update
+        transaction.on_commit(update, using=using)
+
     def clear(self):
         """Full cache clearing."""
         self.cache.clear()
@@ -175,6 +237,21 @@ class TreeNodeCache:
 freed {freed_size} bytes.")
 
 
+class TreeVersionUpdate:
+    """The update of the tree version queued in a transaction."""
+
+    def __init__(self, cache, queued, label):
+        """Init."""
+        self.cache = cache
+        self.queued = queued
+        self.label = label
+
+    def __call__(self):
+        """Forget the queued update and set the new version."""
+        self.queued.pop(self.label, None)
+        self.cache.update_tree_version(self.label)
+
+
 # Create a global cache object (there is only one for the entire system)
 treenode_cache = TreeNodeCache()
 
@@ -184,6 +261,45 @@ treenode_cache = TreeNodeCache()
 # ---------------------------------------------------
 
 
+def method_cache_key(obj, func_name, args, kwargs):
+    """
+    Generate the cache key of a method decorated with cached_method.
+
+    The key of a node method (or of a class method receiving a node) is
+    put in the namespace of the node's tree: <label>#<tree_id>.
+    """
+    if isinstance(obj, type):
+        # Если obj — класс, используем его имя
+        unique_id = to_base36(id(obj))
+        label = getattr(obj._meta, 'label', obj.__name__)
+        node = args[0] if args else None
+    else:
+        unique_id = getattr(obj, "pk", id(obj))
+        label = obj._meta.label
+        node = obj
+    tree_id = getattr(node, "tn_tree_id", None)
+    if tree_id is not None:
+        label = f"{label}#{tree_id}"
+    return treenode_cache.generate_cache_key(
+        label,
+        func_name,
+        unique_id,
+        args,
+        kwargs
+    )
+
+
+def get_cached(obj, func_name, *args, **kwargs):
+    """
+    Return the cached result of a cached_method call without computing it.
+
+    The arguments must be passed the same way as in the cached call.
+    Returns None if there is no cached value.
+    """
+    cache_key = method_cache_key(obj, func_name, args, kwargs)
+    return treenode_cache.get(cache_key)
+
+
 def cached_method(func):
     """
     Decorate instance methods for caching.
@@ -198,26 +314,14 @@ def cached_method(func):
             # Tree method logic
     """
 
+    @functools.wraps(func)
     def wrapper(self, *args, **kwargs):
         # Generate a cache key.
-        if isinstance(self, type):
-            # Если self — класс, используем его имя
-            unique_id = to_base36(id(self))
-            label = getattr(self._meta, 'label', self.__name__)
-        else:
-            unique_id = getattr(self, "pk", id(self))
-            label = self._meta.label
-
-        cache_key = treenode_cache.generate_cache_key(
-            label,
-            func.__name__,
-            unique_id,
-            args,
-            kwargs
-        )
+        cache_key = method_cache_key(self, func.__name__, args, kwargs)
 
         # Retrieving from cache
         value = treenode_cache.get(cache_key)
+        record_cache(value is not None)
 
         if value is None:
             value = func(self, *args, **kwargs)
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Deferred Updates Module
+
+This module implements the deferred (write-behind) maintenance mode of
+the tree. Inside the `Model.deferred_tree_updates()` block saving a node
+only writes the node itself; the Closure table, the priorities of the
+siblings and the cache are updated at once when the block exits.
+
+Features:
+- Records the created, moved and reordered nodes of the block.
+- Rebuilds the Closure table only for the topmost affected subtrees.
+- Replays the priority changes of each group of siblings in the order of
+  the saves, so the result is the same as with immediate updates.
+- Detects cycles created by the moves and rolls the block back.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from django.db import models, transaction
+
+from .locks import lock_trees
+from .routing import db_for_write
+
+_local = threading.local()
+
+
+def _get_registry():
+    """Return the deferred updates of the current thread by model."""
+    registry = getattr(_local, "registry", None)
+    if registry is None:
+        registry = _local.registry = {}
+    return registry
+
+
+def get_deferred(model):
+    """Return the active DeferredTreeUpdates of the model or None."""
+    updates = getattr(_local, "registry", {}).get(model)
+    return updates if updates is not None and updates.active else None
+
+
+def flush_deferred(model):
+    """Apply the deferred updates of the model, if any, right now."""
+    updates = get_deferred(model)
+    if updates is not None:
+        updates.flush()
+
+
+class DeferredTreeUpdates:
+    """Tree changes recorded inside a deferred_tree_updates() block."""
+
+    def __init__(self, model, batch_size=1000):
+        """Init."""
+        self.model = model
+        self.batch_size = batch_size
+        self.using = db_for_write(model)
+        self.active = True
+        self.reset()
+
+    def reset(self):
+        """Forget the recorded changes."""
+        # pks of the created and moved nodes: their subtrees get new
+        # closure rows
+        self.nodes = set()
+        # parent pk -> list of (pk, priority, forced) in the order of the
+        # saves; priority None means the node has left the group, forced
+        # means the node is placed even if its priority is the same
+        self.events = defaultdict(list)
+        # pk -> (parent pk, priority) before the block of the changed
+        # nodes; None for the nodes created in the block
+        self.original = {}
+        self.cache_dirty = False
+
+    def add_node(self, node, is_new=False, old_parent_id=None,
+                 old_priority=None, parent_changed=False,
+                 priority_changed=False):
+        """Record a saved node."""
+        # The priorities of a group with changes are not updated in the
+        # database yet: any save in such a group is recorded and compared
+        # with the replayed priority
+        dirty = node.tn_parent_id in self.events
+        forced = is_new or parent_changed or priority_changed and not dirty
+        placed = forced or dirty
+        if is_new:
+            self.original[node.pk] = None
+        elif placed:
+            self.original.setdefault(node.pk, (old_parent_id, old_priority))
+        if is_new or parent_changed:
+            self.nodes.add(node.pk)
+        if parent_changed:
+            self.events[old_parent_id].append((node.pk, None, True))
+        if placed:
+            self.events[node.tn_parent_id].append(
+                (node.pk, node.tn_priority, forced))
+        self.cache_dirty = True
+
+    def flush(self):
+        """Apply the recorded changes."""
+        if not (self.nodes or self.events or self.cache_dirty):
+            return
+
+        self.active = False
+        try:
+            with transaction.atomic(using=self.using):
+                lock_trees(
+                    self.model,
+                    list(self.nodes) + [pk for pk in self.events if pk],
+                    roots=None in self.events,
+                    using=self.using
+                )
+                if self.nodes:
+                    roots = self.get_subtree_roots()
+                    self.model.closure_model.rebuild(
+                        roots, self.batch_size, using=self.using)
+                if self.events:
+                    self.update_priorities()
+            self.model.clear_cache()
+            self.model.closure_model.clear_cache()
+        finally:
+            self.active = True
+        self.reset()
+
+    def get_parents(self):
+        """Return {pk: parent pk} of the affected nodes and their ancestors."""
+        nodes = self.model._base_manager.using(self.using).order_by()
+        parents = {}
+        pending = list(self.nodes)
+        while pending:
+            for i in range(0, len(pending), self.batch_size):
+                parents.update(nodes.filter(
+                    pk__in=pending[i:i + self.batch_size]
+                ).values_list("pk", "tn_parent_id"))
+            pending = list({
+                parents[pk] for pk in pending
+                if pk in parents
+                and parents[pk] is not None
+                and parents[pk] not in parents
+            })
+        return parents
+
+    def get_subtree_roots(self):
+        """Return the pks of the affected nodes without affected ancestors."""
+        parents = self.get_parents()
+        # pk -> True if the node or one of its ancestors is affected
+        marked = {}
+        for pk in self.nodes:
+            path = []
+            visited = set()
+            node = pk
+            while node is not None and node in parents and node not in marked:
+                if node in visited:
+                    raise ValueError(
+                        "You cannot move a node into its own child.")
+                visited.add(node)
+                path.append(node)
+                node = parents[node]
+            flag = marked.get(node, False)
+            for node in reversed(path):
+                flag = flag or node in self.nodes
+                marked[node] = flag
+
+        return [
+            pk for pk in self.nodes
+            if pk in parents and not marked.get(parents[pk], False)
+        ]
+
+    def update_priorities(self):
+        """Renumber the changed groups of siblings."""
+        nodes = self.model._base_manager.using(self.using).order_by(
+            "tn_priority", "pk")
+        queryset = models.QuerySet(self.model, using=self.using)
+        groups = list(self.events)
+        original = defaultdict(list)
+        for pk, value in self.original.items():
+            if value is not None:
+                original[value[0]].append((pk, value[1]))
+        for i in range(0, len(groups), self.batch_size):
+            chunk = groups[i:i + self.batch_size]
+            condition = models.Q(tn_parent_id__in=[
+                parent_id for parent_id in chunk if parent_id is not None
+            ])
+            if None in chunk:
+                condition |= models.Q(tn_parent__isnull=True)
+
+            members = defaultdict(list)
+            rows = nodes.filter(condition).values_list(
+                "pk", "tn_parent_id", "tn_priority")
+            for pk, parent_id, priority in rows:
+                members[parent_id].append((pk, priority))
+
+            changed = []
+            for parent_id in chunk:
+                siblings = members[parent_id]
+                order = self.replay(
+                    siblings, original[parent_id], self.events[parent_id])
+                priorities = dict(siblings)
+                changed.extend(
+                    self.model(pk=pk, tn_priority=priority)
+                    for priority, pk in enumerate(order)
+                    if priorities[pk] != priority
+                )
+            queryset.bulk_update(
+                changed, ["tn_priority"], batch_size=self.batch_size)
+
+    @staticmethod
+    def replay(siblings, original, events):
+        """
+        Return the pks of the siblings in their new order.
+
+        :param siblings: (pk, priority) of the current members of the group.
+        :param original: (pk, priority) before the block of the changed
+        nodes that were in the group.
+        :param events: (pk, priority, forced) of the saves in the group.
+
+        The group is restored as it was before the block, then the changed
+        nodes are placed one by one, as save() would do it: a node is
+        placed if it is new, moved or its priority differs from the stored
+        one (the stored priorities keep the gaps left by the moves).
+        """
+        changed = {pk for pk, priority in original}
+        changed.update(event[0] for event in events)
+        initial = [item for item in siblings if item[0] not in changed]
+        initial.extend(original)
+        initial.sort(key=lambda item: (item[1], item[0]))
+        order = [pk for pk, priority in initial]
+        stored = dict(initial)
+        for pk, priority, forced in events:
+            if priority is None:
+                if pk in order:
+                    order.remove(pk)
+                continue
+            if not forced and stored.get(pk) == priority:
+                continue
+            if pk in order:
+                order.remove(pk)
+            order.insert(min(priority, len(order)), pk)
+            stored = {pk: index for index, pk in enumerate(order)}
+        # Only the current members of the group are renumbered
+        present = {pk for pk, priority in siblings}
+        order = [pk for pk in order if pk in present]
+        placed = set(order)
+        order.extend(pk for pk, priority in siblings if pk not in placed)
+        return order
+
+
+@contextmanager
+def deferred_tree_updates(model, batch_size=1000):
+    """
+    Defer the Closure table, priorities and cache maintenance of the model.
+
+    The block runs in a transaction; the changes are applied when it exits
+    and are rolled back together with the block on error.
+    """
+    registry = _get_registry()
+    if model in registry:
+        # Nested block: the outer one applies the changes
+        yield registry[model]
+        return
+
+    updates = DeferredTreeUpdates(model, batch_size)
+    with transaction.atomic(using=updates.using):
+        registry[model] = updates
+        try:
+            yield updates
+        finally:
+            del registry[model]
+        updates.flush()
+
+
+# The End
@@ -4,7 +4,8 @@ TreeNode Form Module.
 This module defines the TreeNodeForm class, which dynamically determines
 the TreeNode model.
 It utilizes TreeWidget and automatically excludes the current node and its
-descendants from the parent choices.
+descendants from the parent choices. Only the selected parent is rendered;
+other choices are loaded by the widget via AJAX.
 
 Functions:
 - __init__: Initializes the form and filters out invalid parent choices.
@@ -16,7 +17,9 @@ Email: timurkady@yandex.com
 """
 
 from django import forms
+from django.core.exceptions import ValidationError
 import numpy as np
+from django.db.models import Subquery
 from django.forms.models import ModelChoiceField, ModelChoiceIterator
 from django.utils.translation import gettext_lazy as _
 
@@ -28,6 +31,8 @@ class SortedModelChoiceIterator(ModelChoiceIterator):
 
     def __iter__(self):
         """Return sorted choices based on tn_order."""
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
         qs_list = list(self.queryset.all())
         # Sort objects by their tn_order using NumPy.
         tn_orders = np.array([obj.tn_order for obj in qs_list])
@@ -43,18 +48,21 @@ class SortedModelChoiceIterator(ModelChoiceIterator):
 
 
 class SortedModelChoiceField(ModelChoiceField):
-    """ModelChoiceField Class for tn_paret field."""
+    """
+    ModelChoiceField Class for tn_paret field.
+
+    Choices are not evaluated when the field is created or rendered with
+    TreeWidget (which renders the selected value only). The full sorted
+    list is built only when the choices are iterated explicitly.
+    """
 
     to_field_name = None
+    iterator = SortedModelChoiceIterator
 
     def _get_choices(self):
         if hasattr(self, '_choices'):
             return self._choices
-
-        choices = list(SortedModelChoiceIterator(self))
-        if self.empty_label is not None:
-            choices.insert(0, ("", self.empty_label))
-        return choices
+        return self.iterator(self)
 
     def _set_choices(self, value):
         self._choices = value
@@ -90,6 +98,13 @@ class TreeNodeForm(forms.ModelForm):
             self.fields["tn_parent"].empty_label = _("Root")
             queryset = model.objects.all()
 
+            # Exclude self and descendants in the database
+            if self.instance and self.instance.pk:
+                subtree = model.closure_model.objects.filter(
+                    parent_id=self.instance.pk
+                ).values("child_id")
+                queryset = queryset.exclude(pk__in=Subquery(subtree))
+
             original_field = self.fields["tn_parent"]
             self.fields["tn_parent"] = SortedModelChoiceField(
                 queryset=queryset,
@@ -99,11 +114,23 @@ class TreeNodeForm(forms.ModelForm):
                 required=False
             )
             self.fields["tn_parent"].widget.model = queryset.model
+            # The autocomplete excludes the subtree as well
+            self.fields["tn_parent"].widget.exclude_subtree = self.instance.pk
 
             # Если есть текущее значение, устанавливаем его
             if self.instance and self.instance.pk and self.instance.tn_parent:
                 self.fields["tn_parent"].initial = self.instance.tn_parent
 
+    def clean_tn_parent(self):
+        """Reject the node itself and its descendants as a parent."""
+        parent = self.cleaned_data.get("tn_parent")
+        closure_model = self._meta.model.closure_model
+        if parent and closure_model.creates_cycle(self.instance.pk, parent.pk):
+            raise ValidationError(
+                _("A node cannot be moved into itself or its descendants.")
+            )
+        return parent
+
     @classmethod
     def factory(cls, model):
         """
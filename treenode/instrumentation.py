@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Instrumentation Module
+
+This module provides hooks for measuring tree operations: the public
+TreeNodeModel methods and the Closure table maintenance.
+
+Features:
+- `tree_operation` signal sent after each instrumented call with its
+  statistics: wall time, DB queries, rows written and cache hits/misses.
+- `@instrument` decorator for model, manager and queryset methods. It does
+  nothing but a check when no receiver is connected.
+- `SlowOperationLogger`: a ready-made receiver logging the operations
+  slower than a threshold (`settings.TREENODE_SLOW_OPERATION_THRESHOLD`).
+- `collect_stats()`: a context manager collecting statistics in tests.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+import functools
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.db import connections, models
+from django.dispatch import Signal
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Sent with arguments: sender (model class), stats (OperationStats)
+tree_operation = Signal()
+
+_local = threading.local()
+
+
+class OperationStats:
+    """Statistics of a single instrumented call."""
+
+    def __init__(self, model, operation, nested=False):
+        """
+        Init.
+
+        :param model: Model class the method belongs to.
+        :param operation: Method name.
+        :param nested: True if the call was made inside another
+        instrumented call (its numbers are included in the outer one).
+        """
+        self.model = model
+        self.operation = operation
+        self.nested = nested
+        self.thread = threading.get_ident()
+        self.duration = 0.0
+        self.queries = 0
+        self.rows = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __repr__(self):
+        """Display information about a class object."""
+        return (
+            f"<OperationStats {self.model._meta.label}.{self.operation}: "
+            f"{self.duration:.4f}s, {self.queries} queries>"
+        )
+
+    def to_dict(self):
+        """Return the statistics as a dictionary."""
+        return dict(
+            model=self.model._meta.label,
+            operation=self.operation,
+            nested=self.nested,
+            duration=self.duration,
+            queries=self.queries,
+            rows=self.rows,
+            cache_hits=self.cache_hits,
+            cache_misses=self.cache_misses,
+        )
+
+
+def _get_stack():
+    """Return the stack of the calls being measured in this thread."""
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def record_cache(hit):
+    """Count a cache hit or miss in the calls being measured."""
+    for stats in getattr(_local, "stack", ()):
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+
+
+def record_rows():
+    """Count the rows of the write statements executed so far."""
+    pending = getattr(_local, "pending", None)
+    while pending:
+        cursor, stack = pending.pop()
+        rowcount = max(cursor.rowcount, 0)
+        for stats in stack:
+            stats.rows += rowcount
+
+
+class QueryObserver:
+    """Database execute wrapper counting queries and written rows."""
+
+    write_statements = ("INSERT", "UPDATE", "DELETE")
+
+    def __call__(self, execute, sql, params, many, context):
+        """Execute the query and count it."""
+        # The rowcount of INSERT ... RETURNING is known only when the
+        # returned rows are fetched, so it is read before the next query
+        record_rows()
+        result = execute(sql, params, many, context)
+        stack = _get_stack()
+        for stats in stack:
+            stats.queries += 1
+        if sql.lstrip()[:6].upper() in self.write_statements:
+            pending = getattr(_local, "pending", None)
+            if pending is None:
+                pending = _local.pending = []
+            pending.append((context["cursor"], list(stack)))
+        return result
+
+
+def instrument(func):
+    """
+    Decorate model, manager and queryset methods for instrumentation.
+
+    Put it above @cached_method to count the cache hits of the method.
+    """
+    operation = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if not tree_operation.receivers:
+            return func(self, *args, **kwargs)
+
+        if isinstance(self, type):
+            model = self
+        elif isinstance(self, (models.QuerySet, models.Manager)):
+            model = self.model
+        else:
+            model = self._meta.model
+
+        stack = _get_stack()
+        stats = OperationStats(model, operation, nested=bool(stack))
+        stack.append(stats)
+        try:
+            with ExitStack() as wrappers:
+                if not stats.nested:
+                    observer = QueryObserver()
+                    for connection in connections.all():
+                        wrappers.enter_context(
+                            connection.execute_wrapper(observer)
+                        )
+                started = time.perf_counter()
+                try:
+                    return func(self, *args, **kwargs)
+                finally:
+                    stats.duration = time.perf_counter() - started
+        finally:
+            record_rows()
+            stack.pop()
+            tree_operation.send(sender=model, stats=stats)
+
+    return wrapper
+
+
+# ---------------------------------------------------
+# Receivers
+# ---------------------------------------------------
+
+class SlowOperationLogger:
+    """Receiver logging the operations slower than the threshold."""
+
+    def __init__(self, threshold=None, logger=logger):
+        """
+        Init.
+
+        :param threshold: Threshold in seconds; by default
+        `settings.TREENODE_SLOW_OPERATION_THRESHOLD` or 0.5.
+        :param logger: Logger to write to.
+        """
+        if threshold is None:
+            threshold = getattr(
+                settings, "TREENODE_SLOW_OPERATION_THRESHOLD", None)
+        self.threshold = 0.5 if threshold is None else threshold
+        self.logger = logger
+
+    def __call__(self, sender, stats, **kwargs):
+        """Log the operation if it is slow."""
+        if stats.duration < self.threshold:
+            return
+        self.logger.warning(
+            "Slow tree operation %s.%s: %.3f s, %d queries, %d rows, "
+            "cache %d hits / %d misses",
+            sender._meta.label,
+            stats.operation,
+            stats.duration,
+            stats.queries,
+            stats.rows,
+            stats.cache_hits,
+            stats.cache_misses,
+        )
+
+
+class TreeStats:
+    """Statistics collected by collect_stats()."""
+
+    def __init__(self):
+        """Init."""
+        self.operations = []
+        self.thread = threading.get_ident()
+
+    def __call__(self, sender, stats, **kwargs):
+        """Receive the statistics of an operation of this thread."""
+        if stats.thread == self.thread:
+            self.operations.append(stats)
+
+    def __iter__(self):
+        """Iterate over the collected statistics."""
+        return iter(self.operations)
+
+    def __len__(self):
+        """Return the number of the collected calls."""
+        return len(self.operations)
+
+    def filter(self, operation=None, model=None, nested=None):
+        """Return the statistics of the matching calls."""
+        return [
+            stats for stats in self.operations
+            if (operation is None or stats.operation == operation)
+            and (model is None or stats.model is model)
+            and (nested is None or stats.nested == nested)
+        ]
+
+    @property
+    def queries(self):
+        """Total number of queries (outermost calls only)."""
+        return sum(stats.queries for stats in self.filter(nested=False))
+
+    @property
+    def duration(self):
+        """Total duration (outermost calls only)."""
+        return sum(stats.duration for stats in self.filter(nested=False))
+
+    def summary(self):
+        """Return the totals grouped by model and operation."""
+        result = defaultdict(lambda: defaultdict(int))
+        for stats in self.operations:
+            key = f"{stats.model._meta.label}.{stats.operation}"
+            totals = result[key]
+            totals["calls"] += 1
+            for name in ("duration", "queries", "rows",
+                         "cache_hits", "cache_misses"):
+                totals[name] += getattr(stats, name)
+        return {key: dict(totals) for key, totals in result.items()}
+
+
+@contextmanager
+def collect_stats():
+    """
+    Collect the statistics of the operations of the current thread.
+
+    Usage:
+        with collect_stats() as stats:
+            node.get_ancestors()
+        assert stats.queries <= 1
+    """
+    stats = TreeStats()
+    tree_operation.connect(stats, weak=False)
+    try:
+        yield stats
+    finally:
+        tree_operation.disconnect(stats)
+
+
+def connect_slow_operation_logger():
+    """Connect SlowOperationLogger if the threshold is set in settings."""
+    threshold = getattr(settings, "TREENODE_SLOW_OPERATION_THRESHOLD", None)
+    if threshold is not None:
+        tree_operation.connect(
+            SlowOperationLogger(threshold),
+            weak=False,
+            dispatch_uid="treenode_slow_operation_logger"
+        )
+
+
+# The End
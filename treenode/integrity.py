@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Integrity Module
+
+This module verifies the Closure table of a tree against its adjacency
+list and repairs the drift.
+
+Features:
+- Set-based SQL checks: missing self-links, missing rows, extra rows and
+  rows with a wrong depth, priority gaps between siblings.
+- Cycle detection on the adjacency list with NumPy (pointer jumping).
+- Tree ids of the nodes and of the rows.
+- Incremental repair: only the affected subtrees are rebuilt.
+- Checks and repair run on the write database of the model (or `using`).
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+import math
+import numpy as np
+from array import array
+from django.db import models, transaction
+from django.db.models import Count, Exists, F, Max, Min, OuterRef, Q
+
+from .routing import db_for_write
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TreeIntegrityReport:
+    """Result of a tree integrity check."""
+
+    def __init__(self, model):
+        """Init."""
+        self.model = model
+        # check name -> total number of problems
+        self.counts = {}
+        # check name -> list of samples
+        self.samples = {}
+        # pks of the nodes whose closure rows are wrong
+        self.affected = set()
+        # pks of the nodes not reachable from a root (cycles)
+        self.cycles = set()
+        # parent pks (None for roots) of the siblings with priority gaps
+        self.priority_gaps = set()
+
+    def add(self, check, count, samples):
+        """Register the result of a check."""
+        self.counts[check] = count
+        self.samples[check] = samples
+
+    @property
+    def is_valid(self):
+        """Return True if no problem was found."""
+        return not any(self.counts.values())
+
+    def to_dict(self):
+        """Return the report as a dictionary."""
+        return dict(
+            model=self.model._meta.label,
+            valid=self.is_valid,
+            counts=self.counts,
+            samples=self.samples,
+        )
+
+
+class TreeIntegrityChecker:
+    """Checker of the Closure table of a TreeNodeModel."""
+
+    checks = [
+        "missing_self_links",
+        "extra_links",
+        "missing_links",
+        "cycles",
+        "priority_gaps",
+        "tree_ids",
+    ]
+
+    def __init__(self, model, limit=20, using=None):
+        """
+        Init.
+
+        :param model: TreeNodeModel subclass.
+        :param limit: Maximum number of samples reported for each check.
+        :param using: Database alias (the write database of the model if
+        None).
+        """
+        self.model = model
+        self.closure_model = model.closure_model
+        self.limit = limit
+        self.using = using or db_for_write(model)
+        self.nodes = model._base_manager.db_manager(self.using)
+        self.closures = self.closure_model.objects.db_manager(self.using)
+
+    # ---------------------------------------------------
+    # Checks
+    # ---------------------------------------------------
+
+    def check(self, checks=None):
+        """
+        Run the checks and return a TreeIntegrityReport.
+
+        :param checks: Names of the checks to run (all of them if None).
+        """
+        report = TreeIntegrityReport(self.model)
+        for check in checks or self.checks:
+            getattr(self, f"check_{check}")(report)
+        return report
+
+    def check_missing_self_links(self, report):
+        """Find nodes without the (node, node, 0) row."""
+        self_link = self.closures.filter(
+            parent_id=OuterRef("pk"), child_id=OuterRef("pk"), depth=0)
+        queryset = self.nodes.order_by().filter(
+            ~Exists(self_link)).values_list("pk", flat=True)
+        pks = list(queryset)
+        report.affected.update(pks)
+        report.add("missing_self_links", len(pks), pks[:self.limit])
+
+    def check_extra_links(self, report):
+        """
+        Find rows that can't be derived from the adjacency list.
+
+        A row (ancestor, node, depth > 0) is valid only if the row
+        (ancestor, node's parent, depth - 1) exists. Rows with a zero depth
+        must be self-links. Rows with a wrong depth are found here too.
+        """
+        derived_from = self.closures.filter(
+            parent_id=OuterRef("parent_id"),
+            child_id=OuterRef("child__tn_parent_id"),
+            depth=OuterRef("depth") - 1,
+        )
+        queryset = self.closures.order_by().alias(
+            tn_derived=Exists(derived_from)
+        ).filter(
+            Q(depth__gt=0, tn_derived=False)
+            | Q(depth=0) & ~Q(parent_id=F("child_id"))
+        )
+        self._add_rows(report, "extra_links", queryset, "child_id")
+
+    def check_missing_links(self, report):
+        """
+        Find rows missing in the Closure table.
+
+        For every row (ancestor, node, depth) and every child of the node,
+        the row (ancestor, child, depth + 1) must exist.
+        """
+        extension = self.closures.filter(
+            parent_id=OuterRef("parent_id"),
+            child_id=OuterRef("tn_node"),
+            depth=OuterRef("depth") + 1,
+        )
+        queryset = self.closures.order_by().annotate(
+            tn_node=F("child__tn_children"),
+            tn_depth=F("depth") + 1,
+        ).filter(tn_node__isnull=False).filter(~Exists(extension))
+        self._add_rows(
+            report, "missing_links", queryset, "tn_node", "tn_depth")
+
+    def _add_rows(self, report, check, queryset, node_field,
+                  depth_field="depth"):
+        """Register the problem rows; their nodes become affected."""
+        rows = queryset.values_list("parent_id", node_field, depth_field)
+        count = 0
+        samples = []
+        for parent_id, node_id, depth in rows.iterator(chunk_size=10000):
+            count += 1
+            report.affected.add(node_id)
+            if len(samples) < self.limit:
+                samples.append((parent_id, node_id, depth))
+        report.add(check, count, samples)
+
+    def check_cycles(self, report):
+        """Find nodes that are not reachable from a root."""
+        pks, parents = self.get_adjacency()
+        unreachable = ~self.reaches_root(parents)
+        cycles = pks[unreachable].tolist()
+        report.cycles.update(cycles)
+        report.add("cycles", len(cycles), cycles[:self.limit])
+
+    def check_priority_gaps(self, report):
+        """Find groups of siblings whose priorities are not 0, 1, 2..."""
+        queryset = self.nodes.order_by().values(
+            "tn_parent_id").annotate(
+            tn_count=Count("pk"),
+            tn_low=Min("tn_priority"),
+            tn_high=Max("tn_priority"),
+            tn_distinct=Count("tn_priority", distinct=True),
+        ).filter(
+            Q(tn_low__gt=0)
+            | ~Q(tn_high=F("tn_count") - 1)
+            | ~Q(tn_distinct=F("tn_count"))
+        ).values_list("tn_parent_id", flat=True)
+        parents = list(queryset)
+        report.priority_gaps.update(parents)
+        report.add("priority_gaps", len(parents), parents[:self.limit])
+
+    def check_tree_ids(self, report):
+        """Find nodes and rows whose tree id isn't the pk of the root."""
+        nodes = self.closures.order_by().filter(
+            parent__tn_parent__isnull=True
+        ).exclude(
+            child__tn_tree_id=F("parent_id")
+        ).values_list("child_id", flat=True)
+        rows = self.closures.order_by().exclude(
+            tree_id=F("child__tn_tree_id")
+        ).values_list("child_id", flat=True).distinct()
+        pks = set(nodes.iterator(chunk_size=10000))
+        pks.update(rows.iterator(chunk_size=10000))
+        report.affected.update(pks)
+        report.add("tree_ids", len(pks), sorted(pks)[:self.limit])
+
+    # ---------------------------------------------------
+    # Adjacency arrays
+    # ---------------------------------------------------
+
+    def get_adjacency(self):
+        """
+        Load the adjacency list as NumPy arrays.
+
+        Returns (pks, parents): sorted pks and the index of the parent of
+        each node in pks (-1 for roots). Non-integer pks (e.g. UUIDs) are
+        returned as an array of objects.
+        """
+        rows = self.nodes.order_by("pk").values_list(
+            "pk", "tn_parent_id")
+        field = self.model._meta.pk
+        while field.is_relation:
+            field = field.target_field
+        if not isinstance(field, models.IntegerField):
+            return self._get_object_adjacency(rows)
+
+        pks = array("q")
+        parent_pks = array("q")
+        for pk, parent_id in rows.iterator(chunk_size=10000):
+            pks.append(pk)
+            parent_pks.append(-1 if parent_id is None else parent_id)
+        pks = np.frombuffer(pks, dtype=np.int64)
+        parent_pks = np.frombuffer(parent_pks, dtype=np.int64)
+
+        parents = np.searchsorted(pks, parent_pks)
+        parents[parent_pks < 0] = -1
+        return pks, parents
+
+    @staticmethod
+    def _get_object_adjacency(rows):
+        """Load the adjacency list of a model with non-integer pks."""
+        rows = list(rows.iterator(chunk_size=10000))
+        index = {pk: i for i, (pk, parent_id) in enumerate(rows)}
+        parents = np.fromiter(
+            (
+                -1 if parent_id is None else index.get(parent_id, -1)
+                for pk, parent_id in rows
+            ),
+            dtype=np.int64,
+            count=len(rows)
+        )
+        pks = np.empty(len(rows), dtype=object)
+        pks[:] = [pk for pk, parent_id in rows]
+        return pks, parents
+
+    @staticmethod
+    def reaches_root(parents):
+        """Return a boolean array: True if the node reaches a root."""
+        count = len(parents)
+        index = np.arange(count)
+        is_root = parents < 0
+        # Roots point to themselves; then jump to the ancestors doubling
+        # the distance at each step
+        pointer = np.where(is_root, index, parents)
+        for _ in range(max(1, math.ceil(math.log2(count + 1))) + 1):
+            pointer = pointer[pointer]
+        return is_root[pointer] if count else is_root
+
+    @staticmethod
+    def get_subtree_roots(parents, affected):
+        """Return the indexes of the topmost affected nodes."""
+        count = len(parents)
+        # Index `count` is a sentinel: the parent of the roots
+        pointer = np.append(np.where(parents < 0, count, parents), count)
+        flags = np.append(affected, False)
+        # has_affected[i]: some strict ancestor of i is affected
+        has_affected = flags[pointer]
+        for _ in range(max(1, math.ceil(math.log2(count + 1))) + 1):
+            has_affected = has_affected | has_affected[pointer]
+            pointer = pointer[pointer]
+        return np.nonzero(flags[:count] & ~has_affected[:count])[0]
+
+    # ---------------------------------------------------
+    # Repair
+    # ---------------------------------------------------
+
+    def repair(self, report=None, batch_size=1000, progress=None):
+        """
+        Repair the drift found by the check.
+
+        Only the subtrees of the affected nodes are rebuilt, and only the
+        siblings with priority gaps are renumbered. Nodes in cycles can't
+        be repaired automatically and are left untouched.
+        Returns the report of a new check.
+        """
+        with transaction.atomic(using=self.using):
+            if report is None:
+                report = self.check()
+
+            affected = report.affected - report.cycles
+            if affected:
+                pks, parents = self.get_adjacency()
+                if pks.dtype == object:
+                    mask = np.array(
+                        [pk in affected for pk in pks.tolist()], dtype=bool)
+                else:
+                    mask = np.isin(
+                        pks, np.fromiter(affected, dtype=np.int64))
+                roots = pks[self.get_subtree_roots(parents, mask)].tolist()
+                logger.info(
+                    "Rebuilding %d subtree(s) of %s",
+                    len(roots),
+                    self.model._meta.label
+                )
+                self.closure_model.rebuild(
+                    roots, batch_size, progress, using=self.using)
+
+            for parent_id in report.priority_gaps:
+                self.renumber_priorities(parent_id)
+
+            self.model.clear_cache()
+            return self.check()
+
+    def renumber_priorities(self, parent_id):
+        """Renumber the priorities of the siblings as 0, 1, 2..."""
+        siblings = list(
+            self.nodes.filter(tn_parent_id=parent_id)
+            .order_by("tn_priority", "pk").only("pk", "tn_priority")
+        )
+        for priority, node in enumerate(siblings):
+            node.tn_priority = priority
+        # Plain queryset: priorities don't affect the Closure table
+        models.QuerySet(self.model, using=self.using).bulk_update(
+            siblings, ["tn_priority"], batch_size=1000)
+        return len(siblings)
+
+    def renumber_all_priorities(self, batch_size=1000, progress=None):
+        """
+        Renumber the priorities of all the siblings as 0, 1, 2...
+
+        The nodes are read in one ordered pass and only the changed
+        priorities are written, batch_size nodes at a time.
+        Returns the number of changed nodes.
+        """
+        with transaction.atomic(using=self.using):
+            return self._renumber_all_priorities(batch_size, progress)
+
+    def _renumber_all_priorities(self, batch_size, progress):
+        """Renumber the priorities (inside the transaction)."""
+        rows = self.nodes.order_by(
+            "tn_parent_id", "tn_priority", "pk"
+        ).values_list("pk", "tn_parent_id", "tn_priority")
+        queryset = models.QuerySet(self.model, using=self.using)
+
+        changed = []
+        changed_count = 0
+        count = 0
+        parent = priority = None
+        for pk, parent_id, old_priority in rows.iterator(
+                chunk_size=batch_size):
+            if count == 0 or parent_id != parent:
+                parent = parent_id
+                priority = 0
+            if old_priority != priority:
+                changed.append(self.model(pk=pk, tn_priority=priority))
+            priority += 1
+            count += 1
+            if len(changed) >= batch_size:
+                queryset.bulk_update(changed, ["tn_priority"])
+                changed_count += len(changed)
+                changed = []
+            if progress and count % batch_size == 0:
+                progress(count)
+
+        if changed:
+            queryset.bulk_update(changed, ["tn_priority"])
+            changed_count += len(changed)
+        if progress:
+            progress(count)
+        self.model.clear_cache()
+        return changed_count
+
+
+# The End
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Jobs Module
+
+This module provides a small job subsystem used to run long import and
+export operations outside the request thread.
+
+Features:
+- `TreeNodeJob`: job state (status, progress, result) stored in the cache,
+  so it can be polled from any request; the job remembers its model and
+  the user who started it.
+- Pluggable runners: `ThreadPoolJobRunner` (default) and `SyncJobRunner`,
+  a local stand-in that executes jobs immediately (tests, debugging).
+- Runner selection through `settings.TREENODE_JOB_RUNNER`.
+- Export results are written to the default file storage and deleted
+  when their jobs expire (checked at most once an hour by the exports).
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Folder of the export files in the default storage
+EXPORTS_DIR = "treenode/exports"
+# Cache key of the throttle of the export files cleanup
+CLEANUP_KEY = "treenode_exports_cleanup"
+
+
+# ---------------------------------------------------
+# Job state
+# ---------------------------------------------------
+
+class TreeNodeJob:
+    """Import/export job state kept in the cache."""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    key_prefix = "treenode_job_"
+    timeout = 24 * 60 * 60
+
+    def __init__(self, kind, job_id=None, status=PENDING, progress=0,
+                 result=None, errors=None, model=None, user_id=None):
+        """
+        Init.
+
+        :param kind: Job kind ("import" or "export").
+        :param job_id: Job identifier; generated if omitted.
+        :param status: One of the status constants.
+        :param progress: Progress in percent.
+        :param result: Dictionary with the job result.
+        :param errors: List of error messages.
+        :param model: Label of the model the job works on.
+        :param user_id: pk of the user who started the job.
+        """
+        self.kind = kind
+        self.id = job_id or uuid.uuid4().hex
+        self.status = status
+        self.progress = progress
+        self.result = result or {}
+        self.errors = errors or []
+        self.model = model
+        self.user_id = user_id
+
+    @staticmethod
+    def get_cache():
+        """Return the cache backend used to store the jobs."""
+        cache_name = 'treenode' if 'treenode' in settings.CACHES else 'default'
+        return caches[cache_name]
+
+    @classmethod
+    def get(cls, job_id):
+        """Load the job from the cache. Return None if it is unknown."""
+        data = cls.get_cache().get(cls.key_prefix + job_id)
+        if data is None:
+            return None
+        return cls(job_id=job_id, **data)
+
+    def to_dict(self):
+        """Return job state as a dictionary."""
+        return dict(
+            kind=self.kind,
+            status=self.status,
+            progress=self.progress,
+            result=self.result,
+            errors=self.errors,
+            model=self.model,
+            user_id=self.user_id,
+        )
+
+    def save(self):
+        """Store the job in the cache."""
+        self.get_cache().set(
+            self.key_prefix + self.id,
+            self.to_dict(),
+            timeout=self.timeout
+        )
+
+    def set_progress(self, progress, status=RUNNING):
+        """Update job progress."""
+        self.progress = progress
+        self.status = status
+        self.save()
+
+    def belongs_to(self, model, user):
+        """Return True if the user started the job for the model."""
+        return self.model == model._meta.label and self.user_id == user.pk
+
+    @property
+    def is_finished(self):
+        """Return True if the job is done or failed."""
+        return self.status in (self.DONE, self.FAILED)
+
+
+# ---------------------------------------------------
+# Runners
+# ---------------------------------------------------
+
+class BaseJobRunner:
+    """Base runner class. Subclasses must implement `execute()`."""
+
+    def submit(self, job, func, *args, **kwargs):
+        """Register the job and hand it over to the runner."""
+        job.save()
+        self.execute(self.wrap(job, func), *args, **kwargs)
+        return job
+
+    def execute(self, func, *args, **kwargs):
+        """Execute a callable."""
+        raise NotImplementedError
+
+    def wrap(self, job, func):
+        """Wrap a callable with job status handling."""
+        def run(*args, **kwargs):
+            job.set_progress(0)
+            try:
+                job.result = func(job, *args, **kwargs) or {}
+                job.set_progress(100, TreeNodeJob.DONE)
+            except Exception as e:
+                logger.exception("TreeNode %s job %s failed", job.kind, job.id)
+                job.errors.append(str(e))
+                job.set_progress(job.progress, TreeNodeJob.FAILED)
+        return run
+
+
+class SyncJobRunner(BaseJobRunner):
+    """Runner executing jobs immediately in the calling thread."""
+
+    def execute(self, func, *args, **kwargs):
+        """Execute a callable."""
+        func(*args, **kwargs)
+
+
+class ThreadPoolJobRunner(BaseJobRunner):
+    """Runner executing jobs in a thread pool."""
+
+    def __init__(self, max_workers=None):
+        """Init."""
+        max_workers = max_workers or getattr(
+            settings, 'TREENODE_JOB_WORKERS', 2)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="treenode-job"
+        )
+
+    def execute(self, func, *args, **kwargs):
+        """Execute a callable."""
+        def run():
+            try:
+                func(*args, **kwargs)
+            finally:
+                # Close connections opened by the worker thread
+                connections.close_all()
+        self.executor.submit(run)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner():
+    """Return the runner configured by `settings.TREENODE_JOB_RUNNER`."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            path = getattr(
+                settings,
+                'TREENODE_JOB_RUNNER',
+                'treenode.jobs.ThreadPoolJobRunner'
+            )
+            _runner = import_string(path)()
+    return _runner
+
+
+# ---------------------------------------------------
+# Job functions
+# ---------------------------------------------------
+
+def import_job(job, importer):
+    """Run the import: parse the data and save it."""
+    raw_data = importer.import_data()
+    job.set_progress(50)
+    result = importer.finalize(raw_data)
+    job.errors.extend(result.get("errors", []))
+    return {
+        "created_count": len(result.get("create", [])),
+        "updated_count": len(result.get("update", [])),
+    }
+
+
+def cleanup_exports(max_age=None):
+    """
+    Delete the export files older than max_age seconds.
+
+    By default the files are kept as long as their jobs (TreeNodeJob
+    timeout). If the storage can't tell the age of a file, the file is
+    deleted once its job has expired. The emptied job folders are deleted
+    too. Returns the number of deleted files.
+    """
+    if max_age is None:
+        max_age = TreeNodeJob.timeout
+    limit = timezone.now() - timedelta(seconds=max_age)
+    try:
+        folders, files = default_storage.listdir(EXPORTS_DIR)
+    except (OSError, NotImplementedError):
+        return 0
+
+    count = 0
+    for job_id in folders:
+        folder = f"{EXPORTS_DIR}/{job_id}"
+        try:
+            names = default_storage.listdir(folder)[1]
+        except (OSError, NotImplementedError):
+            continue
+        deleted = 0
+        for name in names:
+            name = f"{folder}/{name}"
+            try:
+                try:
+                    expired = default_storage.get_modified_time(name) < limit
+                except NotImplementedError:
+                    expired = TreeNodeJob.get(job_id) is None
+                if expired:
+                    default_storage.delete(name)
+                    deleted += 1
+            except OSError as e:
+                logger.warning("Can't delete the export %s: %s", name, e)
+        count += deleted
+        if deleted == len(names):
+            try:
+                # Folders only exist in storages with a file system
+                default_storage.delete(folder)
+            except (OSError, NotImplementedError):
+                pass
+    return count
+
+
+def cleanup_exports_throttled():
+    """
+    Run cleanup_exports() at most once per cleanup interval.
+
+    The interval is `settings.TREENODE_EXPORT_CLEANUP_INTERVAL` seconds
+    (one hour by default); the processes sharing the job cache share it.
+    """
+    interval = getattr(settings, "TREENODE_EXPORT_CLEANUP_INTERVAL", 3600)
+    if TreeNodeJob.get_cache().add(CLEANUP_KEY, True, timeout=interval):
+        cleanup_exports()
+
+
+def export_job(job, exporter, format):
+    """Run the export and write the file to the default storage."""
+    # The files of the expired jobs are never downloaded again
+    cleanup_exports_throttled()
+    response = exporter.export(format)
+    job.set_progress(80)
+    name = f"{EXPORTS_DIR}/{job.id}/{exporter.filename}.{format}"
+    name = default_storage.save(name, ContentFile(response.content))
+    return {
+        "file": name,
+        "filename": f"{exporter.filename}.{format}",
+        "content_type": response["Content-Type"],
+    }
+
+
+# The End
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Locks Module
+
+This module serializes the concurrent structural writes of a tree
+(inserts, moves, reordering of siblings, deletes), so the Closure table
+and the priorities stay consistent when several workers change the same
+tree.
+
+Features:
+- One lock per tree (keyed by the tree id, the pk of its root) and one
+  lock for the group of roots: writes to unrelated trees run in parallel.
+- PostgreSQL: transaction-level advisory locks.
+- Other backends supporting SELECT ... FOR UPDATE: locks of the root rows.
+- SQLite: the database write lock is taken at the start of the write.
+- Disabled with `settings.TREENODE_LOCKING = False`.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+import zlib
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q
+
+# Key of the lock of the group of roots
+ROOTS = None
+
+
+def to_int32(value):
+    """Convert a lock key to a signed 32-bit integer."""
+    if value is ROOTS:
+        return -2 ** 31
+    if not isinstance(value, int):
+        value = zlib.crc32(str(value).encode("utf-8"))
+    return (value + 2 ** 31) % 2 ** 32 - 2 ** 31
+
+
+def get_tree_keys(model, pks, using):
+    """Return the pks of the roots of the trees of the nodes."""
+    if isinstance(pks, (list, tuple, set)):
+        pks = [pk for pk in pks if pk is not None]
+        if not pks:
+            return set()
+    # A queryset of pks is used as a subquery
+    keys = set(model._base_manager.using(using).filter(
+        pk__in=pks
+    ).order_by().values_list("tn_tree_id", flat=True).distinct())
+    if None not in keys:
+        return keys
+    # Tree ids are not filled in yet: find the roots in the Closure table
+    queryset = model.closure_model.objects.using(using).filter(
+        child_id__in=pks, parent__tn_parent__isnull=True
+    ).order_by().values_list("parent_id", flat=True).distinct()
+    return set(queryset)
+
+
+def lock_trees(model, pks=(), roots=False, using=None):
+    """
+    Lock the trees of the nodes until the end of the current transaction.
+
+    :param model: TreeNodeModel subclass.
+    :param pks: pks of the changed nodes and of their new parents (or
+    a queryset of pks).
+    :param roots: Also lock the group of roots (its priorities change).
+    :param using: Database alias.
+
+    Must be called inside transaction.atomic(). The roots are read again
+    after locking: if a concurrent move has attached a tree to another
+    one in the meantime, the new tree is locked too.
+    """
+    if not getattr(settings, "TREENODE_LOCKING", True):
+        return
+
+    using = using or router.db_for_write(model)
+    connection = connections[using]
+
+    if connection.vendor == "sqlite":
+        # SQLite has only the database lock: take it before the reads
+        table = connection.ops.quote_name(model._meta.db_table)
+        column = connection.ops.quote_name(model._meta.pk.column)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET {column} = {column} WHERE 1 = 0")
+        return
+
+    if connection.vendor != "postgresql" and \
+            not connection.features.has_select_for_update:
+        return
+
+    locked = set()
+    while True:
+        keys = get_tree_keys(model, pks, using)
+        if roots:
+            keys.add(ROOTS)
+        keys -= locked
+        if not keys:
+            return
+        acquire(model, connection, keys)
+        locked |= keys
+
+
+def acquire(model, connection, keys):
+    """Acquire the locks of the trees (always in the same order)."""
+    if connection.vendor == "postgresql":
+        namespace = to_int32(zlib.crc32(model._meta.label_lower.encode()))
+        with connection.cursor() as cursor:
+            for key in sorted(to_int32(key) for key in keys):
+                cursor.execute(
+                    "SELECT pg_advisory_xact_lock(%s, %s)", [namespace, key])
+        return
+
+    condition = Q(pk__in=[key for key in keys if key is not ROOTS])
+    if ROOTS in keys:
+        # No row stands for the group of roots: lock all the roots
+        condition |= Q(tn_parent__isnull=True)
+    queryset = model._base_manager.using(connection.alias).filter(condition)
+    list(queryset.select_for_update().order_by("pk").values_list("pk"))
+
+
+# The End
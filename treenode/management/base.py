@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Management Base
+
+Common base of the treenode management commands.
+
+Features:
+- Selection of the tree models by labels (all tree models by default).
+- Batch size option and progress output for the chunked processing.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from ..models import TreeNodeModel
+
+
+def get_tree_models(labels=None):
+    """Return the tree models by labels (all tree models by default)."""
+    if not labels:
+        return [
+            model for model in apps.get_models()
+            if issubclass(model, TreeNodeModel)
+        ]
+
+    result = []
+    for label in labels:
+        try:
+            model = apps.get_model(label)
+        except (LookupError, ValueError) as e:
+            raise CommandError(f"Unknown model {label}: {e}")
+        if not issubclass(model, TreeNodeModel):
+            raise CommandError(f"{label} is not a TreeNodeModel.")
+        result.append(model)
+    return result
+
+
+class TreeNodeCommand(BaseCommand):
+    """Base command processing the tree models in batches."""
+
+    def add_arguments(self, parser):
+        """Add the common arguments."""
+        parser.add_argument(
+            "models", nargs="*", metavar="app_label.Model",
+            help="Tree models to process (all tree models by default).")
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Number of nodes processed at once.")
+
+    def get_progress(self, message):
+        """
+        Return a progress callback.
+
+        The callback receives the number of processed nodes and rewrites
+        the current line, e.g. message="{count} nodes rebuilt".
+        """
+        def progress(count):
+            if self.verbosity > 0:
+                self.stdout.write(
+                    "  " + message.format(count=count), ending="\r")
+                self.stdout.flush()
+        return progress
+
+    def end_progress(self):
+        """Finish the progress line."""
+        if self.verbosity > 0:
+            self.stdout.write("")
+
+    def execute(self, *args, **options):
+        """Store the verbosity and execute the command."""
+        self.verbosity = options.get("verbosity", 1)
+        return super().execute(*args, **options)
+
+
+# The End
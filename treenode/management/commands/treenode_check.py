@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Check Command
+
+Verifies the Closure tables of the tree models against their adjacency
+lists and optionally repairs the drift.
+
+Usage:
+    python manage.py treenode_check [app_label.Model ...] [--repair]
+        [--database ALIAS]
+
+Exits with a non-zero status if problems remain, so the command can be run
+periodically (e.g. from cron).
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from django.core.management.base import CommandError
+
+from ...integrity import TreeIntegrityChecker
+from ..base import TreeNodeCommand, get_tree_models
+
+
+class Command(TreeNodeCommand):
+    """Check and repair the Closure tables."""
+
+    help = "Check the Closure tables of the tree models and repair the drift."
+
+    def add_arguments(self, parser):
+        """Add the command arguments."""
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--repair", action="store_true",
+            help="Rebuild the affected subtrees and renumber priorities.")
+        parser.add_argument(
+            "--limit", type=int, default=20,
+            help="Number of sample problems shown for each check.")
+        parser.add_argument(
+            "--database",
+            help="Database to check (the write database of each model by "
+                 "default).")
+
+    def handle(self, *args, **options):
+        """Run the checks."""
+        failed = []
+        for model in get_tree_models(options["models"]):
+            checker = TreeIntegrityChecker(
+                model, limit=options["limit"], using=options["database"])
+            report = checker.check()
+            self.print_report(report)
+
+            if options["repair"] and not report.is_valid:
+                report = checker.repair(
+                    report,
+                    batch_size=options["batch_size"],
+                    progress=self.get_progress("{count} nodes rebuilt")
+                )
+                self.end_progress()
+                self.stdout.write("After repair:")
+                self.print_report(report)
+
+            if not report.is_valid:
+                failed.append(model._meta.label)
+
+        if failed:
+            raise CommandError(
+                f"Tree integrity problems found in: {', '.join(failed)}")
+
+    def print_report(self, report):
+        """Print the report of a model."""
+        label = report.model._meta.label
+        if report.is_valid:
+            self.stdout.write(self.style.SUCCESS(f"{label}: OK"))
+            return
+
+        self.stdout.write(self.style.ERROR(f"{label}: problems found"))
+        for check, count in report.counts.items():
+            if not count:
+                continue
+            samples = ", ".join(str(s) for s in report.samples[check])
+            self.stdout.write(f"  {check}: {count} ({samples})")
+        if report.cycles:
+            self.stdout.write(
+                "  Nodes in cycles can't be repaired automatically: "
+                "fix their tn_parent first.")
+
+
+# The End
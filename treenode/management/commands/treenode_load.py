@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Load Command
+
+Restores a tree snapshot written by treenode_dump.
+
+Usage:
+    python manage.py treenode_load snapshot.jsonl.gz [--replace]
+
+The file is read line by line and the objects are inserted with plain
+bulk inserts in batches (constraint checks are deferred where the backend
+allows it), so the Closure table is not recalculated. If the snapshot has
+no Closure rows, the table is rebuilt. The result is checked at the end;
+on failure the whole load is rolled back.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from django.core import serializers
+from django.core.management.base import CommandError
+from django.db import connections, models, transaction
+
+from ...integrity import TreeIntegrityChecker
+from ...models import TreeNodeModel
+from ...routing import db_for_write
+from ..base import TreeNodeCommand
+from .treenode_dump import open_snapshot
+
+
+class Command(TreeNodeCommand):
+    """Load a tree snapshot."""
+
+    help = "Restore a tree snapshot written by treenode_dump."
+
+    def add_arguments(self, parser):
+        """Add the command arguments."""
+        parser.add_argument(
+            "path", help="Snapshot file (.jsonl or .jsonl.gz).")
+        parser.add_argument(
+            "--replace", action="store_true",
+            help="Delete the existing tree before loading.")
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Number of objects inserted at once.")
+
+    def handle(self, *args, **options):
+        """Load the snapshot."""
+        with open_snapshot(options["path"], "r") as file:
+            objects = serializers.deserialize(
+                "jsonl", file, ignorenonexistent=True)
+            first = next(iter(objects), None)
+            if first is None:
+                raise CommandError("The snapshot is empty.")
+
+            model = type(first.object)
+            if not issubclass(model, TreeNodeModel):
+                raise CommandError(
+                    f"{model._meta.label} is not a TreeNodeModel.")
+            connection = connections[db_for_write(model)]
+            # SQLite ignores the foreign keys pragma inside a transaction
+            with connection.constraint_checks_disabled(), \
+                    transaction.atomic(using=connection.alias):
+                if model._base_manager.using(connection.alias).exists():
+                    if not options["replace"]:
+                        raise CommandError(
+                            f"The {model._meta.label} tree is not empty; "
+                            "use --replace to delete it.")
+                    model.objects.delete_all(using=connection.alias)
+                count, closure_count = self.load(
+                    model, first, objects, options["batch_size"],
+                    connection.alias)
+                if not closure_count:
+                    self.stdout.write("Rebuilding the Closure table:")
+                    model.update_tree(
+                        batch_size=options["batch_size"],
+                        progress=self.get_progress("{count} nodes rebuilt"),
+                        using=connection.alias
+                    )
+                    self.end_progress()
+                else:
+                    # Snapshots made before the tree ids were kept
+                    model.closure_model.update_tree_ids(
+                        batch_size=options["batch_size"],
+                        using=connection.alias)
+                connection.check_constraints(table_names=[
+                    model._meta.db_table,
+                    model.closure_model._meta.db_table,
+                ])
+                report = TreeIntegrityChecker(
+                    model, using=connection.alias).check()
+                if not report.is_valid:
+                    raise CommandError(
+                        f"The snapshot is inconsistent: {report.counts}")
+
+        model.objects.update_auto_increment(using=connection.alias)
+        model.clear_cache()
+        model.closure_model.clear_cache()
+        self.stdout.write(self.style.SUCCESS(
+            f"{model._meta.label}: {count} nodes and {closure_count} "
+            "closure rows loaded"))
+
+    def load(self, model, first, objects, batch_size, using):
+        """Insert the objects in batches and return the counts."""
+        closure_model = model.closure_model
+        progress = self.get_progress("{count} objects loaded")
+        counts = {model: 0, closure_model: 0}
+        batch = [first]
+        for obj in objects:
+            if len(batch) >= batch_size or type(obj.object) is not type(
+                    batch[0].object):
+                self.insert(batch, counts, using)
+                progress(sum(counts.values()))
+                batch = []
+            batch.append(obj)
+        self.insert(batch, counts, using)
+        progress(sum(counts.values()))
+        self.end_progress()
+        return counts[model], counts[closure_model]
+
+    def insert(self, batch, counts, using):
+        """Insert a batch of deserialized objects of the same model."""
+        model = type(batch[0].object)
+        if model not in counts:
+            raise CommandError(
+                f"Unexpected {model._meta.label} objects in the snapshot.")
+
+        instances = [obj.object for obj in batch]
+        if model is not next(iter(counts)):
+            # Closure rows get new pks
+            for instance in instances:
+                instance.pk = None
+        # Plain QuerySets: bypass the closure synchronization
+        models.QuerySet(model, using=using).bulk_create(instances)
+        for obj in batch:
+            for name, values in (obj.m2m_data or {}).items():
+                getattr(obj.object, name).set(values)
+        counts[model] += len(instances)
+
+
+# The End
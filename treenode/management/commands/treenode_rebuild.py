@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Rebuild Command
+
+Rebuilds the Closure tables of the tree models from their adjacency lists.
+
+Usage:
+    python manage.py treenode_rebuild [app_label.Model ...] [--batch-size N]
+
+Nodes are processed level by level in batches, so the memory used doesn't
+depend on the size of the tree.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from ..base import TreeNodeCommand, get_tree_models
+
+
+class Command(TreeNodeCommand):
+    """Rebuild the Closure tables."""
+
+    help = "Rebuild the Closure tables of the tree models."
+
+    def handle(self, *args, **options):
+        """Rebuild the tables."""
+        for model in get_tree_models(options["models"]):
+            self.stdout.write(f"{model._meta.label}:")
+            count = model.update_tree(
+                batch_size=options["batch_size"],
+                progress=self.get_progress("{count} nodes rebuilt")
+            )
+            self.end_progress()
+            self.stdout.write(self.style.SUCCESS(
+                f"{model._meta.label}: {count} nodes rebuilt"))
+
+
+# The End
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Renumber Command
+
+Renumbers the priorities of the siblings as 0, 1, 2... keeping their
+order, which compacts the gaps left by deletes and moves.
+
+Usage:
+    python manage.py treenode_renumber [app_label.Model ...] [--batch-size N]
+        [--database ALIAS]
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+from ...integrity import TreeIntegrityChecker
+from ..base import TreeNodeCommand, get_tree_models
+
+
+class Command(TreeNodeCommand):
+    """Renumber the priorities of the siblings."""
+
+    help = "Renumber the priorities of the siblings as 0, 1, 2..."
+
+    def add_arguments(self, parser):
+        """Add the command arguments."""
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--database",
+            help="Database to renumber (the write database of each model by "
+                 "default).")
+
+    def handle(self, *args, **options):
+        """Renumber the priorities."""
+        for model in get_tree_models(options["models"]):
+            self.stdout.write(f"{model._meta.label}:")
+            checker = TreeIntegrityChecker(model, using=options["database"])
+            count = checker.renumber_all_priorities(
+                batch_size=options["batch_size"],
+                progress=self.get_progress("{count} nodes processed")
+            )
+            self.end_progress()
+            self.stdout.write(self.style.SUCCESS(
+                f"{model._meta.label}: {count} priorities changed"))
+
+
+# The End
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Stats Command
+
+Prints the statistics of the tree models: number of nodes, roots and
+leaves, maximum depth, nodes per level, fan-out histogram and the size of
+the Closure table.
+
+Usage:
+    python manage.py treenode_stats [app_label.Model ...] [--json]
+
+All numbers are computed with grouped queries; only the aggregated
+values are loaded into memory.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+import json
+from collections import Counter
+from django.db import connections
+from django.db.models import Count, Exists, Max, OuterRef
+
+from ..base import TreeNodeCommand, get_tree_models
+
+
+def get_bucket(fan_out):
+    """Return the histogram bucket of a fan-out: 0, 1, 2-3, 4-7..."""
+    if fan_out < 2:
+        return str(fan_out)
+    low = 2 ** (fan_out.bit_length() - 1)
+    return f"{low}-{2 * low - 1}"
+
+
+def get_table_size(model):
+    """Return the size of the table with indexes in bytes (PostgreSQL)."""
+    connection = connections[model.objects.db]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_total_relation_size(%s)", [model._meta.db_table])
+        return cursor.fetchone()[0]
+
+
+def get_tree_stats(model):
+    """Collect the statistics of a tree model."""
+    closure_model = model.closure_model
+    nodes = model._base_manager.order_by()
+    closure = closure_model.objects.order_by()
+
+    children = model._base_manager.filter(tn_parent=OuterRef("pk"))
+    leaves = nodes.filter(~Exists(children)).count()
+
+    # Rows from the roots give the level of every node
+    levels = closure.filter(parent__tn_parent__isnull=True).values(
+        "depth").annotate(count=Count("pk")).order_by("depth")
+
+    fan_outs = Counter()
+    rows = nodes.filter(tn_parent__isnull=False).values(
+        "tn_parent_id").annotate(count=Count("pk")).values_list(
+        "count", flat=True)
+    for count in rows.iterator(chunk_size=10000):
+        fan_outs[count] += 1
+
+    histogram = Counter({"0": leaves} if leaves else {})
+    for fan_out, count in fan_outs.items():
+        histogram[get_bucket(fan_out)] += count
+
+    nodes_count = nodes.count()
+    closure_count = closure.count()
+    return dict(
+        model=model._meta.label,
+        nodes=nodes_count,
+        roots=nodes.filter(tn_parent__isnull=True).count(),
+        leaves=leaves,
+        max_depth=closure.aggregate(depth=Max("depth"))["depth"] or 0,
+        max_fan_out=max(fan_outs, default=0),
+        levels={row["depth"]: row["count"] for row in levels},
+        fan_out_histogram=dict(sorted(
+            histogram.items(), key=lambda item: int(item[0].split("-")[0])
+        )),
+        closure_rows=closure_count,
+        closure_rows_per_node=(
+            round(closure_count / nodes_count, 2) if nodes_count else 0),
+        nodes_table_size=get_table_size(model),
+        closure_table_size=get_table_size(closure_model),
+    )
+
+
+class Command(TreeNodeCommand):
+    """Print the tree statistics."""
+
+    help = "Print the statistics of the tree models."
+
+    def add_arguments(self, parser):
+        """Add the command arguments."""
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--json", action="store_true",
+            help="Print the statistics as JSON.")
+
+    def handle(self, *args, **options):
+        """Print the statistics."""
+        result = [
+            get_tree_stats(model)
+            for model in get_tree_models(options["models"])
+        ]
+        if options["json"]:
+            self.stdout.write(json.dumps(result, indent=2))
+            return
+
+        for stats in result:
+            self.print_stats(stats)
+
+    def print_stats(self, stats):
+        """Print the statistics of a model."""
+        self.stdout.write(self.style.MIGRATE_HEADING(stats["model"]))
+        for name in ("nodes", "roots", "leaves", "max_depth", "max_fan_out",
+                     "closure_rows", "closure_rows_per_node"):
+            self.stdout.write(f"  {name}: {stats[name]}")
+        for name in ("nodes_table_size", "closure_table_size"):
+            if stats[name] is not None:
+                self.stdout.write(
+                    f"  {name}: {stats[name] / 2 ** 20:.1f} MB")
+
+        self.stdout.write("  nodes per level:")
+        for depth, count in stats["levels"].items():
+            self.stdout.write(f"    {depth + 1:>6}: {count}")
+        self.stdout.write("  fan-out histogram (children: nodes):")
+        for bucket, count in stats["fan_out_histogram"].items():
+            self.stdout.write(f"    {bucket:>11}: {count}")
+
+
+# The End
@@ -10,16 +10,34 @@ Features:
 - `ClosureQuerySet` and `ClosureModelManager` for managing closure records.
 - `TreeNodeQuerySet` and `TreeNodeModelManager` for adjacency model operations.
 - Optimized `bulk_create` and `bulk_update` methods with atomic transactions.
+- Set-based `delete` of many subtrees at once.
+- Deferred tree updates are applied before the bulk operations.
+- The trees changed by the bulk operations are locked.
+- The tree ids of the nodes and of the closure records are maintained.
+- Writes and their reads go to the write database of the queryset.
 
 Version: 2.0.11
 Author: Timur Kady
 Email: timurkady@yandex.com
 """
 
+import functools
 from collections import deque, defaultdict
 from django.db import models, transaction
 from django.db.models import F
-from django.db import connection
+from django.db.models.signals import pre_delete, post_delete
+from django.db import connections
+
+from .deferred import flush_deferred
+from .locks import lock_trees
+from .instrumentation import instrument
+from .routing import atomic_for_write, db_for_write
+
+
+def get_tree_ids(objs):
+    """Return the tree ids of the nodes or None if one of them is unknown."""
+    tree_ids = {getattr(obj, "tn_tree_id", None) for obj in objs}
+    return None if None in tree_ids else tree_ids
 
 
 # ----------------------------------------------------------------------------
@@ -58,17 +76,19 @@ class ClosureQuerySet(models.QuerySet):
 
         return result
 
-    @transaction.atomic
+    @instrument
+    @atomic_for_write
     def bulk_create(self, objs, batch_size=1000, *args, **kwargs):
         """Insert new nodes in bulk."""
         result = []
+        closures = self.model.objects.using(self.db)
 
         # 1. Топологическая сортировка узлов
         objs = self.sort_nodes(objs)
 
         # 1. Создаем self-ссылки для всех узлов: (node, node, 0).
         self_links = [
-            self.model(parent=obj, child=obj, depth=0)
+            self.model(parent=obj, child=obj, depth=0, tree_id=obj.tn_tree_id)
             for obj in objs
         ]
         result.extend(
@@ -99,7 +119,7 @@ class ClosureQuerySet(models.QuerySet):
             new_entries = []
             for node in top_nodes:
                 if node.tn_parent_id:
-                    parent_closures = self.model.objects.filter(
+                    parent_closures = closures.filter(
                         child_id=node.tn_parent_id
                     )
                     for ancestor in parent_closures:
@@ -107,7 +127,8 @@ class ClosureQuerySet(models.QuerySet):
                             self.model(
                                 parent=ancestor.parent,
                                 child=node,
-                                depth=ancestor.depth + 1
+                                depth=ancestor.depth + 1,
+                                tree_id=node.tn_tree_id
                             )
                         )
             if new_entries:
@@ -123,20 +144,22 @@ class ClosureQuerySet(models.QuerySet):
         else:
             current_nodes = root_nodes
 
-        # 4. Рекурсивная функция для обхода уровней.
-        def process_level(current_nodes):
+        # 4. Обход по уровням (цикл в теле метода: super() без аргументов
+        # не работает во вложенной функции).
+        while current_nodes:
             next_level = []
             new_entries = []
             for node in current_nodes:
                 # Для текущего узла получаем все записи замыкания (его предков).
-                ancestors = self.model.objects.filter(child=node)
+                ancestors = closures.filter(child=node)
                 for child in children_map.get(node.id, []):
                     for ancestor in ancestors:
                         new_entries.append(
                             self.model(
                                 parent=ancestor.parent,
                                 child=child,
-                                depth=ancestor.depth + 1
+                                depth=ancestor.depth + 1,
+                                tree_id=child.tn_tree_id
                             )
                         )
                     next_level.append(child)
@@ -146,15 +169,13 @@ class ClosureQuerySet(models.QuerySet):
                         new_entries, batch_size, *args, **kwargs
                     )
                 )
-            if next_level:
-                process_level(next_level)
-
-        process_level(current_nodes)
+            current_nodes = next_level
 
-        self.model.clear_cache()
+        self.model.clear_cache(get_tree_ids(objs))
         return result
 
-    @transaction.atomic
+    @instrument
+    @atomic_for_write
     def bulk_update(self, objs, fields=None, batch_size=1000):
         """
         Обновляет таблицу замыкания для объектов, у которых изменился tn_parent.
@@ -180,6 +201,7 @@ class ClosureQuerySet(models.QuerySet):
         """
         # 1. Топологическая сортировка узлов
         objs = self.sort_nodes(objs)
+        closures = self.model.objects.using(self.db)
 
         # 2. Построим отображение: id родителя → список детей
         children_map = defaultdict(list)
@@ -208,7 +230,7 @@ class ClosureQuerySet(models.QuerySet):
             if node.tn_parent_id:
                 # Получаем замыкание внешнего родителя из базы
                 external_ancestors = list(
-                    self.model.objects.filter(child_id=node.tn_parent_id)
+                    closures.filter(child_id=node.tn_parent_id)
                     .values('parent_id', 'depth')
                 )
                 # Для каждого найденного предка создаём запись для node с
@@ -217,14 +239,16 @@ class ClosureQuerySet(models.QuerySet):
                     self.model(
                         parent_id=entry['parent_id'],
                         child=node,
-                        depth=entry['depth'] + 1
+                        depth=entry['depth'] + 1,
+                        tree_id=node.tn_tree_id
                     )
                     for entry in external_ancestors
                 ]
             else:
                 node_closure = []
             # Добавляем self-ссылку (node → node, depth 0)
-            node_closure.append(self.model(parent=node, child=node, depth=0))
+            node_closure.append(self.model(
+                parent=node, child=node, depth=0, tree_id=node.tn_tree_id))
 
             # Сохраняем записи для текущего узла и кладем в очередь для
             # обработки его поддерева
@@ -243,24 +267,26 @@ class ClosureQuerySet(models.QuerySet):
                     self.model(
                         parent_id=entry.parent_id,
                         child=child,
-                        depth=entry.depth + 1
+                        depth=entry.depth + 1,
+                        tree_id=child.tn_tree_id
                     )
                     for entry in parent_closure
                 ]
                 # Добавляем self-ссылку для ребенка
-                child_closure.append(
-                    self.model(parent=child, child=child, depth=0)
-                )
+                child_closure.append(self.model(
+                    parent=child, child=child, depth=0,
+                    tree_id=child.tn_tree_id
+                ))
 
                 new_closure_entries.extend(child_closure)
                 queue.append((child, child_closure))
 
         # 5. Удаляем старые записи замыкания для обновляемых объектов
-        self.model.objects.filter(child_id__in=objs_ids).delete()
+        closures.filter(child_id__in=objs_ids).delete()
 
         # 6. Сохраняем новые записи пакетно
         super().bulk_create(new_closure_entries)
-        self.model.clear_cache()
+        self.model.clear_cache(get_tree_ids(objs))
 
 
 class ClosureModelManager(models.Manager):
@@ -272,12 +298,12 @@ class ClosureModelManager(models.Manager):
 
     def bulk_create(self, objs, batch_size=1000):
         """Create objects in bulk."""
-        self.model.clear_cache()
+        self.model.clear_cache(get_tree_ids(objs))
         return self.get_queryset().bulk_create(objs, batch_size=batch_size)
 
     def bulk_update(self, objs, fields=None, batch_size=1000):
         """Move nodes in ClosureModel."""
-        self.model.clear_cache()
+        self.model.clear_cache(get_tree_ids(objs))
         return self.get_queryset().bulk_update(
             objs, fields, batch_size=batch_size
         )
@@ -295,7 +321,8 @@ class TreeNodeQuerySet(models.QuerySet):
         self.closure_model = model.closure_model
         super().__init__(model, query, using, hints)
 
-    @transaction.atomic
+    @instrument
+    @atomic_for_write
     def bulk_create(self, objs, batch_size=1000, *args, **kwargs):
         """
         Bulk create.
@@ -303,33 +330,238 @@ class TreeNodeQuerySet(models.QuerySet):
         Method of bulk creation objects with updating and processing of
         the Closuse Model.
         """
-        # 1. Массовая вставка узлов в Модели Смежности
+        # 0. Отложенные изменения дерева применяются заранее
+        flush_deferred(self.model)
+        parents = {obj.tn_parent_id for obj in objs}
+        lock_trees(self.model, parents, using=self.db)
+        nodes = models.QuerySet(self.model, using=self.db)
+
+        # 1. Массовая вставка узлов в Модели Смежности: узел принадлежит
+        # дереву своего родителя
+        trees = dict(nodes.filter(
+            pk__in=[pk for pk in parents if pk is not None]
+        ).values_list("pk", "tn_tree_id"))
+        # Деревья родителей без tree id берутся из Модели Закрытия
+        unknown = [pk for pk, tree_id in trees.items() if tree_id is None]
+        trees.update(self.closure_model.get_root_pks(unknown, self.db))
+        for obj in objs:
+            obj.tn_tree_id = trees.get(obj.tn_parent_id)
         objs = super().bulk_create(objs, batch_size, *args, **kwargs)
 
+        # Корни образуют новые деревья; родители остальных узлов без дерева
+        # вставлены в этом же пакете
+        late = [obj for obj in objs if obj.tn_tree_id is None]
+        by_pk = {obj.pk: obj for obj in objs}
+        for obj in late:
+            node = obj
+            visited = set()
+            while node.tn_parent_id in by_pk and node.pk not in visited:
+                visited.add(node.pk)
+                node = by_pk[node.tn_parent_id]
+            if node.tn_parent_id is None:
+                obj.tn_tree_id = node.pk
+            else:
+                # Верхний узел пакета: дерево его внешнего родителя
+                obj.tn_tree_id = node.tn_tree_id
+        late = [obj for obj in late if obj.tn_tree_id is not None]
+        nodes.bulk_update(late, ["tn_tree_id"], batch_size=batch_size)
+
         # 2. Синхронизация Модели Закрытия
-        self.closure_model.objects.bulk_create(objs)
+        self.closure_model.objects.db_manager(self.db).bulk_create(objs)
 
         # 3. Очиска кэша и возрат результата
         self.model.clear_cache()
         return objs
 
-    @transaction.atomic
+    @instrument
+    @atomic_for_write
     def bulk_update(self, objs, fields, batch_size=1000, **kwargs):
         """Bulk update."""
+        flush_deferred(self.model)
+        if 'tn_parent' in fields:
+            lock_trees(
+                self.model,
+                [obj.pk for obj in objs] + [obj.tn_parent_id for obj in objs],
+                using=self.db
+            )
+
         # 1. Выполняем обновление Модели Смежности
         result = super().bulk_update(objs, fields, batch_size, **kwargs)
 
         # 2. Синхронизируем данные в Модели Закрытия
         if 'tn_parent' in fields:
             # Попросим ClosureModel обработать move
-            self.closure_model.objects.bulk_update(
+            self.closure_model.objects.db_manager(self.db).bulk_update(
                 objs, ["tn_parent",], batch_size
             )
+            # Перемещенные поддеревья могли попасть в другие деревья
+            trees = self.closure_model.update_tree_ids(
+                [obj.pk for obj in objs], batch_size, using=self.db)
+            for obj in objs:
+                obj.tn_tree_id = trees.get(obj.pk, obj.tn_tree_id)
 
         # 3. Очиска кэша и возрат результата
-        self.model.clear_cache()
+        self.model.clear_cache(
+            None if 'tn_parent' in fields else get_tree_ids(objs))
         return result
 
+    def in_tree(self, tree):
+        """Filter the nodes of one tree (a root node or its pk)."""
+        return self.filter(tn_tree_id=getattr(tree, "pk", tree))
+
+    def can_raw_delete(self):
+        """
+        Check if nodes can be deleted without Django's collector.
+
+        It is possible when nothing but the tree itself refers to the
+        nodes and no delete signals are connected. The rows of the
+        many-to-many tables are removed only by the collector.
+        """
+        tree_models = (self.model, self.closure_model)
+        for model in tree_models:
+            if pre_delete.has_listeners(model):
+                return False
+            if post_delete.has_listeners(model):
+                return False
+        opts = self.model._meta
+        if opts.many_to_many:
+            return False
+        for field in opts.private_fields:
+            if hasattr(field, "bulk_related_objects"):
+                return False
+        return all(
+            rel.related_model in tree_models
+            or rel.on_delete is models.DO_NOTHING
+            for rel in opts.related_objects
+        )
+
+    def can_truncate(self):
+        """
+        Check if the tree tables can be cleared with TRUNCATE.
+
+        PostgreSQL refuses to truncate a table referenced by a foreign key
+        constraint of another table, even an empty one, so the DO_NOTHING
+        relations with a database constraint require DELETE.
+        """
+        tree_models = (self.model, self.closure_model)
+        return not any(
+            rel.related_model not in tree_models
+            and getattr(rel.field, "db_constraint", False)
+            for rel in self.model._meta.related_objects
+        )
+
+    @instrument
+    def renumber_siblings(self, parent_ids, batch_size=1000):
+        """
+        Renumber the priorities of groups of siblings as 0, 1, 2...
+
+        parent_ids are the pks of the parents (None for the roots). The
+        order of the siblings is kept and only the changed priorities are
+        written. Returns the number of changed nodes.
+        """
+        queryset = models.QuerySet(self.model, using=self.db)
+        groups = list(parent_ids)
+        changed_count = 0
+        for i in range(0, len(groups), batch_size):
+            chunk = groups[i:i + batch_size]
+            condition = models.Q(tn_parent_id__in=[
+                parent_id for parent_id in chunk if parent_id is not None
+            ])
+            if None in chunk:
+                condition |= models.Q(tn_parent__isnull=True)
+            rows = queryset.filter(condition).order_by(
+                "tn_parent_id", "tn_priority", "pk"
+            ).values_list("pk", "tn_parent_id", "tn_priority")
+
+            changed = []
+            parent = priority = None
+            for pk, parent_id, old_priority in rows:
+                if priority is None or parent_id != parent:
+                    parent = parent_id
+                    priority = 0
+                if old_priority != priority:
+                    changed.append(self.model(pk=pk, tn_priority=priority))
+                priority += 1
+            queryset.bulk_update(
+                changed, ["tn_priority"], batch_size=batch_size)
+            changed_count += len(changed)
+        return changed_count
+
+    @instrument
+    @atomic_for_write
+    def delete(self, batch_size=1000):
+        """
+        Delete the nodes together with their subtrees.
+
+        All subtrees are collected with one query to the Closure Model and
+        deleted in batches, so the number of statements does not depend
+        on the number or the depth of the subtrees. The siblings of the
+        deleted nodes are renumbered.
+        """
+        if self.query.is_sliced:
+            raise TypeError("Cannot use 'limit' or 'offset' with delete().")
+        db = self.db
+        model = self.model
+        closure_model = self.closure_model
+        flush_deferred(model)
+        lock_trees(model, self.order_by().values("pk"), using=db)
+
+        # 1. Все узлы удаляемых поддеревьев одним запросом
+        roots = self.order_by().values("pk")
+        pks = list(
+            closure_model.objects.using(db)
+            .filter(parent_id__in=models.Subquery(roots))
+            .values_list("child_id", flat=True)
+            .distinct()
+        )
+        chunks = [
+            pks[i:i + batch_size] for i in range(0, len(pks), batch_size)
+        ]
+        # The groups of siblings left with gaps
+        parents = set(self.order_by().values_list("tn_parent_id", flat=True))
+
+        # 2. Если на узлы ссылаются другие модели или подключены сигналы,
+        # удаление выполняет стандартный Collector
+        if not self.can_raw_delete():
+            deleted, rows_count = 0, defaultdict(int)
+            for chunk in chunks:
+                count, rows = models.QuerySet(model, using=db).filter(
+                    pk__in=chunk).delete()
+                deleted += count
+                for label, value in rows.items():
+                    rows_count[label] += value
+            self.renumber_siblings(parents - set(pks), batch_size)
+            model.clear_cache()
+            closure_model.clear_cache()
+            return deleted, dict(rows_count)
+
+        # 3. Прямое удаление: сначала записи Модели Закрытия, затем узлы
+        closure_count = sum(
+            closure_model.objects.using(db).filter(
+                child_id__in=chunk)._raw_delete(db)
+            for chunk in chunks
+        )
+        if not connections[db].features.can_defer_constraint_checks:
+            # Ссылки tn_parent внутри удаляемых поддеревьев проверяются
+            # немедленно, поэтому сначала их обнуляем
+            for chunk in chunks:
+                models.QuerySet(model, using=db).filter(
+                    pk__in=chunk).update(tn_parent=None)
+        nodes_count = sum(
+            models.QuerySet(model, using=db).filter(
+                pk__in=chunk)._raw_delete(db)
+            for chunk in chunks
+        )
+
+        self.renumber_siblings(parents - set(pks), batch_size)
+        model.clear_cache()
+        closure_model.clear_cache()
+        rows_count = {
+            model._meta.label: nodes_count,
+            closure_model._meta.label: closure_count,
+        }
+        return nodes_count + closure_count, rows_count
+
 
 class TreeNodeModelManager(models.Manager):
     """TreeNodeModel Manager."""
@@ -343,18 +575,201 @@ class TreeNodeModelManager(models.Manager):
         custom QuerySet.
         """
         self.model.clear_cache()
-        result = self.get_queryset().bulk_create(
+        queryset = self.get_queryset()
+        result = queryset.bulk_create(
             objs, batch_size=batch_size, ignore_conflicts=ignore_conflicts
         )
-        transaction.on_commit(lambda: self.update_auto_increment())
+        transaction.on_commit(
+            functools.partial(self.update_auto_increment, queryset.db),
+            using=queryset.db
+        )
         return result
 
     def bulk_update(self, objs, fields=None, batch_size=1000):
         """Bulk Update."""
-        self.model.clear_cache()
+        self.model.clear_cache(
+            None if 'tn_parent' in (fields or ()) else get_tree_ids(objs))
         result = self.get_queryset().bulk_update(objs, fields, batch_size)
         return result
 
+    def in_tree(self, tree):
+        """Get the nodes of one tree (a root node or its pk)."""
+        return self.get_queryset().in_tree(tree)
+
+    @instrument
+    @atomic_for_write
+    def move_nodes(self, moves, batch_size=1000):
+        """
+        Move many nodes at once.
+
+        :param moves: list of (node, new_parent, position); new_parent is
+        a node, a pk or None (roots); position is the index among the new
+        siblings or None (the last one).
+
+        Cycles are checked for the whole batch with one closure query, the
+        parents and priorities are written with one bulk update, the
+        Closure table is rebuilt for the topmost moved subtrees and the
+        cache is cleared once. Returns the number of the moved nodes.
+        """
+        model = self.model
+        closure_model = model.closure_model
+        db = self._db or db_for_write(model)
+        targets = {}
+        for node, parent, position in moves:
+            pk = getattr(node, "pk", node)
+            if pk in targets:
+                raise ValueError(f"The node {pk} is moved more than once.")
+            targets[pk] = (getattr(parent, "pk", parent), position)
+        if not targets:
+            return 0
+
+        flush_deferred(model)
+        parents = {parent_id for parent_id, position in targets.values()}
+        lock_trees(
+            model,
+            list(targets) + list(parents),
+            roots=None in parents,
+            using=db
+        )
+        nodes = models.QuerySet(model, using=db).order_by()
+
+        # 1. Ближайший перемещаемый предок (или сам узел) каждого нового
+        # родителя: одним запросом к Модели Закрытия
+        nearest = {}
+        rows = closure_model.objects.using(db).filter(
+            child_id__in=parents - {None},
+            parent_id__in=list(targets)
+        ).order_by("child_id", "depth").values_list("child_id", "parent_id")
+        for child_id, parent_id in rows:
+            nearest.setdefault(child_id, parent_id)
+
+        # 2. Перемещаемый узел -> ближайший перемещаемый предок после
+        # перемещения; цикл в этом графе означает перенос узла в потомка
+        above = {
+            pk: nearest.get(parent_id)
+            for pk, (parent_id, position) in targets.items()
+        }
+        checked = set()
+        for pk in targets:
+            path = []
+            visited = set()
+            current = pk
+            while current is not None and current not in checked:
+                if current in visited:
+                    raise ValueError(
+                        "You cannot move a node into its own child.")
+                visited.add(current)
+                path.append(current)
+                current = above[current]
+            checked.update(path)
+
+        # 3. Приоритеты: один пересчет на каждую затронутую группу
+        old_parents = dict(nodes.filter(
+            pk__in=list(targets)).values_list("pk", "tn_parent_id"))
+        groups = list(parents | set(old_parents.values()))
+        members = defaultdict(list)
+        for i in range(0, len(groups), batch_size):
+            chunk = groups[i:i + batch_size]
+            condition = models.Q(tn_parent_id__in=[
+                parent_id for parent_id in chunk if parent_id is not None
+            ])
+            if None in chunk:
+                condition |= models.Q(tn_parent__isnull=True)
+            rows = nodes.filter(condition).order_by(
+                "tn_priority", "pk"
+            ).values_list("pk", "tn_parent_id", "tn_priority")
+            for pk, parent_id, priority in rows:
+                members[parent_id].append((pk, priority))
+
+        orders = {
+            parent_id: [pk for pk, priority in members[parent_id]
+                        if pk not in targets]
+            for parent_id in groups
+        }
+        for pk, (parent_id, position) in targets.items():
+            order = orders[parent_id]
+            if position is None:
+                order.append(pk)
+            else:
+                order.insert(min(position, len(order)), pk)
+
+        priorities = {
+            pk: priority
+            for group in members.values() for pk, priority in group
+        }
+        changed = [
+            model(pk=pk, tn_parent_id=parent_id, tn_priority=priority)
+            for parent_id, order in orders.items()
+            for priority, pk in enumerate(order)
+            if pk in targets or priorities[pk] != priority
+        ]
+        nodes.bulk_update(
+            changed, ["tn_parent", "tn_priority"], batch_size=batch_size)
+
+        # 4. Пересборка Модели Закрытия для верхних перемещенных поддеревьев
+        roots = [pk for pk in targets if above[pk] is None]
+        closure_model.rebuild(roots, batch_size, using=db)
+
+        placed = {obj.pk: obj for obj in changed}
+        instances = [node for node, parent, position in moves
+                     if isinstance(node, model)]
+        trees = dict(nodes.filter(
+            pk__in=[node.pk for node in instances]
+        ).values_list("pk", "tn_tree_id")) if instances else {}
+        for node in instances:
+            node.tn_parent_id = placed[node.pk].tn_parent_id
+            node.tn_priority = placed[node.pk].tn_priority
+            node.tn_tree_id = trees[node.pk]
+        model.clear_cache()
+        closure_model.clear_cache()
+        return len(targets)
+
+    @instrument
+    def delete_all(self, using=None):
+        """
+        Delete all the nodes and the whole Closure table.
+
+        If nothing outside the tree refers to the nodes, both tables are
+        cleared with raw statements instead of collecting the objects in
+        memory: TRUNCATE on PostgreSQL (unless a foreign key constraint of
+        another table refers to the nodes), DELETE otherwise. The tables
+        of the `using` database are cleared, if given.
+        """
+        model = self.model
+        closure_model = model.closure_model
+        db = using or self._db or db_for_write(model)
+        queryset = self.get_queryset().using(db)
+
+        with transaction.atomic(using=db):
+            if not queryset.can_raw_delete():
+                queryset.filter(tn_parent__isnull=True).delete()
+            else:
+                conn = connections[db]
+                qn = conn.ops.quote_name
+                node_table = qn(model._meta.db_table)
+                closure_table = qn(closure_model._meta.db_table)
+                parent_column = qn(model._meta.get_field("tn_parent").column)
+                with conn.cursor() as cursor:
+                    if conn.vendor == "postgresql" and \
+                            queryset.can_truncate():
+                        cursor.execute(
+                            f"TRUNCATE TABLE {closure_table}, {node_table};"
+                        )
+                    else:
+                        cursor.execute(f"DELETE FROM {closure_table};")
+                        if not conn.features.can_defer_constraint_checks:
+                            # Ссылки tn_parent проверяются немедленно
+                            cursor.execute(
+                                f"UPDATE {node_table} "
+                                f"SET {parent_column} = NULL;"
+                            )
+                        cursor.execute(f"DELETE FROM {node_table};")
+            transaction.on_commit(
+                functools.partial(self.update_auto_increment, db), using=db)
+
+        model.clear_cache()
+        closure_model.clear_cache()
+
     def get_queryset(self):
         """Return a QuerySet that sorts by 'tn_parent' and 'tn_priority'."""
         queryset = TreeNodeQuerySet(self.model, using=self._db)
@@ -364,24 +779,27 @@ class TreeNodeModelManager(models.Manager):
             'tn_priority'
         )
 
-    def get_auto_increment_sequence(self):
+    def get_auto_increment_sequence(self, using=None):
         """Get auto increment sequence."""
         table_name = self.model._meta.db_table
         pk_column = self.model._meta.pk.column
+        connection = connections[using or self._db or db_for_write(self.model)]
         with connection.cursor() as cursor:
             query = "SELECT pg_get_serial_sequence(%s, %s)"
             cursor.execute(query, [table_name, pk_column])
             result = cursor.fetchone()
         return result[0] if result else None
 
-    def update_auto_increment(self):
-        """Update auto increment."""
+    def update_auto_increment(self, using=None):
+        """Update auto increment (on the `using` database, if given)."""
         table_name = self.model._meta.db_table
+        connection = connections[using or self._db or db_for_write(self.model)]
         with connection.cursor() as cursor:
             db_engine = connection.vendor
 
             if db_engine == "postgresql":
-                sequence_name = self.get_auto_increment_sequence()
+                sequence_name = self.get_auto_increment_sequence(
+                    connection.alias)
                 # Получаем максимальный id из таблицы
                 cursor.execute(
                     f"SELECT COALESCE(MAX(id), 0) FROM {table_name};"
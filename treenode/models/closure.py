@@ -10,6 +10,11 @@ Features:
 - Uses a Closure Table for efficient tree operations.
 - Implements cached queries for improved performance.
 - Provides bulk operations for inserting, moving, and deleting nodes.
+- Computes depths and levels of many nodes with one grouped query.
+- Rebuilds the whole table or some subtrees in batches.
+- Keeps the tree id (pk of the root) of every row for per-tree queries.
+- Reads from the database of the node (or a replica), writes to the
+  write database.
 
 Version: 2.0.11
 Author: Timur Kady
@@ -17,10 +22,14 @@ Email: timurkady@yandex.com
 """
 
 
+import functools
+from collections import defaultdict
 from django.db import models, transaction
 
-from ..managers import ClosureModelManager
-from ..cache import cached_method, treenode_cache
+from ..managers import ClosureModelManager, get_tree_ids
+from ..cache import cached_method, get_cached, treenode_cache
+from ..instrumentation import instrument
+from ..routing import atomic_for_write, db_for_read, db_for_write, pin_primary
 
 
 class ClosureModel(models.Model):
@@ -44,6 +53,9 @@ class ClosureModel(models.Model):
 
     depth = models.PositiveIntegerField()
 
+    # pk of the root of the child's tree
+    tree_id = models.PositiveIntegerField(null=True, blank=True)
+
     objects = ClosureModelManager()
 
     class Meta:
@@ -54,6 +66,7 @@ class ClosureModel(models.Model):
         indexes = [
             models.Index(fields=["parent", "child"]),
             models.Index(fields=["parent", "child", "depth"]),
+            models.Index(fields=["tree_id", "parent", "child"]),
         ]
 
     def __str__(self):
@@ -63,78 +76,364 @@ class ClosureModel(models.Model):
     # ----------- Methods of working with tree structure ----------- #
 
     @classmethod
-    def clear_cache(cls):
-        """Clear cache for this model only."""
-        treenode_cache.invalidate(cls._meta.label)
+    def clear_cache(cls, tree_ids=None):
+        """Clear cache for this model only (or for some trees of it)."""
+        treenode_cache.invalidate(cls._meta.label, tree_ids)
+        transaction.on_commit(
+            functools.partial(pin_primary, cls), using=db_for_write(cls))
+
+    @staticmethod
+    def get_depth_options(include_self, depth, **options):
+        """Return the filter options of an ancestors/descendants lookup."""
+        options["depth__gte"] = 0 if include_self else 1
+        if depth:
+            options["depth__lte"] = depth
+        return options
 
     @classmethod
+    @instrument
     @cached_method
     def get_ancestors_pks(cls, node, include_self=True, depth=None):
         """Get the ancestors pks list."""
-        options = dict(child_id=node.pk, depth__gte=0 if include_self else 1)
-        if depth:
-            options["depth__lte"] = depth
-        queryset = cls.objects.filter(**options).order_by('depth')
+        options = cls.get_depth_options(include_self, depth, child_id=node.pk)
+        queryset = cls.objects.using(db_for_read(cls, node)).filter(
+            **options).order_by('depth')
         return list(queryset.values_list("parent_id", flat=True))
 
     @classmethod
+    @instrument
     @cached_method
     def get_descendants_pks(cls, node, include_self=False, depth=None):
         """Get a list containing all descendants."""
-        options = dict(parent_id=node.pk, depth__gte=0 if include_self else 1)
-        if depth:
-            options.update({'depth__lte': depth})
-        queryset = cls.objects.filter(**options)
+        options = cls.get_depth_options(include_self, depth, parent_id=node.pk)
+        queryset = cls.objects.using(db_for_read(cls, node)).filter(**options)
         return list(queryset.values_list("child_id", flat=True))
 
     @classmethod
+    def get_descendants_subquery(cls, node, include_self=False, depth=None):
+        """Get a lazy queryset of the descendants pks (for Subquery)."""
+        options = cls.get_depth_options(include_self, depth, parent_id=node.pk)
+        queryset = cls.objects.using(db_for_read(cls, node)).filter(**options)
+        return queryset.values("child_id")
+
+    @classmethod
+    def get_cached_descendants_pks(cls, node, include_self=False, depth=None):
+        """Get the descendants pks list only if it is already cached."""
+        return get_cached(
+            cls, "get_descendants_pks", node, include_self, depth)
+
+    @classmethod
+    @instrument
+    def get_ancestors_count(cls, node, include_self=True, depth=None):
+        """Count the ancestors with COUNT(*) on the closure table."""
+        pks = get_cached(cls, "get_ancestors_pks", node, include_self, depth)
+        if pks is not None:
+            return len(pks)
+        options = cls.get_depth_options(include_self, depth, child_id=node.pk)
+        return cls.objects.using(db_for_read(cls, node)).filter(
+            **options).count()
+
+    @classmethod
+    @instrument
+    def get_descendants_count(cls, node, include_self=False, depth=None):
+        """Count the descendants with COUNT(*) on the closure table."""
+        pks = cls.get_cached_descendants_pks(node, include_self, depth)
+        if pks is not None:
+            return len(pks)
+        options = cls.get_depth_options(include_self, depth, parent_id=node.pk)
+        return cls.objects.using(db_for_read(cls, node)).filter(
+            **options).count()
+
+    @classmethod
+    @instrument
+    def creates_cycle(cls, node_pk, parent_pk, using=None):
+        """
+        Check if attaching a node to a new parent would create a cycle.
+
+        True if the parent is the node itself or one of its descendants.
+        Runs a single EXISTS query (on the `using` database, if given).
+        """
+        if node_pk is None or parent_pk is None:
+            return False
+        queryset = cls.objects.using(using or db_for_read(cls)).filter(
+            parent_id=node_pk, child_id=parent_pk)
+        return queryset.exists()
+
+    @classmethod
+    @instrument
     @cached_method
     def get_root(cls, node):
         """Get the root node pk for the current node."""
-        queryset = cls.objects.filter(child=node).order_by('-depth')
-        return queryset.firts().parent if queryset.count() > 0 else None
+        queryset = cls.objects.using(db_for_read(cls, node)).filter(
+            child=node).order_by('-depth')
+        return queryset.first().parent if queryset.count() > 0 else None
+
+    @classmethod
+    @instrument
+    def get_root_pks(cls, pks, using=None):
+        """
+        Get the pks of the roots of many nodes from the Closure table.
+
+        Returns a dictionary {pk: root_pk}; unknown pks are omitted. Used
+        where the tree ids of the nodes are not filled in yet.
+        """
+        pks = [pk for pk in pks if pk is not None]
+        if not pks:
+            return {}
+        rows = cls.objects.using(using or db_for_read(cls)).filter(
+            child_id__in=pks, parent__tn_parent__isnull=True
+        ).values_list("child_id", "parent_id")
+        return dict(rows)
 
     @classmethod
+    @instrument
     @cached_method
     def get_depth(cls, node):
         """Get the node depth (how deep the node is in the tree)."""
-        result = cls.objects.filter(child__pk=node.pk).aggregate(
+        queryset = cls.objects.using(db_for_read(cls, node))
+        result = queryset.filter(child__pk=node.pk).aggregate(
             models.Max("depth")
         )["depth__max"]
         return result if result is not None else 0
 
     @classmethod
-    @cached_method
     def get_level(cls, node):
         """Get the node level (starting from 1)."""
-        return cls.objects.filter(child__pk=node.pk).aggregate(
-            models.Max("depth"))["depth__max"] + 1
+        # Reuse the cached depth instead of a second aggregate
+        return cls.get_depth(node) + 1
+
+    @classmethod
+    @instrument
+    def get_depths(cls, pks):
+        """
+        Get the depths of many nodes with a single grouped query.
+
+        Returns a dictionary {pk: depth}; unknown pks are omitted.
+        """
+        queryset = cls.objects.using(db_for_read(cls))
+        rows = queryset.filter(child_id__in=pks).order_by().values(
+            "child_id").annotate(max_depth=models.Max("depth")).values_list(
+            "child_id", "max_depth")
+        return dict(rows)
 
     @classmethod
-    @transaction.atomic
-    def insert_node(cls, node):
+    def get_levels(cls, pks):
+        """Get the levels of many nodes with a single grouped query."""
+        return {pk: depth + 1 for pk, depth in cls.get_depths(pks).items()}
+
+    @classmethod
+    @instrument
+    def get_priority_paths(cls, pks):
+        """
+        Get the priorities of the ancestors of many nodes with one query.
+
+        Returns a dictionary {pk: [root priority, ..., node priority]};
+        unknown pks are omitted.
+        """
+        queryset = cls.objects.using(db_for_read(cls))
+        rows = queryset.filter(child_id__in=pks).order_by(
+            "child_id", "-depth"
+        ).values_list("child_id", "parent__tn_priority")
+        paths = {}
+        for pk, priority in rows:
+            paths.setdefault(pk, []).append(priority)
+        return paths
+
+    @classmethod
+    @instrument
+    @atomic_for_write
+    def insert_node(cls, node, using=None):
         """Add a node to a Closure table."""
         # Call bulk_create passing a single object
-        cls.objects.bulk_create([node], batch_size=1000)
+        cls.objects.db_manager(using).bulk_create([node], batch_size=1000)
         # Clear cache
-        cls.clear_cache()
+        cls.clear_cache(get_tree_ids([node]))
 
     @classmethod
-    @transaction.atomic
-    def move_node(cls, nodes):
+    @instrument
+    @atomic_for_write
+    def move_node(cls, nodes, using=None):
         """Move a nodes (node and its subtree) to a new parent."""
         # Call bulk_update passing a single object
-        cls.objects.bulk_update(nodes, batch_size=1000)
+        cls.objects.db_manager(using).bulk_update(nodes, batch_size=1000)
         # Clear cache
+        cls.clear_cache(get_tree_ids(nodes))
+
+    @classmethod
+    @instrument
+    @atomic_for_write
+    def remove_node(cls, node, using=None):
+        """
+        Remove a node from the Closure table, keeping its subtree.
+
+        The paths that went through the node become one level shorter and
+        the node's own records are dropped. The children are expected to
+        be moved to the node's parent.
+        """
+        using = using or db_for_write(cls)
+        ancestors_pks = list(cls.objects.using(using).filter(
+            child_id=node.pk, depth__gte=1
+        ).values_list("parent_id", flat=True))
+        if ancestors_pks:
+            cls.objects.using(using).filter(
+                parent_id__in=ancestors_pks,
+                child__parents_set__parent_id=node.pk,
+                child__parents_set__depth__gte=1,
+            ).update(depth=models.F("depth") - 1)
+        cls.objects.using(using).filter(
+            models.Q(parent_id=node.pk) | models.Q(child_id=node.pk)
+        ).delete()
+        cls.clear_cache(get_tree_ids([node]))
+
+    @classmethod
+    @instrument
+    @atomic_for_write
+    def rebuild(cls, roots=None, batch_size=1000, progress=None, using=None):
+        """
+        Rebuild the Closure table from the adjacency list.
+
+        :param roots: pks of the subtrees to rebuild (the rows of the
+        roots' ancestors must be correct); the whole table if None.
+        :param batch_size: Number of nodes processed at once.
+        :param progress: Callable receiving the number of processed nodes.
+        :param using: Database alias (the write database of the model if
+        None).
+
+        Nodes are processed level by level in batches, so only the pks of
+        one level are kept in memory. Nodes that can't be reached from the
+        roots (e.g. in a cycle) are not processed. The tree ids of the
+        nodes and of the rows are set as well.
+        """
+        using = using or db_for_write(cls)
+        node_model = cls._meta.get_field("child").related_model
+        nodes = node_model._base_manager.using(using).order_by()
+        columns = ("pk", "tn_parent_id", "tn_tree_id")
+        if roots is None:
+            cls.objects.using(using)._raw_delete(using)
+            level = list(nodes.filter(
+                tn_parent__isnull=True).values_list(*columns))
+        else:
+            level = list(nodes.filter(pk__in=roots).values_list(*columns))
+
+        count = 0
+        while level:
+            next_level = []
+            for i in range(0, len(level), batch_size):
+                batch = level[i:i + batch_size]
+                cls._rebuild_batch(batch, roots is not None, using)
+                count += len(batch)
+                next_level.extend(nodes.filter(
+                    tn_parent_id__in=[row[0] for row in batch]
+                ).values_list(*columns))
+                if progress:
+                    progress(count)
+            level = next_level
+
         cls.clear_cache()
+        node_model.clear_cache()
+        return count
+
+    @classmethod
+    def _rebuild_batch(cls, batch, replace=True, using=None):
+        """Write the closure rows of (pk, parent_pk, tree_id) of nodes."""
+        using = using or db_for_write(cls)
+        node_model = cls._meta.get_field("child").related_model
+        closures = cls.objects.using(using)
+        pks = [pk for pk, parent_id, tree_id in batch]
+        if replace:
+            closures.filter(child_id__in=pks)._raw_delete(using)
+
+        # Rows of the parents are already correct (previous level)
+        parents_pks = {parent_id for pk, parent_id, tree_id in batch}
+        parents_pks.discard(None)
+        ancestors = defaultdict(list)
+        rows = closures.filter(child_id__in=parents_pks).order_by(
+            "depth").values_list("child_id", "parent_id", "depth")
+        for child_id, parent_id, depth in rows:
+            ancestors[child_id].append((parent_id, depth))
+
+        links = []
+        changed = []
+        for pk, parent_id, old_tree_id in batch:
+            # The deepest ancestor of the parent is the root
+            parent_ancestors = ancestors.get(parent_id, ())
+            tree_id = parent_ancestors[-1][0] if parent_ancestors else pk
+            if tree_id != old_tree_id:
+                changed.append(node_model(pk=pk, tn_tree_id=tree_id))
+            links.append(
+                cls(parent_id=pk, child_id=pk, depth=0, tree_id=tree_id))
+            links.extend(
+                cls(
+                    parent_id=ancestor_id,
+                    child_id=pk,
+                    depth=depth + 1,
+                    tree_id=tree_id
+                )
+                for ancestor_id, depth in parent_ancestors
+            )
+        # Plain querysets: the rows are already computed
+        models.QuerySet(cls, using=using).bulk_create(links, batch_size=1000)
+        models.QuerySet(node_model, using=using).bulk_update(
+            changed, ["tn_tree_id"], batch_size=1000)
+
+    @classmethod
+    @instrument
+    @atomic_for_write
+    def update_tree_ids(cls, pks=None, batch_size=1000, using=None):
+        """
+        Set the tree ids of the subtrees of the nodes from their roots.
+
+        :param pks: pks of the nodes (or a queryset of pks); all the nodes
+        if None.
+        :param using: Database alias (the write database of the model if
+        None).
+
+        Used after the changes that move subtrees to other trees. Only the
+        wrong values are read and written. Returns {pk: tree_id} of the
+        changed nodes.
+        """
+        using = using or db_for_write(cls)
+        node_model = cls._meta.get_field("child").related_model
+        closures = cls.objects.using(using)
+        scope = {}
+        if pks is not None:
+            scope["child__parents_set__parent_id__in"] = pks
+
+        # 1. Nodes: the tree id is the pk of the root ancestor
+        rows = closures.filter(
+            parent__tn_parent__isnull=True, **scope
+        ).exclude(
+            child__tn_tree_id=models.F("parent_id")
+        ).values_list("child_id", "parent_id")
+        changed = dict(rows)
+        models.QuerySet(node_model, using=using).bulk_update(
+            [
+                node_model(pk=pk, tn_tree_id=tree_id)
+                for pk, tree_id in changed.items()
+            ],
+            ["tn_tree_id"],
+            batch_size=batch_size
+        )
+
+        # 2. Closure rows: the tree id of the child
+        rows = closures.filter(**scope).exclude(
+            tree_id=models.F("child__tn_tree_id")
+        ).values_list("pk", "child__tn_tree_id")
+        models.QuerySet(cls, using=using).bulk_update(
+            [cls(pk=pk, tree_id=tree_id) for pk, tree_id in rows],
+            ["tree_id"],
+            batch_size=batch_size
+        )
+        return changed
 
     @classmethod
-    @transaction.atomic
+    @instrument
+    @atomic_for_write
     def delete_all(cls):
         """Clear the Closure Table."""
         # Clear cache
         cls.clear_cache()
-        cls.objects.all().delete()
+        cls.objects.using(db_for_write(cls)).delete()
 
     def save(self, force_insert=False, *args, **kwargs):
         """Save method."""
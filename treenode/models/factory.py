@@ -9,6 +9,9 @@ Features:
 - Ensures non-abstract, non-proxy models get a corresponding Closure Table.
 - Dynamically creates and assigns a Closure Model for each TreeNodeModel.
 - Facilitates the management of hierarchical relationships.
+- The tree ids of models with non-integer pks (e.g. UUIDs) have the type
+  of the pk; the tree ids of models with big integer pks are big
+  integers.
 
 Version: 2.0.0
 Author: Timur Kady
@@ -17,10 +20,45 @@ Email: timurkady@yandex.com
 
 
 import sys
+from django.apps import apps
+from django.conf import settings
 from django.db import models
+from django.utils.module_loading import import_string
 from .closure import ClosureModel  # Используем готовый ClosureModel
 
 
+def get_tree_id_field(pk, **options):
+    """
+    Return a tree id field of the type of the pk.
+
+    Returns None if the pk fits into the default PositiveIntegerField.
+    """
+    if pk is None or isinstance(pk, models.ForeignKey):
+        return None
+    if isinstance(pk, models.IntegerField):
+        if not isinstance(pk, models.BigIntegerField):
+            return None
+        return models.PositiveBigIntegerField(null=True, blank=True, **options)
+    name, path, args, kwargs = pk.deconstruct()
+    for key in ("primary_key", "default", "unique", "db_index", "db_column",
+                "verbose_name"):
+        kwargs.pop(key, None)
+    kwargs.update(null=True, blank=True, **options)
+    return pk.__class__(*args, **kwargs)
+
+
+def get_auto_field(module, meta):
+    """Return the pk Django will add to a model without an explicit pk."""
+    app_label = getattr(meta, "app_label", None)
+    if app_label is None:
+        app_config = apps.get_containing_app_config(module)
+    else:
+        app_config = apps.app_configs.get(app_label)
+    path = getattr(
+        app_config, "default_auto_field", settings.DEFAULT_AUTO_FIELD)
+    return import_string(path)(primary_key=True)
+
+
 class TreeFactory(models.base.ModelBase):
     """
     Metaclass for binding a model to a Closure Table.
@@ -29,6 +67,34 @@ class TreeFactory(models.base.ModelBase):
     assigns the `ClosureModel` as the closure table.
     """
 
+    def __new__(mcs, name, bases, attrs, **kwargs):
+        """Give the tree id the type of a non-integer or big pk."""
+        if "tn_tree_id" in attrs:
+            return super().__new__(mcs, name, bases, attrs, **kwargs)
+        meta = attrs.get("Meta")
+        fields = [
+            field for field in attrs.values()
+            if isinstance(field, models.Field)
+        ]
+        concrete = False
+        for base in bases:
+            base_meta = getattr(base, "_meta", None)
+            if base_meta is None:
+                continue
+            if base_meta.abstract:
+                fields.extend(base_meta.local_fields)
+            else:
+                concrete = True
+        pk = next((field for field in fields if field.primary_key), None)
+        if pk is None and not (concrete or getattr(meta, "abstract", False)
+                               or getattr(meta, "proxy", False)):
+            # The pk added by Django
+            pk = get_auto_field(attrs.get("__module__"), meta)
+        field = get_tree_id_field(pk, editable=False)
+        if field is not None:
+            attrs["tn_tree_id"] = field
+        return super().__new__(mcs, name, bases, attrs, **kwargs)
+
     def __init__(cls, name, bases, dct):
         """Class initialization.
 
@@ -63,6 +129,9 @@ class TreeFactory(models.base.ModelBase):
 
             "__module__": cls.__module__
         }
+        tree_id = get_tree_id_field(cls._meta.pk)
+        if tree_id is not None:
+            fields["tree_id"] = tree_id
         closure_model = type(closure_name, (ClosureModel,), fields)
         setattr(sys.modules[cls.__module__], closure_name, closure_model)
 
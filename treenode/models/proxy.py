@@ -12,6 +12,10 @@ Features:
   queries.
 - Provides a caching mechanism for performance optimization.
 - Includes methods for tree traversal, manipulation, and serialization.
+- Keeps the tree id (pk of the root) of every node, so the trees of a
+  forest are queried, locked and cached separately.
+- Tree lookups respect the database of the node and the routers (and can
+  go to replicas); structural writes use the write database.
 
 Version: 2.0.11
 Author: Timur Kady
@@ -21,13 +25,21 @@ Email: timurkady@yandex.com
 
 # proxy.py
 
-from django.db import models, transaction
+import functools
+from django.conf import settings
+from django.db import connections, models, transaction
 
 from .factory import TreeFactory
 from .classproperty import classproperty
 from ..utils.base36 import to_base36
-from ..managers import TreeNodeModelManager
+from ..utils.serializer import TreeNodeSerializer
+from ..managers import TreeNodeModelManager, get_tree_ids
 from ..cache import cached_method, treenode_cache
+from ..instrumentation import instrument
+from ..integrity import TreeIntegrityChecker
+from ..deferred import deferred_tree_updates, flush_deferred, get_deferred
+from ..locks import lock_trees
+from ..routing import atomic_for_write, db_for_read, db_for_write, pin_primary
 import logging
 
 logger = logging.getLogger(__name__)
@@ -56,12 +68,22 @@ class TreeNodeModel(models.Model, metaclass=TreeFactory):
 
     tn_priority = models.PositiveIntegerField(default=0)
 
+    # pk of the root of the node's tree
+    tn_tree_id = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False
+    )
+
     objects = TreeNodeModelManager()
 
     class Meta:
         """Meta Class."""
 
         abstract = True
+        indexes = [
+            models.Index(fields=["tn_tree_id", "tn_parent", "tn_priority"]),
+        ]
 
     def __str__(self):
         """Display information about a class object."""
@@ -75,9 +97,31 @@ class TreeNodeModel(models.Model, metaclass=TreeFactory):
     # ---------------------------------------------------
 
     @classmethod
-    def clear_cache(cls):
-        """Clear cache for this model only."""
-        treenode_cache.invalidate(cls._meta.label)
+    def clear_cache(cls, tree_ids=None):
+        """
+        Clear cache for this model only.
+
+        If tree_ids is given, only the cache of these trees (and the cache
+        of the model not bound to a tree) is cleared.
+        """
+        updates = get_deferred(cls)
+        if updates is not None:
+            # Cleared once when the deferred block exits
+            updates.cache_dirty = True
+            return
+        label = cls._meta.label
+        using = db_for_write(cls)
+        treenode_cache.invalidate(label, tree_ids)
+        # The replicas lag behind the commit, not behind the change
+        transaction.on_commit(
+            functools.partial(pin_primary, cls), using=using)
+        # The new version must be visible only with the new data
+        treenode_cache.queue_tree_version_update(label, using)
+
+    @classmethod
+    def get_tree_version(cls):
+        """Get the tree version (timestamp of the last change)."""
+        return treenode_cache.get_tree_version(cls._meta.label)
 
     @classmethod
     def get_closure_model(cls):
@@ -85,6 +129,7 @@ class TreeNodeModel(models.Model, metaclass=TreeFactory):
         return cls.closure_model
 
     @classmethod
+    @instrument
     def get_roots(cls):
         """Get a list with all root nodes."""
         qs = cls.get_roots_queryset()
@@ -94,56 +139,113 @@ class TreeNodeModel(models.Model, metaclass=TreeFactory):
     @cached_method
     def get_roots_queryset(cls):
         """Get root nodes queryset with preloaded children."""
-        qs = cls.objects.filter(tn_parent=None).prefetch_related('tn_children')
+        qs = cls.objects.using(db_for_read(cls)).filter(
+            tn_parent=None).prefetch_related('tn_children')
         return qs
 
     @classmethod
-    def get_tree(cls, instance=None):
-        """Get an n-dimensional dict representing the model tree."""
-        objs_list = [instance] if instance else cls.get_roots()
-        return [item._object2dict(item, []) for item in objs_list]
+    @instrument
+    def get_tree(cls, instance=None, max_depth=None, fields=None):
+        """
+        Get an n-dimensional dict representing the model tree.
+
+        The whole tree (or the subtree of instance) is read with a single
+        query. Use get_tree_serializer() to stream large trees.
+        """
+        serializer = cls.get_tree_serializer(instance, max_depth, fields)
+        return serializer.serialize()
+
+    @classmethod
+    def get_tree_serializer(cls, instance=None, max_depth=None, fields=None):
+        """Get the serializer of the model tree (or a subtree)."""
+        return TreeNodeSerializer(cls, instance, max_depth, fields)
 
     @classmethod
+    @instrument
     @cached_method
-    def get_tree_display(cls):
-        """Get a multiline string representing the model tree."""
-        objs = list(cls.objects.all())
-        return '\n'.join(['%s' % (obj,) for obj in objs])
+    def get_tree_display(cls, max_depth=None):
+        """
+        Get a multiline string representing the model tree.
+
+        Nodes are listed in pre-order and indented by their depth.
+        """
+        serializer = cls.get_tree_serializer(max_depth=max_depth)
+        return serializer.to_display()
+
+    @classmethod
+    @instrument
+    @atomic_for_write
+    def update_tree(cls, batch_size=1000, progress=None, using=None):
+        """
+        Rebuilds the closure table.
+
+        Nodes are processed level by level in batches of batch_size;
+        progress receives the number of processed nodes. The table of the
+        `using` database is rebuilt, if given.
+        """
+        return cls.closure_model.rebuild(
+            batch_size=batch_size, progress=progress, using=using)
 
     @classmethod
-    @transaction.atomic
-    def update_tree(cls):
-        """Rebuilds the closure table."""
-        # Clear cache
-        cls.closure_model.delete_all()
-        objs = list(cls.objects.all())
-        cls.closure_model.objects.bulk_create(objs, batch_size=1000)
-        cls.clear_cache()
+    def deferred_tree_updates(cls, batch_size=1000):
+        """
+        Defer the tree maintenance for a burst of writes.
+
+        Usage:
+            with Category.deferred_tree_updates():
+                for name in names:
+                    Category.objects.create(name=name, tn_parent=parent)
+
+        Inside the block save() writes only the node; the Closure table,
+        the priorities of the siblings and the cache are updated in one
+        batch when the block exits. Tree queries inside the block see the
+        tree as it was before the block.
+        """
+        return deferred_tree_updates(cls, batch_size)
+
+    @classmethod
+    def check_tree(cls, repair=False):
+        """
+        Check the Closure table against the adjacency list.
+
+        If repair is True, only the affected subtrees are rebuilt.
+        Returns a TreeIntegrityReport.
+        """
+        checker = TreeIntegrityChecker(cls)
+        report = checker.check()
+        if repair and not report.is_valid:
+            report = checker.repair(report)
+        return report
 
     @classmethod
+    @instrument
     def delete_tree(cls):
         """Delete the whole tree for the current node class."""
-        cls.clear_cache()
-        cls.objects.all().delete()
-        cls.closure_model.delete_all()
+        cls.objects.delete_all()
 
     # Ancestors -------------------
 
     def get_ancestors_queryset(self, include_self=True, depth=None):
         """Get the ancestors queryset (ordered from parent to root)."""
         ancestors_pks = self.get_ancestors_pks(include_self, depth)
-        result = self._meta.model.objects.filter(pk__in=ancestors_pks)
+        model = self._meta.model
+        result = model.objects.using(db_for_read(model, self)).filter(
+            pk__in=ancestors_pks)
         return result
 
+    @instrument
     def get_ancestors(self, include_self=True, depth=None):
         """Get a list with all ancestors (ordered from root to self/parent)."""
         queryset = self.get_ancestors_queryset(include_self, depth)
         return list(queryset.iterator())
 
+    @instrument
     def get_ancestors_count(self, include_self=True, depth=None):
         """Get the ancestors count."""
-        return self.get_ancestors_queryset(include_self, depth).count()
+        closure_model = self.closure_model
+        return closure_model.get_ancestors_count(self, include_self, depth)
 
+    @instrument
     def get_ancestors_pks(self, include_self=True, depth=None):
         """Get the ancestors pks list."""
         pks = self.closure_model.get_ancestors_pks(self, include_self, depth)
@@ -151,19 +253,41 @@ class TreeNodeModel(models.Model, metaclass=TreeFactory):
 
     # Children --------------------
 
+    @classmethod
+    @instrument
+    def get_children_counts(cls, pks):
+        """
+        Get the children count for many nodes at once.
+
+        Returns a dict {pk: count} built with a single GROUP BY query;
+        nodes without children are included with a count of 0.
+        """
+        counts = dict.fromkeys(pks, 0)
+        queryset = cls.objects.using(db_for_read(cls)).filter(
+            tn_parent_id__in=pks).order_by()
+        rows = queryset.values("tn_parent_id").annotate(
+            count=models.Count("pk")
+        ).values_list("tn_parent_id", "count")
+        counts.update(rows)
+        return counts
+
     @cached_method
     def get_children_queryset(self):
         """Get the children queryset with prefetch."""
-        return self.tn_children.prefetch_related('tn_children')
+        queryset = self.tn_children.using(db_for_read(self._meta.model, self))
+        return queryset.prefetch_related('tn_children')
 
+    @instrument
     def get_children(self):
         """Get a list containing all children."""
         return list(self.get_children_queryset().iterator())
 
+    @instrument
     def get_children_count(self):
         """Get the children count."""
         return self.get_children_queryset().count()
 
+    @instrument
     def get_children_pks(self):
         """Get the children pks list."""
         return [ch.pk for ch in self.get_children_queryset().only('pk')]
@@ -171,20 +295,52 @@ class TreeNodeModel(models.Model, metaclass=TreeFactory):
     # Descendants -----------------
 
     def get_descendants_queryset(self, include_self=False, depth=None):
-        """Get the descendants queryset."""
-        descendants_pks = self.get_descendants_pks(include_self, depth)
-        result = self._meta.model.objects.filter(pk__in=descendants_pks)
-        return result
+        """
+        Get the descendants queryset.
 
+        The closure table is queried as a subquery, so the descendants pks
+        are never loaded into Python. A small pks list that is already
+        cached is used directly instead.
+        """
+        model = self._meta.model
+        queryset = model.objects.using(db_for_read(model, self))
+        closure_model = self.closure_model
+        pks = closure_model.get_cached_descendants_pks(
+            self, include_self, depth)
+        limit = getattr(settings, 'TREENODE_PK_LIST_LIMIT', 1000)
+        if pks is not None and len(pks) <= limit:
+            return queryset.filter(pk__in=pks)
+        subquery = closure_model.get_descendants_subquery(
+            self, include_self, depth)
+        return queryset.filter(pk__in=models.Subquery(subquery))
+
+    @instrument
     def get_descendants(self, include_self=False, depth=None):
         """Get a list containing all descendants."""
         queryset = self.get_descendants_queryset(include_self, depth).iterator()
         return list(queryset)
 
+    @instrument
     def get_descendants_count(self, include_self=False, depth=None):
         """Get the descendants count."""
-        return self.get_descendants_queryset(include_self, depth).count()
+        closure_model = self.closure_model
+        return closure_model.get_descendants_count(self, include_self, depth)
+
+    @instrument
+    def get_descendants_tree(self, depth=None):
+        """Get a n-dimensional dict representing the subtree of the node."""
+        serializer = self.get_tree_serializer(self, max_depth=depth)
+        trees = serializer.serialize()
+        return trees[0].get('children', []) if trees else []
 
+    @instrument
+    @cached_method
+    def get_descendants_tree_display(self, include_self=False, depth=None):
+        """Get a multiline string representing the subtree of the node."""
+        serializer = self.get_tree_serializer(self, max_depth=depth)
+        return serializer.to_display(include_root=include_self)
+
+    @instrument
     def get_descendants_pks(self, include_self=False, depth=None):
         """Get the descendants pks list."""
         pks = self.closure_model.get_descendants_pks(self, include_self, depth)
@@ -195,26 +351,33 @@ class TreeNodeModel(models.Model, metaclass=TreeFactory):
     @cached_method
     def get_siblings_queryset(self):
         """Get the siblings queryset with prefetch."""
-        if self.tn_parent:
-            qs = self.tn_parent.tn_children.prefetch_related('tn_children')
+        model = self._meta.model
+        queryset = model.objects.using(db_for_read(model, self))
+        if self.tn_parent_id:
+            qs = queryset.filter(tn_parent_id=self.tn_parent_id)
+            qs = qs.prefetch_related('tn_children')
         else:
-            qs = self._meta.model.objects.filter(tn_parent__isnull=True)
+            qs = queryset.filter(tn_parent__isnull=True)
         return qs.exclude(pk=self.pk)
 
+    @instrument
     def get_siblings(self):
         """Get a list with all the siblings."""
         return list(self.get_siblings_queryset())
 
+    @instrument
     def get_siblings_count(self):
         """Get the siblings count."""
         return self.get_siblings_queryset().count()
 
+    @instrument
     def get_siblings_pks(self):
         """Get the siblings pks list."""
         return [item.pk for item in self.get_siblings_queryset()]
 
     # -----------------------------
 
+    @instrument
     def get_breadcrumbs(self, attr='pk'):
         """Get the breadcrumbs to current node (self, included)."""
         queryset = self.get_ancestors_queryset(include_self=True)
@@ -226,14 +389,23 @@ class TreeNodeModel(models.Model, metaclass=TreeFactory):
         ]
         return breadcrumbs
 
+    @instrument
     def get_depth(self):
         """Get the node depth (self, how many levels of descendants)."""
         return self.closure_model.get_depth(self)
 
+    @classmethod
+    @instrument
+    def get_depths(cls, pks):
+        """Get the depths of many nodes as a dictionary {pk: depth}."""
+        return cls.closure_model.get_depths(pks)
+
+    @instrument
     def get_first_child(self):
         """Get the first child node."""
         return self.get_children_queryset().first()
 
+    @instrument
     @cached_method
     def get_index(self):
         """Get the node index (self, index in node.parent.children list)."""
@@ -242,20 +414,40 @@ class TreeNodeModel(models.Model, metaclass=TreeFactory):
         source = list(self.tn_parent.tn_children.all())
         return source.index(self) if self in source else self.tn_priority
 
+    @instrument
     def get_order(self):
         """Return the materialized path."""
         path = self.get_breadcrumbs(attr='tn_priority')
         segments = [to_base36(i).rjust(6, '0') for i in path]
         return ''.join(segments)
 
+    @classmethod
+    @instrument
+    def get_orders(cls, pks):
+        """Get the materialized paths of many nodes as {pk: order}."""
+        paths = cls.closure_model.get_priority_paths(pks)
+        return {
+            pk: ''.join(to_base36(i).rjust(6, '0') for i in path)
+            for pk, path in paths.items()
+        }
+
+    @instrument
     def get_last_child(self):
         """Get the last child node."""
         return self.get_children_queryset().last()
 
+    @instrument
     def get_level(self):
         """Get the node level (self, starting from 1)."""
         return self.closure_model.get_level(self)
 
+    @classmethod
+    @instrument
+    def get_levels(cls, pks):
+        """Get the levels of many nodes as a dictionary {pk: level}."""
+        return cls.closure_model.get_levels(pks)
+
+    @instrument
     def get_path(self, prefix='', suffix='', delimiter='.', format_str=''):
         """Return Materialized Path of node."""
         priorities = self.get_breadcrumbs(attr='tn_priority')
@@ -278,7 +470,7 @@ class TreeNodeModel(models.Model, metaclass=TreeFactory):
 
     def set_parent(self, parent_obj):
         """Set the parent node."""
-        self._meta.model.clear_cache()
+        self._meta.model.clear_cache(get_tree_ids([self]))
         self.tn_parent = parent_obj
         self.save()
 
@@ -293,16 +485,24 @@ class TreeNodeModel(models.Model, metaclass=TreeFactory):
 
     def set_priority(self, priority=0):
         """Set the node priority."""
-        self._meta.model.clear_cache()
+        self._meta.model.clear_cache(get_tree_ids([self]))
         self.tn_priority = priority
         self.save()
 
+    @instrument
     def get_root(self):
         """Get the root node for the current node."""
-        return self.closure_model.get_root(self)
+        if self.tn_tree_id is None:
+            return self.closure_model.get_root(self)
+        model = self._meta.model
+        queryset = model.objects.using(db_for_read(model, self))
+        return queryset.filter(pk=self.tn_tree_id).first()
 
+    @instrument
     def get_root_pk(self):
         """Get the root node pk for the current node."""
+        if self.tn_tree_id is not None:
+            return self.tn_tree_id
         root = self.get_root()
         return root.pk if root else None
 
@@ -351,77 +551,320 @@ class TreeNodeModel(models.Model, metaclass=TreeFactory):
             return True
         return (self.tn_parent == target_obj.tn_parent)
 
-    def delete(self, cascade=True):
-        """Delete node."""
+    @instrument
+    @atomic_for_write
+    def copy_to(self, target=None, position=None, field_overrides=None,
+                batch_size=1000):
+        """
+        Copy the node with its subtree under the target node.
+
+        :param target: New parent of the copy (a node, a pk or None for
+        a root).
+        :param position: Index of the copy among its new siblings; None
+        puts it last.
+        :param field_overrides: Dictionary of field values of the copies;
+        a callable value receives the source node.
+
+        The subtree is read with one query and inserted level by level with
+        bulk_create(); the closure rows of the copies are derived from the
+        rows of the source subtree. Many-to-many relations are not copied.
+        Returns the copy of the node.
+        """
         model = self._meta.model
-
-        if not cascade:
-            # Get a list of children
-            children = self.get_children()
-            # Move them to one level up
-            for child in children:
-                child.tn_parent = self.tn_parent
-            # Udate both models in bulk
-            model.objects.bulk_update(
-                children,
-                ("tn_parent",),
-                batch_size=1000
+        closure_model = self.closure_model
+        target_pk = getattr(target, "pk", target)
+        field_overrides = field_overrides or {}
+        db = db_for_write(model, self)
+
+        flush_deferred(model)
+        lock_trees(
+            model, [self.pk, target_pk], roots=target_pk is None, using=db)
+
+        # --- 1. Source subtree (the parents before the children) -------------
+        sources = model._base_manager.using(db).filter(
+            parents_set__parent_id=self.pk
+        ).annotate(
+            tn_depth=models.F("parents_set__depth")
+        ).order_by("tn_depth", "tn_priority", "pk")
+
+        # The deepest ancestor of the target is the root of the copy's tree
+        ancestors = []
+        if target_pk is not None:
+            ancestors = list(closure_model.objects.using(db).filter(
+                child_id=target_pk
+            ).order_by("depth").values_list("parent_id", "depth"))
+        tree_id = ancestors[-1][0] if ancestors else None
+
+        # --- 2. Copies, inserted level by level ------------------------------
+        fields = [
+            field for field in model._meta.concrete_fields
+            if not field.primary_key and field.attname not in (
+                "tn_parent_id", "tn_priority", "tn_tree_id")
+        ]
+        siblings = list(model._base_manager.using(db).filter(
+            tn_parent_id=target_pk
+        ).order_by("tn_priority", "pk").values_list("pk", "tn_priority"))
+        if position is None or position > len(siblings):
+            position = len(siblings)
+
+        queryset = models.QuerySet(model, using=db)
+        bulk_insert = connections[db].features.can_return_rows_from_bulk_insert
+        copies = {}
+        level = []
+        for source in sources.iterator(chunk_size=batch_size):
+            if level and level[-1][0].tn_depth != source.tn_depth:
+                self._insert_copies(queryset, level, copies, bulk_insert)
+                level = []
+            copy = model(**{
+                field.attname: getattr(source, field.attname)
+                for field in fields
+            })
+            for name, value in field_overrides.items():
+                if callable(value):
+                    value = value(source)
+                setattr(copy, name, value)
+            if source.pk == self.pk:
+                copy.tn_parent_id = target_pk
+                copy.tn_priority = position
+                copy.tn_tree_id = tree_id
+            else:
+                # The parent belongs to the previous level, already inserted
+                parent = copies[source.tn_parent_id]
+                copy.tn_parent_id = parent.pk
+                copy.tn_priority = source.tn_priority
+                copy.tn_tree_id = parent.tn_tree_id
+            level.append((source, copy))
+        self._insert_copies(queryset, level, copies, bulk_insert)
+
+        # --- 3. Closure rows -------------------------------------------------
+        # Rows inside the source subtree keep their depths; the ancestors of
+        # the target (and the target itself) are added above the copy.
+        # Read before the writes: a copy placed inside the source subtree
+        # must not be read back
+        rows = list(closure_model.objects.using(db).filter(
+            parent__parents_set__parent_id=self.pk,
+            child__parents_set__parent_id=self.pk,
+        ).values_list("parent_id", "child_id", "depth"))
+
+        closure_queryset = models.QuerySet(closure_model, using=db)
+        links = []
+        for parent_id, child_id, depth in rows:
+            child = copies[child_id]
+            links.append(closure_model(
+                parent_id=copies[parent_id].pk,
+                child_id=child.pk,
+                depth=depth,
+                tree_id=child.tn_tree_id
+            ))
+            if parent_id == self.pk:
+                links.extend(
+                    closure_model(
+                        parent_id=ancestor_id,
+                        child_id=child.pk,
+                        depth=ancestor_depth + depth + 1,
+                        tree_id=child.tn_tree_id
+                    )
+                    for ancestor_id, ancestor_depth in ancestors
+                )
+            if len(links) >= batch_size:
+                closure_queryset.bulk_create(links, batch_size=batch_size)
+                links = []
+        closure_queryset.bulk_create(links, batch_size=batch_size)
+
+        # --- 4. New siblings of the copy -------------------------------------
+        copy = copies[self.pk]
+        changed = [
+            model(
+                pk=pk,
+                tn_priority=index + (index >= position),
+                # Each root is a tree of its own
+                tn_tree_id=pk if target_pk is None else copy.tn_tree_id
             )
-        # All descendants and related records in the ClosingModel will be
-        # cleared by cascading the removal of ForeignKeys.
-        super().delete()
-        # Can be excluded. The cache has already been cleared by the manager.
+            for index, (pk, priority) in enumerate(siblings)
+            if priority != index + (index >= position)
+        ]
+        queryset.bulk_update(changed, ["tn_priority"], batch_size=batch_size)
+
+        tree_ids = get_tree_ids(changed + [copy])
+        model.clear_cache(tree_ids)
+        closure_model.clear_cache(tree_ids)
+        return copy
+
+    @staticmethod
+    def _insert_copies(queryset, level, copies, bulk_insert=True):
+        """Insert the copies of one level of a subtree."""
+        objs = [copy for source, copy in level]
+        if bulk_insert:
+            queryset.bulk_create(objs)
+        else:
+            # The backend doesn't return the pks of a bulk insert
+            for obj in objs:
+                models.Model.save(obj, force_insert=True, using=queryset.db)
+        # A copy made a root is a new tree
+        roots = [obj for obj in objs if obj.tn_parent_id is None]
+        for obj in roots:
+            obj.tn_tree_id = obj.pk
+        queryset.bulk_update(roots, ["tn_tree_id"])
+        copies.update((source.pk, copy) for source, copy in level)
+
+    @instrument
+    def delete(self, cascade=True, using=None):
+        """Delete node."""
+        model = self._meta.model
+        using = using or db_for_write(model, self)
+        nodes = model.objects.using(using)
+
+        if cascade:
+            # The node and its whole subtree are deleted by the queryset
+            result = nodes.filter(pk=self.pk).delete()
+            setattr(self, self._meta.pk.attname, None)
+            return result
+
+        flush_deferred(model)
+        with transaction.atomic(using=using):
+            lock_trees(model, [self.pk], using=using)
+            columns = ("pk", "tn_priority")
+            children = nodes.filter(tn_parent_id=self.pk).order_by()
+            children_rows = list(
+                children.order_by("tn_priority", "pk").values_list(*columns))
+            siblings_rows = list(
+                nodes.filter(tn_parent_id=self.tn_parent_id).order_by(
+                    "tn_priority", "pk").values_list(*columns))
+            # The children take the place of the node among its siblings
+            order = [row for row in siblings_rows if row[0] != self.pk]
+            pks = [pk for pk, priority in siblings_rows]
+            index = pks.index(self.pk) if self.pk in pks else len(order)
+            order[index:index] = children_rows
+            # Shorten the paths through the node in the Closure table
+            self.closure_model.remove_node(self, using=using)
+            # Move the children one level up
+            children.update(tn_parent_id=self.tn_parent_id)
+            result = super().delete(using=using)
+            if self.tn_parent_id is None:
+                # The children of a root become the roots of new trees
+                self.closure_model.update_tree_ids(
+                    [pk for pk, priority in children_rows], using=using)
+
+            # Renumber the siblings and the promoted children
+            changed = [
+                model(pk=pk, tn_priority=priority)
+                for priority, (pk, old_priority) in enumerate(order)
+                if old_priority != priority
+            ]
+            models.QuerySet(model, using=using).bulk_update(
+                changed, ["tn_priority"], batch_size=1000)
         model.clear_cache()
+        self.closure_model.clear_cache()
+        return result
 
+    @instrument
+    @atomic_for_write(savepoint=False)
     def save(self, force_insert=False, *args, **kwargs):
         """Save method."""
         # --- 1. Preparations -------------------------------------------------
+        model = self._meta.model
+        # A node read from a replica is saved to the primary
+        using = kwargs.get("using") or db_for_write(model, self)
+        kwargs["using"] = using
         is_new = self.pk is None
         is_move = False
         old_parent = None
         old_priority = None
-        model = self._meta.model
+        old_tree_id = None
         closure_model = self.closure_model
+        updates = get_deferred(model)
+        if updates is None:
+            # Concurrent writes to the same tree wait here
+            lock_trees(
+                model,
+                [self.pk, self.tn_parent_id],
+                roots=self.tn_parent_id is None,
+                using=using
+            )
 
         # --- 2. Check mode _-------------------------------------------------
         # If the object already exists in the DB, we'll extract its old parent
         if is_new:
             force_insert = True
         else:
-            ql = model.objects.filter(pk=self.pk).values_list(
+            ql = model.objects.using(using).filter(pk=self.pk).values_list(
                 'tn_parent',
-                'tn_priority').first()
+                'tn_priority',
+                'tn_tree_id').first()
             old_parent = ql[0]
             old_priority = ql[1]
+            old_tree_id = ql[2]
             is_move = old_priority != self.tn_priority
+            # The stored tree id is kept unless the node moves
+            self.tn_tree_id = old_tree_id
 
-        # Check if we are moving the node into itself (child).
         # If old parent != self.tn_parent, "moving" is possible.
-        if old_parent and old_parent != self.tn_parent:
-            # Let's make sure we don't move into our descendant
-            descendants = self.get_descendants_queryset()
-            if self.tn_parent and self.tn_parent.pk in {
-                    d.pk for d in descendants}:
+        is_parent_changed = not is_new and old_parent != self.tn_parent_id
+        if is_parent_changed and updates is None:
+            # Let's make sure we don't move into ourselves or our descendant
+            if closure_model.creates_cycle(
+                    self.pk, self.tn_parent_id, using=using):
                 raise ValueError("You cannot move a node into its own child.")
+            # The node takes its place among the new siblings
+            is_move = True
+
+        if (is_new or is_parent_changed) and updates is None:
+            # The node belongs to the tree of its parent; a new root gets
+            # its own tree after the insert
+            if self.tn_parent_id is None:
+                self.tn_tree_id = self.pk
+            else:
+                self.tn_tree_id = model._base_manager.using(using).filter(
+                    pk=self.tn_parent_id
+                ).values_list("tn_tree_id", flat=True).first()
+                if self.tn_tree_id is None:
+                    # The parent's tree id is not filled in yet: take the
+                    # root of the parent from the Closure table
+                    self.tn_tree_id = closure_model.get_root_pks(
+                        [self.tn_parent_id], using
+                    ).get(self.tn_parent_id)
 
         # --- 3. Saving ------------------------------------------------------
         super().save(force_insert=force_insert, *args, **kwargs)
 
+        if updates is not None:
+            # Deferred mode: the tree is updated when the block exits
+            updates.add_node(
+                self,
+                is_new=is_new,
+                old_parent_id=old_parent,
+                old_priority=old_priority,
+                parent_changed=is_parent_changed,
+                priority_changed=is_move,
+            )
+            return
+
         # --- 4. Synchronization with Closure Model --------------------------
         if is_new:
-            closure_model.insert_node(self)
+            if self.tn_tree_id is None and self.tn_parent_id is None:
+                self.tn_tree_id = self.pk
+                model._base_manager.using(using).filter(pk=self.pk).update(
+                    tn_tree_id=self.pk)
+            closure_model.insert_node(self, using=using)
 
         # If the parent has changed, we move it
-        if (old_parent != self.tn_parent):
-            subtree_nodes = self.get_descendants(include_self=True)
-            self.closure_model.move_node(subtree_nodes)
+        if is_parent_changed:
+            subtree_nodes = list(self.get_descendants_queryset(
+                include_self=True).using(using))
+            self.closure_model.move_node(subtree_nodes, using=using)
+            if self.tn_tree_id != old_tree_id:
+                # The subtree has moved to another tree
+                closure_model.update_tree_ids([self.pk], using=using)
+                tree_ids = None if old_tree_id is None else [old_tree_id]
+                model.clear_cache(tree_ids)
+                closure_model.clear_cache(tree_ids)
 
         # --- 5. Update siblings ---------------------------------------------
         if is_new or is_move:
             # Now we need recalculate tn_priority
             self._update_priority()
         else:
-            self._meta.model.clear_cache()
+            self._meta.model.clear_cache(get_tree_ids([self]))
 
     # ---------------------------------------------------
     # Public properties
@@ -581,89 +1024,37 @@ class TreeNodeModel(models.Model, metaclass=TreeFactory):
     # versions, these methods may be changed or removed without any warning.
     # ---------------------------------------------------
 
+    @instrument
     def _update_priority(self):
         """Update tn_priority field for siblings."""
+        model = self._meta.model
+        db = self._state.db
         if self.tn_parent is None:
             # Node is a root
-            parent = None
-            queryset = self._meta.model.get_roots_queryset()
+            queryset = model.objects.using(db).filter(tn_parent__isnull=True)
         else:
             # Node isn't a root
-            parent = self.tn_parent
-            queryset = parent.tn_children.all()
+            queryset = model.objects.using(db).filter(
+                tn_parent_id=self.tn_parent_id)
 
         siblings = list(queryset.exclude(pk=self.pk))
         sorted_siblings = sorted(siblings, key=lambda x: x.tn_priority)
         insert_pos = min(self.tn_priority, len(sorted_siblings))
         sorted_siblings.insert(insert_pos, self)
+        # Only the changed siblings are written (for the roots, only the
+        # changed trees lose their cache)
+        changed = []
         for index, node in enumerate(sorted_siblings):
+            if node.tn_priority != index and node is not self:
+                changed.append(node)
             node.tn_priority = index
         # Save changes
-        model = self._meta.model
-        with transaction.atomic():
-            model.objects.bulk_update(sorted_siblings, ('tn_priority',))
-        super().save(update_fields=['tn_priority'])
-        model.clear_cache()
-
-    def _object2dict(self, instance, exclude=None, visited=None):
-        """
-        Convert a class instance to a dictionary.
-
-        :param instance: The object instance to convert.
-        :param exclude: List of attribute names to exclude.
-        :param visited: Set of visited objects to prevent circular references.
-        :return: A dictionary representation of the object.
-        """
-        if exclude is None:
-            exclude = set()
-        if visited is None:
-            visited = set()
-
-        # Prevent infinite recursion by tracking visited objects
-        if id(instance) in visited:
-            raise RecursionError("Cycle detected in tree structure.")
-
-        visited.add(id(instance))
-
-        # Если объект не является моделью Django, просто вернуть его
-        if not isinstance(instance, models.Model):
-            return instance
-
-        # If the object has no `__dict__`, return its direct value
-        if not hasattr(instance, '__dict__'):
-            return instance
-
-        result = {}
-
-        for key, value in vars(instance).items():
-            if key.startswith('_') or key in exclude:
-                continue
-
-            # Recursively process nested objects
-            if isinstance(value, (list, tuple, set)):
-                result[key] = [
-                    self._object2dict(v, exclude, visited) for v in value
-                ]
-            elif isinstance(value, dict):
-                result[key] = {
-                    k: self._object2dict(v, exclude, visited)
-                    for k, v in value.items()
-                }
-            else:
-                result[key] = self._object2dict(value, exclude, visited)
-
-        # Include children
-        children = instance.tn_children.all()
-        if children.exists():
-            result['children'] = [
-                self._object2dict(child, exclude, visited)
-                for child in children
-            ]
-
-        # Add path information
-        result['path'] = instance.get_path(format_str=':d')
-
-        return result
+        if changed:
+            with transaction.atomic(using=db):
+                model.objects.db_manager(db).bulk_update(
+                    changed, ('tn_priority',))
+        super().save(update_fields=['tn_priority'], using=db)
+        model.clear_cache(get_tree_ids(changed + [self]))
 
 
 # The end
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Routing Module
+
+This module chooses the database of the tree queries. The tree lookups of
+a node go to the database of the node or to the one chosen by the
+database routers, like the related lookups of Django, and the structural
+writes always go to the write database.
+
+Features:
+- Opt-in routing of the read-only tree lookups to replicas:
+  `settings.TREENODE_READ_DATABASES = {"default": ["replica1", ...]}`.
+- Read-your-writes: after the commit of a structural change of a tree the
+  lookups of the model are pinned to the primary database for
+  `settings.TREENODE_REPLICA_PIN_SECONDS` (5 by default); inside
+  a transaction on the primary they are never sent to a replica. The pins
+  are kept in memory, so they apply only to the process that made the
+  change.
+- Tree writes run in a transaction of the database they write to.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+import functools
+import random
+import time
+from django.conf import settings
+from django.db import connections, models, router, transaction
+
+# model label -> time (monotonic) until which the reads use the primary.
+# Per process: the other processes keep reading from the replicas.
+_pinned = {}
+
+
+def get_read_databases():
+    """Return {primary alias: [replica aliases]} from the settings."""
+    return getattr(settings, "TREENODE_READ_DATABASES", None) or {}
+
+
+def get_primary(using):
+    """Return the primary database of an alias (the alias itself if none)."""
+    for primary, replicas in get_read_databases().items():
+        if using in replicas:
+            return primary
+    return using
+
+
+def db_for_write(model, instance=None):
+    """
+    Return the alias of the tree writes of the model.
+
+    A node read from a replica is written to the primary database.
+    """
+    return get_primary(router.db_for_write(model, instance=instance))
+
+
+def db_for_read(model, instance=None):
+    """
+    Return the alias of a read-only tree lookup.
+
+    Without replicas in the settings the database routers (then the
+    database of the node) decide, as for any Django query.
+    """
+    read_databases = get_read_databases()
+    if not read_databases:
+        return router.db_for_read(model, instance=instance)
+    primary = db_for_write(model, instance)
+    replicas = read_databases.get(primary)
+    if not replicas or is_pinned(model, primary):
+        return primary
+    return random.choice(replicas)
+
+
+def pin_primary(model):
+    """
+    Send the reads of the model in this process to the primary for a while.
+
+    Call it when the change is committed: the replicas lag behind the
+    commit.
+    """
+    seconds = getattr(settings, "TREENODE_REPLICA_PIN_SECONDS", 5)
+    _pinned[model._meta.label] = time.monotonic() + seconds
+
+
+def is_pinned(model, using):
+    """Return True if the reads of the model must use the primary."""
+    if connections[using].in_atomic_block:
+        # The changes of the transaction are visible only on the primary
+        return True
+    return _pinned.get(model._meta.label, 0) > time.monotonic()
+
+
+def atomic_for_write(method=None, savepoint=True):
+    """
+    Run a tree write in a transaction of the database it writes to.
+
+    The database is the `using` argument if given, else the write database
+    of the queryset or manager, of the node or (class methods) of the model.
+    """
+    if method is None:
+        return functools.partial(atomic_for_write, savepoint=savepoint)
+
+    @functools.wraps(method)
+    def wrapper(obj, *args, **kwargs):
+        using = kwargs.get("using")
+        if isinstance(obj, models.QuerySet):
+            obj._for_write = True
+            using = using or obj.db
+        elif not using:
+            if isinstance(obj, models.Manager):
+                using = obj._db or db_for_write(obj.model)
+            elif isinstance(obj, type):
+                using = db_for_write(obj)
+            else:
+                using = db_for_write(type(obj), obj)
+        with transaction.atomic(using=using, savepoint=savepoint):
+            return method(obj, *args, **kwargs)
+
+    return wrapper
+
+
+# The End
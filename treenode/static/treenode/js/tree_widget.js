@@ -45,13 +45,18 @@ Email: timurkady@yandex.com
                         return {
                             q: params.term, // Search query parameter
                             model: forwardData.model || null, // Pass the model name
+                            exclude_subtree: forwardData.exclude_subtree || null, // Hide the edited node and its descendants
+                            page: params.page || 1, // Requested page of results
                         };
                     },
                     processResults: function (data) {
                         if (!data.results) {
                             return { results: [] }; // Return an empty array if no results exist
                         }
-                        return { results: data.results };
+                        return {
+                            results: data.results,
+                            pagination: { more: !!(data.pagination && data.pagination.more) }, // Load more on scroll
+                        };
                     },
                 },
                 minimumInputLength: 0, // Allows opening the dropdown without typing
@@ -10,6 +10,8 @@ Routes:
 - `tree-autocomplete/`: Returns JSON data for Select2 hierarchical selection.
 - `get-children-count/`: Retrieves the number of children for a given 
   parent node.
+- `get-children-counts/`: Retrieves the number of children for many parent
+  nodes at once.
 
 Version: 2.0.0
 Author: Timur Kady
@@ -18,7 +20,11 @@ Email: timurkady@yandex.com
 
 
 from django.urls import path
-from .views import TreeNodeAutocompleteView, GetChildrenCountView
+from .views import (
+    TreeNodeAutocompleteView,
+    GetChildrenCountView,
+    GetChildrenCountsView,
+)
 
 urlpatterns = [
     path(
@@ -31,4 +37,9 @@ urlpatterns = [
         GetChildrenCountView.as_view(),
         name="get_children_count"
     ),
+    path(
+        "get-children-counts/",
+        GetChildrenCountsView.as_view(),
+        name="get_children_counts"
+    ),
 ]
@@ -11,6 +11,8 @@ Features:
 - Handles complex field types (lists, dictionaries) with proper serialization.
 - Provides optimized data extraction for QuerySets.
 - Generates downloadable files with appropriate HTTP responses.
+- Optionally exports the Closure Table rows of every node, so that the tree
+  can be restored without rebuilding the closure.
 
 Version: 2.0.11
 Author: Timur Kady
@@ -24,6 +26,7 @@ import yaml
 import xlsxwriter
 import numpy as np
 import uuid
+from collections import defaultdict
 from io import BytesIO
 from django.http import HttpResponse
 import logging
@@ -34,17 +37,25 @@ logger = logging.getLogger(__name__)
 class TreeNodeExporter:
     """Exporter for tree-structured data to various formats."""
 
-    def __init__(self, queryset, filename="tree_nodes"):
+    closure_field = "tn_closure"
+
+    def __init__(self, queryset, filename="tree_nodes", include_closure=False):
         """
         Init.
 
         :param queryset: QuerySet of objects to export.
         :param filename: Filename without extension.
+        :param include_closure: If True, the closure rows of each node are
+        exported in the extra `tn_closure` column as a JSON list of
+        `[ancestor_id, depth]` pairs (the self-link is omitted).
         """
         self.queryset = queryset
         self.filename = filename
+        self.include_closure = include_closure
         self.fields = [field.name for field in queryset.model._meta.fields]
         self.fields = self.get_ordered_fields()
+        if include_closure:
+            self.fields.append(self.closure_field)
 
     def export(self, format):
         """Determine the export format and calls the corresponding method."""
@@ -91,12 +102,35 @@ class TreeNodeExporter:
         result = [queryset_list[int(idx)] for idx in sorted_indices]
         return result
 
+    def get_closure_map(self):
+        """
+        Return closure rows grouped by node.
+
+        The rows are read in a single query: {child_id: [[parent_id, depth]]},
+        ordered by depth (nearest ancestor first).
+        """
+        closure_model = self.queryset.model.closure_model
+        queryset = closure_model.objects.filter(
+            child_id__in=self.queryset.values("pk"),
+            depth__gt=0
+        ).order_by("child_id", "depth")
+
+        result = defaultdict(list)
+        rows = queryset.values_list("child_id", "parent_id", "depth")
+        for child_id, parent_id, depth in rows.iterator():
+            result[child_id].append([parent_id, depth])
+        return result
+
     def get_data(self):
         """Return a list of data from QuerySet as dictionaries."""
         data = []
+        closure_map = self.get_closure_map() if self.include_closure else {}
         for obj in self.get_sorted_queryset():
             record = {}
             for field in self.fields:
+                if field == self.closure_field:
+                    record[field] = closure_map.get(obj.pk, [])
+                    continue
                 value = getattr(obj, field, None)
                 field_object = obj._meta.get_field(field)
                 if field_object.is_relation:
@@ -7,10 +7,15 @@ from various formats, including CSV, JSON, XLSX, YAML, and TSV.
 
 Features:
 - Supports field mapping and data type conversion for model compatibility.
+- Converts data column by column over batches of records using a conversion
+  plan compiled once per model (with a NumPy path for numeric and boolean
+  columns).
 - Handles ForeignKey relationships and ManyToMany fields.
 - Validates and processes raw data before saving to the database.
 - Uses bulk operations for efficient data insertion and updates.
 - Supports transactional imports to maintain data integrity.
+- Restores trees exported together with their Closure Table rows using
+  plain bulk inserts, skipping the closure rebuild.
 
 Version: 2.0.11
 Author: Timur Kady
@@ -24,17 +29,191 @@ import yaml
 import openpyxl
 import math
 import uuid
+import numpy as np
 from io import BytesIO, StringIO
+from django.db import connections, models, transaction
 
+from ..integrity import TreeIntegrityChecker
+from ..routing import db_for_write
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class CastPlan:
+    """
+    Column conversion plan for a model.
+
+    The plan is compiled once per model from `model._meta.fields` and is
+    applied to whole columns (lists of values) rather than to single cells.
+    Integer, float and boolean columns are converted with NumPy when all
+    their values can be handled in one pass; otherwise, or if NumPy is
+    disabled, each value goes through the field's to_python().
+    """
+
+    INTEGER = "integer"
+    FLOAT = "float"
+    BOOLEAN = "boolean"
+    OTHER = "other"
+
+    # Values meaning NULL in non-text columns (CSV keeps them as strings)
+    null_tokens = ("", "None", "none", "null", "nan")
+    # The tokens of BooleanField.to_python(); other values (e.g. 1.0) take
+    # the per-value path
+    true_tokens = ("t", "True", "1")
+    false_tokens = ("f", "False", "0")
+
+    _plans = {}
+
+    def __init__(self, model):
+        """
+        Init.
+
+        :param model: Django model the plan is compiled for.
+        """
+        self.model = model
+        # field name -> (target key, kind, per-value converter)
+        self.columns = {}
+        for field in model._meta.fields:
+            if field.is_relation and field.many_to_one:
+                target = field.target_field
+                if isinstance(target, models.IntegerField):
+                    kind, converter = self.INTEGER, int
+                else:
+                    kind, converter = self.OTHER, target.to_python
+                self.columns[field.name] = (field.attname, kind, converter)
+                continue
+
+            if isinstance(field, models.BooleanField):
+                kind = self.BOOLEAN
+            elif isinstance(field, models.IntegerField):
+                kind = self.INTEGER
+            elif isinstance(field, models.FloatField):
+                kind = self.FLOAT
+            else:
+                kind = self.OTHER
+            self.columns[field.name] = (field.name, kind, field.to_python)
+
+    @classmethod
+    def for_model(cls, model):
+        """Return the cached plan for the model."""
+        plan = cls._plans.get(model)
+        if plan is None:
+            plan = cls._plans[model] = cls(model)
+        return plan
+
+    def apply(self, columns, use_numpy=True):
+        """
+        Convert columns to the model field types.
+
+        :param columns: Dictionary {field name: list of values}.
+        :param use_numpy: Use the NumPy path for numeric/boolean columns.
+        :return: A new dictionary. ForeignKey columns are renamed to their
+        attname (e.g. tn_parent -> tn_parent_id); unknown keys are passed
+        through unchanged.
+        """
+        result = {}
+        for name, values in columns.items():
+            if name not in self.columns:
+                result[name] = values
+                continue
+
+            target, kind, converter = self.columns[name]
+            converted = None
+            if kind != self.OTHER:
+                values = [
+                    None if self._is_null(value) else value
+                    for value in values
+                ]
+                if use_numpy:
+                    converted = self._numpy_convert(kind, values)
+            if converted is None:
+                converted = self._python_convert(name, converter, values)
+            result[target] = converted
+        return result
+
+    def _is_null(self, value):
+        """Check if the value of a non-text column means NULL."""
+        if value is None:
+            return True
+        if isinstance(value, float):
+            return math.isnan(value)
+        return isinstance(value, str) and value.strip() in self.null_tokens
+
+    def _numpy_convert(self, kind, values):
+        """
+        Convert a column with NumPy.
+
+        The result is the same as the one of to_python(). Return None if the
+        column can't be converted in one pass.
+        """
+        try:
+            if kind == self.BOOLEAN:
+                tokens = np.array(values, dtype=str)
+                is_true = np.isin(tokens, self.true_tokens)
+                is_false = np.isin(tokens, self.false_tokens)
+                is_null = np.array([value is None for value in values])
+                if not (is_true | is_false | is_null).all():
+                    return None
+                array = is_true.astype(object)
+                array[is_null] = None
+                return array.tolist()
+
+            strings = {
+                isinstance(value, str) for value in values
+                if value is not None
+            }
+            if kind == self.INTEGER and strings == {True, False}:
+                return None
+            if kind == self.INTEGER and True in strings:
+                # Parsed like int(): "1e3" or "1.0" are rejected
+                is_null = np.array([value is None for value in values])
+                array = np.array(
+                    ["0" if value is None else value for value in values]
+                ).astype(np.int64)
+            else:
+                array = np.array(values, dtype=np.float64)
+                is_null = np.isnan(array)
+                if kind == self.INTEGER:
+                    valid = array[~is_null]
+                    if (valid != np.trunc(valid)).any() or \
+                            (np.abs(valid) > 2**53).any():
+                        return None
+                    array = np.where(is_null, 0, array).astype(np.int64)
+            array = array.astype(object)
+            array[is_null] = None
+            return array.tolist()
+        except (TypeError, ValueError, OverflowError):
+            return None
+
+    def _python_convert(self, name, converter, values):
+        """Convert a column value by value."""
+        result = []
+        for value in values:
+            if value is None or (
+                    isinstance(value, float) and math.isnan(value)):
+                result.append(None)
+                continue
+            try:
+                result.append(converter(value))
+            except Exception as e:
+                logger.warning(
+                    "Error converting field %s with value %r: %s",
+                    name,
+                    value,
+                    e
+                )
+                result.append(None)
+        return result
+
+
 class TreeNodeImporter:
     """Импортер древовидных данных из различных форматов."""
 
-    def __init__(self, model, file, format, fields=None, mapping=None):
+    closure_field = "tn_closure"
+
+    def __init__(self, model, file, format, fields=None, mapping=None,
+                 include_closure=False, use_numpy=True):
         """
         Init method.
 
@@ -45,9 +224,17 @@ class TreeNodeImporter:
         :param mapping: Dictionary for mapping keys from file to model
         field names.
         For example: {"Name": "title", "Description": "desc"}
+        :param include_closure: The file contains the `tn_closure` column
+        written by TreeNodeExporter. It is detected automatically as well.
+        :param use_numpy: Convert numeric and boolean columns with NumPy.
         """
         self.model = model
+        # The import writes: its reads must see the primary database too
+        self.using = db_for_write(model)
         self.format = format
+        self.include_closure = include_closure
+        self.use_numpy = use_numpy
+        self.plan = CastPlan.for_model(model)
         # Если поля не заданы, используем все поля модели
         self.fields = fields or [field.name for field in model._meta.fields]
         # По умолчанию маппинг идентичен: ключи совпадают с именами полей
@@ -58,10 +245,10 @@ class TreeNodeImporter:
     def get_text_content(self):
         """Return the contents of a file as a string."""
         if isinstance(self.file_content, bytes):
-            return self.file_content.decode("utf-8")
+            return self.file_content.decode("utf-8-sig")
         return self.file_content
 
-    def import_data(self):
+    def import_data(self, batch_size=1000):
         """Import data and returns a list of dictionaries."""
         importers = {
             "csv": self.from_csv,
@@ -75,16 +262,52 @@ class TreeNodeImporter:
 
         raw_data = importers[self.format]()
 
+        # Closure rows are passed through untouched
+        if raw_data and self.closure_field in raw_data[0]:
+            self.include_closure = True
+        if self.include_closure:
+            self.mapping.setdefault(self.closure_field, self.closure_field)
+
         # Processing: field filtering, complex value packing and type casting
         processed = []
-        for record in raw_data:
-            filtered = self.filter_fields(record)
-            filtered = self.process_complex_fields(filtered)
-            filtered = self.cast_record_types(filtered)
-            processed.append(filtered)
+        for start in range(0, len(raw_data), batch_size):
+            batch = raw_data[start:start + batch_size]
+            processed.extend(self.process_batch(batch))
 
         return processed
 
+    def process_batch(self, rows):
+        """
+        Process a batch of raw rows column by column.
+
+        The rows are filtered and renamed according to the mapping, complex
+        values are packed into JSON strings and the values are cast with
+        the model conversion plan.
+        """
+        columns = {
+            model_field: [row.get(file_key) for row in rows]
+            for file_key, model_field in self.mapping.items()
+        }
+        for key, values in columns.items():
+            columns[key] = self.process_complex_column(key, values)
+        columns = self.plan.apply(columns, use_numpy=self.use_numpy)
+
+        keys = list(columns.keys())
+        if not keys:
+            return [{} for row in rows]
+        return [dict(zip(keys, values)) for values in zip(*columns.values())]
+
+    def process_complex_column(self, key, values):
+        """Pack the lists and dictionaries of a column into JSON strings."""
+        if not any(isinstance(v, (list, dict, uuid.UUID)) for v in values):
+            return values
+        record = {}
+        result = []
+        for value in values:
+            record[key] = value
+            result.append(self.process_complex_fields(record)[key])
+        return result
+
     def get_tn_orders(self, rows):
         """Calculate the materialized path without including None parents."""
         # Build a mapping from id to record for quick lookup.
@@ -135,45 +358,12 @@ class TreeNodeImporter:
         it is replaced with None.
         For ForeignKey fields (many-to-one), the value is written to
         the <field>_id attribute, and the original key is removed.
+        Whole batches are processed faster with process_batch().
         """
-        for field in self.model._meta.fields:
-            field_name = field.name
-            if field.is_relation and field.many_to_one:
-                if field_name in record:
-                    value = record[field_name]
-                    if isinstance(value, float) and math.isnan(value):
-                        value = None
-                    try:
-                        converted = None if value is None else int(value)
-                        # Записываем в атрибут, например, tn_parent_id
-                        record[field.attname] = converted
-                    except Exception as e:
-                        logger.warning(
-                            "Error converting FK field %s with value %r: %s",
-                            field_name,
-                            value,
-                            e
-                        )
-                        record[field.attname] = None
-                    # Удаляем оригинальное значение, чтобы Django не пыталась
-                    # его обработать
-                    del record[field_name]
-            else:
-                if field_name in record:
-                    value = record[field_name]
-                    if isinstance(value, float) and math.isnan(value):
-                        record[field_name] = None
-                    else:
-                        try:
-                            record[field_name] = field.to_python(value)
-                        except Exception as e:
-                            logger.warning(
-                                "Error converting field %s with value %r: %s",
-                                field_name,
-                                value,
-                                e
-                            )
-                            record[field_name] = None
+        columns = {key: [value] for key, value in record.items()}
+        columns = self.plan.apply(columns, use_numpy=False)
+        record.clear()
+        record.update({key: values[0] for key, values in columns.items()})
         return record
 
     # ------------------------------------------------------------------------
@@ -212,6 +402,14 @@ class TreeNodeImporter:
              "errors": [список ошибок]
           }
         """
+        nodes = self.model.objects.db_manager(self.using)
+        if self.include_closure:
+            if not nodes.exists():
+                return self.restore(raw_data)
+            # The tree is not empty: the closure has to be recalculated
+            for record in raw_data:
+                record.pop(self.closure_field, None)
+
         result = {
             "create": [],
             "update": [],
@@ -249,7 +447,7 @@ class TreeNodeImporter:
             instances_to_create = []
             for record in records_by_level[level]:
                 rec_id = record["id"]
-                if self.model.objects.filter(pk=rec_id).exists():
+                if nodes.filter(pk=rec_id).exists():
                     to_update.append(record)
                 else:
                     instance = self.model(**record)
@@ -260,7 +458,7 @@ class TreeNodeImporter:
                         result["errors"].append(f"Validation error for record \
 {record['id']} on level {level}: {e}")
             try:
-                created = self.model.objects.bulk_create(instances_to_create)
+                created = nodes.bulk_create(instances_to_create)
                 result["create"].extend(created)
             except Exception as e:
                 result["errors"].append(f"Create error on level {level}: {e}")
@@ -272,7 +470,7 @@ class TreeNodeImporter:
         for record in to_update:
             rec_id = record["id"]
             try:
-                instance = self.model.objects.get(pk=rec_id)
+                instance = nodes.get(pk=rec_id)
                 for field, value in record.items():
                     if field != "id":
                         setattr(instance, field, value)
@@ -285,13 +483,128 @@ class TreeNodeImporter:
         update_fields = list(update_fields_set)
         if updated_instances:
             try:
-                self.model.objects.bulk_update(updated_instances, update_fields)
+                nodes.bulk_update(updated_instances, update_fields)
                 result["update"].extend(updated_instances)
             except Exception as e:
                 result["errors"].append(f"Bulk update error: {e}")
 
         return result
 
+    def restore(self, raw_data, batch_size=1000):
+        """
+        Restore the tree together with its Closure Table.
+
+        Used for records exported with `include_closure=True` into an empty
+        tree. Nodes and closure rows are loaded with plain bulk inserts
+        (constraint checks are deferred where the backend allows it), so
+        the closure is not recalculated. The indexes are kept: dropping
+        and recreating them is DDL, which commits the transaction on
+        MySQL. The Closure Table is checked at the end; on failure the
+        whole restore is rolled back.
+
+        Returns a dictionary in the same format as finalize().
+        """
+        result = {
+            "create": [],
+            "update": [],
+            "errors": []
+        }
+
+        closure_model = self.model.closure_model
+        fk_fields = [
+            field.name for field in self.model._meta.fields
+            if field.is_relation
+        ]
+        instances = []
+        closure_rows = []
+        for record in raw_data:
+            ancestors = record.pop(self.closure_field, None) or []
+            if isinstance(ancestors, str):
+                ancestors = json.loads(ancestors)
+            instance = self.model(**record)
+            try:
+                if instance.pk is None:
+                    raise ValueError("the id field is required.")
+                instance.clean_fields(exclude=fk_fields)
+            except Exception as e:
+                result["errors"].append(
+                    f"Validation error for record {record.get('id')}: {e}")
+                continue
+            instances.append(instance)
+            closure_rows.append(closure_model(
+                parent_id=instance.pk,
+                child_id=instance.pk,
+                depth=0,
+                tree_id=instance.tn_tree_id
+            ))
+            closure_rows.extend(
+                closure_model(
+                    parent_id=parent_id,
+                    child_id=instance.pk,
+                    depth=depth,
+                    tree_id=instance.tn_tree_id
+                )
+                for parent_id, depth in ancestors
+            )
+
+        if result["errors"]:
+            return result
+
+        table_names = [
+            self.model._meta.db_table,
+            closure_model._meta.db_table
+        ]
+        try:
+            connection = connections[self.using]
+            # The checks must be disabled before the transaction: SQLite
+            # ignores PRAGMA foreign_keys inside a transaction
+            with connection.constraint_checks_disabled(), \
+                    transaction.atomic(using=self.using):
+                # Plain QuerySets: bypass the closure synchronization
+                models.QuerySet(self.model, using=self.using).bulk_create(
+                    instances, batch_size=batch_size
+                )
+                models.QuerySet(closure_model, using=self.using).bulk_create(
+                    closure_rows, batch_size=batch_size
+                )
+                connection.check_constraints(table_names=table_names)
+                # Files exported without the tree ids
+                closure_model.update_tree_ids(
+                    batch_size=batch_size, using=self.using)
+                errors = self.verify_closure()
+                if errors:
+                    raise ValueError("; ".join(errors))
+        except Exception as e:
+            result["errors"].append(f"Restore error: {e}")
+            return result
+
+        self.model.objects.update_auto_increment(self.using)
+        self.model.clear_cache()
+        result["create"].extend(instances)
+        return result
+
+    def verify_closure(self):
+        """
+        Check the restored Closure Table against the adjacency data.
+
+        Runs the set-based checks of TreeIntegrityChecker: self-links,
+        extra and missing rows, cycles and tree ids.
+        Returns a list of error messages.
+        """
+        checker = TreeIntegrityChecker(self.model, limit=5, using=self.using)
+        report = checker.check(checks=[
+            "missing_self_links",
+            "extra_links",
+            "missing_links",
+            "cycles",
+            "tree_ids",
+        ])
+        return [
+            f"{check}: {count} ({report.samples[check]})"
+            for check, count in report.counts.items()
+            if count
+        ]
+
     # ------------------------------------------------------------------------
 
     def from_csv(self):
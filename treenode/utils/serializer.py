@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+TreeNode Serializer Module
+
+This module provides serialization of a tree (or a subtree) into nested
+dictionaries or a JSON stream.
+
+Features:
+- Fetches the whole subtree with a single query through the Closure Table
+  (the whole tree of a root is read by its tree id).
+- Assembles the nested structure in memory from a parent map.
+- Supports depth limits and field whitelists.
+- Can yield the result incrementally (tree by tree, or as JSON chunks).
+- Renders indented multiline text of the tree in pre-order.
+- Reads from the database of the root or from a replica.
+
+Version: 2.0.11
+Author: Timur Kady
+Email: timurkady@yandex.com
+"""
+
+
+import json
+from collections import defaultdict
+from operator import attrgetter, itemgetter
+from django.core.serializers.json import DjangoJSONEncoder
+
+from ..routing import db_for_read
+
+
+class TreeNodeSerializer:
+    """Serializer of a TreeNodeModel tree into nested dictionaries."""
+
+    def __init__(self, model, root=None, max_depth=None, fields=None):
+        """
+        Init.
+
+        :param model: TreeNodeModel subclass.
+        :param root: Node whose subtree is serialized (the root included);
+        if None, the whole tree is serialized.
+        :param max_depth: Maximum depth below the root(s); 0 means only the
+        root(s). None means unlimited.
+        :param fields: List of field names to include; all concrete fields
+        by default. The `path` and `children` keys are always added.
+        """
+        self.model = model
+        self.root = root
+        self.max_depth = max_depth
+        if fields is None:
+            self.fields = [f.attname for f in model._meta.concrete_fields]
+        else:
+            self.fields = [
+                model._meta.get_field(name).attname for name in fields
+            ]
+
+    def get_queryset(self):
+        """Return the queryset of all the serialized nodes."""
+        queryset = self.model.objects.using(
+            db_for_read(self.model, self.root))
+        options = {}
+        is_tree = self.root is not None and self.root.tn_parent_id is None \
+            and self.root.tn_tree_id == self.root.pk
+        if is_tree and self.max_depth is None:
+            # The whole tree of a root is read by its tree id
+            options["tn_tree_id"] = self.root.pk
+        elif self.root is not None:
+            options["parents_set__parent_id"] = self.root.pk
+        elif self.max_depth is not None:
+            options["parents_set__parent__tn_parent__isnull"] = True
+        if self.max_depth is not None:
+            options["parents_set__depth__lte"] = self.max_depth
+        # Conditions in a single filter() share the closure join
+        return queryset.filter(**options).order_by("tn_priority", "pk")
+
+    def get_nodes(self, objects=False):
+        """
+        Read the nodes and build the parent map.
+
+        :param objects: Return model instances instead of dictionaries.
+        Returns a tuple (roots, children_map).
+        """
+        queryset = self.get_queryset()
+        if objects:
+            rows = queryset
+            pk_of = attrgetter("pk")
+            parent_of = attrgetter("tn_parent_id")
+        else:
+            service = ["pk", "tn_parent_id", "tn_priority"]
+            columns = list(dict.fromkeys(service + self.fields))
+            rows = queryset.values(*columns)
+            pk_of = itemgetter("pk")
+            parent_of = itemgetter("tn_parent_id")
+
+        children_map = defaultdict(list)
+        roots = []
+        root_pk = self.root.pk if self.root is not None else None
+        for row in rows.iterator():
+            if root_pk is None:
+                is_root = parent_of(row) is None
+            else:
+                is_root = pk_of(row) == root_pk
+            if is_root:
+                roots.append(row)
+            else:
+                children_map[parent_of(row)].append(row)
+        return roots, children_map
+
+    def get_top_path(self, row):
+        """Return the materialized path of a top-level node."""
+        if self.root is None or self.root.tn_parent_id is None:
+            return str(row["tn_priority"])
+        return self.root.get_path(format_str=':d')
+
+    def node_dict(self, row, path):
+        """Return the dictionary of a node without children."""
+        result = {field: row[field] for field in self.fields}
+        result["path"] = path
+        return result
+
+    def iter_trees(self):
+        """Yield the nested dictionary of each top-level node in turn."""
+        roots, children_map = self.get_nodes()
+
+        for root in roots:
+            top = self.node_dict(root, self.get_top_path(root))
+            # Iterative DFS: (row, dict) pairs whose children are pending
+            stack = [(root, top)]
+            while stack:
+                row, item = stack.pop()
+                children = children_map.get(row["pk"])
+                if not children:
+                    continue
+                item["children"] = []
+                for child in children:
+                    path = f"{item['path']}.{child['tn_priority']}"
+                    child_item = self.node_dict(child, path)
+                    item["children"].append(child_item)
+                    stack.append((child, child_item))
+            yield top
+
+    def serialize(self):
+        """Return a list of nested dictionaries."""
+        return list(self.iter_trees())
+
+    def iter_json(self, encoder=DjangoJSONEncoder):
+        """
+        Yield the serialized tree as JSON text chunks.
+
+        Nodes are written one by one in pre-order, so the nested structure
+        is never built in memory.
+        """
+        roots, children_map = self.get_nodes()
+        dumps = encoder().encode
+
+        yield "["
+        # Stack items: a node row with its path, or a closing token
+        stack = [
+            (row, self.get_top_path(row), i > 0)
+            for i, row in reversed(list(enumerate(roots)))
+        ]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                yield item
+                continue
+            row, path, comma = item
+            node = dumps(self.node_dict(row, path))
+            children = children_map.get(row["pk"])
+            if comma:
+                yield ","
+            if not children:
+                yield node
+                continue
+            # Reopen the object to append the children
+            yield node[:-1] + ', "children": ['
+            stack.append("]}")
+            stack.extend(
+                (child, f"{path}.{child['tn_priority']}", i > 0)
+                for i, child in reversed(list(enumerate(children)))
+            )
+        yield "]"
+
+    def iter_lines(self, indent="    ", include_root=True):
+        """
+        Yield the lines of the indented tree display in pre-order.
+
+        Each line is str(node) indented by its depth below the top node(s).
+        :param include_root: If False (and a root node is given), the root
+        line is skipped and its descendants are shifted one level up.
+        """
+        roots, children_map = self.get_nodes(objects=True)
+        shift = 0 if include_root or self.root is None else 1
+
+        stack = [(node, 0) for node in reversed(roots)]
+        while stack:
+            node, depth = stack.pop()
+            if depth >= shift:
+                yield f"{indent * (depth - shift)}{node}"
+            children = children_map.get(node.pk, [])
+            stack.extend((child, depth + 1) for child in reversed(children))
+
+    def to_display(self, indent="    ", include_root=True):
+        """Return the indented tree display as a multiline string."""
+        return "\n".join(self.iter_lines(indent, include_root))
+
+    def to_json(self, **kwargs):
+        """Return the serialized tree as a JSON string."""
+        return json.dumps(self.serialize(), cls=DjangoJSONEncoder, **kwargs)
+
+
+# The End
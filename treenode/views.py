@@ -8,11 +8,16 @@ and retrieving child node counts.
 
 Features:
 - `TreeNodeAutocompleteView`: Returns JSON data for Select2 with hierarchical
-   structure.
+   structure; results are paginated and searched by the model
+   `treenode_display_field` (contains, prefix or trigram search).
 - `GetChildrenCountView`: Retrieves the number of children for a given
    parent node.
+- `GetChildrenCountsView`: Retrieves the number of children for many parent
+   nodes with a single query.
 - Uses optimized QuerySets for efficient database queries.
 - Handles validation and error responses gracefully.
+- Emits ETag/Last-Modified headers keyed on the tree version and answers
+  conditional requests with 304 Not Modified.
 
 Version: 2.0.11
 Author: Timur Kady
@@ -23,17 +28,71 @@ Email: timurkady@yandex.com
 from django.http import JsonResponse
 from django.views import View
 from django.apps import apps
-import numpy as np
-from django.core.exceptions import ObjectDoesNotExist
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import Count, Exists, OuterRef, Subquery
+from django.utils.decorators import method_decorator
 from django.utils.translation import gettext_lazy as _
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from datetime import datetime, timezone
 
 
+def get_request_model(request):
+    """Return the model passed in the `model` parameter or None."""
+    try:
+        return apps.get_model(request.GET.get("model", ""))
+    except (LookupError, ValueError):
+        return None
+
+
+def tree_etag(request, *args, **kwargs):
+    """Return the ETag for the tree of the requested model."""
+    model = get_request_model(request)
+    if model is None or not hasattr(model, "get_tree_version"):
+        return None
+    return f"{model._meta.label_lower}-{model.get_tree_version():.6f}"
+
+
+def tree_last_modified(request, *args, **kwargs):
+    """Return the time of the last change of the requested model tree."""
+    model = get_request_model(request)
+    if model is None or not hasattr(model, "get_tree_version"):
+        return None
+    return datetime.fromtimestamp(model.get_tree_version(), tz=timezone.utc)
+
+
+# Responses may be stored, but must be revalidated with the ETag
+tree_conditional = [
+    cache_control(no_cache=True),
+    condition(etag_func=tree_etag, last_modified_func=tree_last_modified),
+]
+
+
+@method_decorator(tree_conditional, name="get")
 class TreeNodeAutocompleteView(View):
-    """Returns JSON data for Select2 with tree structure."""
+    """
+    Returns JSON data for Select2 with tree structure.
+
+    GET parameters:
+    - `model`: model label (required);
+    - `q`: search term;
+    - `page`: page number (starting from 1);
+    - `exclude_subtree`: node id; the node and its descendants are left out
+      (they can't be chosen as its parent).
+
+    Search mode, page size and the maximum number of results are taken
+    from the `TREENODE_AUTOCOMPLETE_SEARCH` ("icontains", "istartswith" or
+    "trigram"), `TREENODE_AUTOCOMPLETE_PAGE_SIZE` and
+    `TREENODE_AUTOCOMPLETE_MAX_RESULTS` settings.
+    """
+
+    search_modes = ("icontains", "istartswith", "trigram")
 
     def get(self, request):
         """Get method."""
-        q = request.GET.get("q", "")
+        q = request.GET.get("q", "").strip()
         model_label = request.GET.get("model")  # Получаем модель
 
         if not model_label:
@@ -50,34 +109,113 @@ class TreeNodeAutocompleteView(View):
                 status=400
             )
 
-        queryset = model.objects.filter(name__icontains=q)
-        # Sorting
-        tn_orders = np.array([obj.tn_order for obj in queryset])
-        sorted_indices = np.argsort(tn_orders)
-        queryset_list = list(queryset.iterator())
-        sorted_queryset = [queryset_list[int(idx)] for idx in sorted_indices]
+        try:
+            page = max(int(request.GET.get("page", 1)), 1)
+        except ValueError:
+            page = 1
+        page_size = getattr(settings, "TREENODE_AUTOCOMPLETE_PAGE_SIZE", 30)
+        max_results = getattr(
+            settings, "TREENODE_AUTOCOMPLETE_MAX_RESULTS", 1000)
+
+        # Bounded result set: never read past max_results
+        offset = (page - 1) * page_size
+        limit = min(page_size, max(max_results - offset, 0))
+        queryset = self.get_queryset(model, q)
+        exclude_subtree = request.GET.get("exclude_subtree")
+        if exclude_subtree:
+            try:
+                subtree = model.closure_model.objects.filter(
+                    parent_id=exclude_subtree
+                ).values("child_id")
+                queryset = queryset.exclude(pk__in=Subquery(subtree))
+            except (ValueError, ValidationError):
+                return JsonResponse(
+                    {"error": "Invalid exclude_subtree parameter"},
+                    status=400
+                )
+        # One extra row tells whether there is a next page
+        nodes = list(queryset[offset:offset + limit + 1]) if limit else []
+        more = len(nodes) > limit and offset + limit < max_results
+        nodes = nodes[:limit]
 
         results = [
             {
                 "id": node.pk,
-                "text": node.name,
-                "level": node.get_level(),
-                "is_leaf": node.is_leaf(),
+                "text": str(node),
+                "level": node.tn_level,
+                "is_leaf": node.tn_is_leaf,
             }
-            for node in sorted_queryset
+            for node in nodes
         ]
 
-        root_option = {
-            "id": "",
-            "text": _("Root"),
-            "level": 0,
-            "is_leaf": True,
-        }
-        results.insert(0, root_option)
+        if page == 1:
+            root_option = {
+                "id": "",
+                "text": _("Root"),
+                "level": 0,
+                "is_leaf": True,
+            }
+            results.insert(0, root_option)
+
+        return JsonResponse({"results": results, "pagination": {"more": more}})
+
+    def get_queryset(self, model, q):
+        """
+        Return the ordered queryset of matching nodes.
+
+        Level and leaf flags are annotated, so no additional queries are
+        made per row.
+        """
+        field = model.treenode_display_field
+        queryset = model.objects.all()
+
+        ordering = [field, "pk"] if field else ["pk"]
+        if q:
+            if field is None:
+                if not q.isdigit():
+                    return queryset.none()
+                queryset = queryset.filter(pk=q)
+            else:
+                queryset, ordering = self.search(queryset, field, q)
 
-        return JsonResponse({"results": results})
+        closure_model = model.closure_model
+        level = closure_model.objects.filter(child=OuterRef("pk")).values(
+            "child").annotate(count=Count("*")).values("count")
+        has_children = model.objects.filter(tn_parent=OuterRef("pk"))
+        return queryset.annotate(
+            tn_level=Subquery(level),
+            tn_is_leaf=~Exists(has_children),
+        ).order_by(*ordering)
 
+    def search(self, queryset, field, q):
+        """Filter the queryset. Return the queryset and its ordering."""
+        mode = getattr(settings, "TREENODE_AUTOCOMPLETE_SEARCH", "icontains")
+        if mode not in self.search_modes:
+            mode = "icontains"
 
+        if mode == "trigram":
+            if self.trigram_available(queryset):
+                from django.contrib.postgres.search import TrigramSimilarity
+
+                queryset = queryset.filter(
+                    **{f"{field}__trigram_similar": q}
+                ).annotate(tn_similarity=TrigramSimilarity(field, q))
+                return queryset, ["-tn_similarity", field, "pk"]
+            mode = "icontains"
+
+        queryset = queryset.filter(**{f"{field}__{mode}": q})
+        return queryset, [field, "pk"]
+
+    @staticmethod
+    def trigram_available(queryset):
+        """Check whether trigram search can be used for the queryset."""
+        return (
+            connections[queryset.db].vendor == "postgresql" and
+            apps.is_installed("django.contrib.postgres")
+        )
+
+
+@method_decorator(tree_conditional, name="get")
 class GetChildrenCountView(View):
     """Return the number of children for a given parent node."""
 
@@ -107,3 +245,52 @@ class GetChildrenCountView(View):
             )
 
         return JsonResponse({"children_count": children_count})
+
+
+@method_decorator(tree_conditional, name="get")
+class GetChildrenCountsView(View):
+    """
+    Return the number of children for many parent nodes.
+
+    GET parameters:
+    - `model`: model label;
+    - `parent_ids`: comma-separated list of node ids (at most
+      `TREENODE_CHILDREN_COUNTS_LIMIT`, 1000 by default).
+    """
+
+    def get(self, request):
+        """Get method."""
+        parent_ids = request.GET.get("parent_ids", "")
+        model_label = request.GET.get("model")  # Получаем модель
+
+        if not model_label or not parent_ids:
+            return JsonResponse({"error": "Missing parameters"}, status=400)
+
+        try:
+            model = apps.get_model(model_label)
+        except LookupError:
+            return JsonResponse(
+                {"error": f"Invalid model: {model_label}"},
+                status=400
+            )
+
+        pk_field = model._meta.pk
+        try:
+            pks = list(dict.fromkeys(
+                pk_field.to_python(pk)
+                for pk in parent_ids.split(",") if pk.strip()
+            ))
+        except ValidationError:
+            return JsonResponse({"error": "Invalid parent_ids"}, status=400)
+
+        limit = getattr(settings, "TREENODE_CHILDREN_COUNTS_LIMIT", 1000)
+        if len(pks) > limit:
+            return JsonResponse(
+                {"error": f"Too many parent_ids (limit is {limit})"},
+                status=400
+            )
+
+        counts = model.get_children_counts(pks)
+        return JsonResponse({
+            "children_counts": {str(pk): count for pk, count in counts.items()}
+        })
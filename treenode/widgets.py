@@ -9,7 +9,8 @@ for tree-structured data selection.
 Features:
 - `TreeWidget`: A custom Select2 widget that enhances usability for
   hierarchical models.
-- Automatically fetches hierarchical data via AJAX.
+- Automatically fetches hierarchical data via AJAX; only the selected
+  value is rendered on the page.
 - Supports dynamic model binding for reusable implementations.
 - Integrates with Django’s form system.
 
@@ -19,7 +20,9 @@ Email: timurkady@yandex.com
 """
 
 
+import json
 from django import forms
+from django.core.exceptions import ValidationError
 
 
 class TreeWidget(forms.Select):
@@ -60,7 +63,11 @@ class TreeWidget(forms.Select):
                 label = model._meta.app_label
                 model_name = model._meta.model_name
                 model_label = f"{label}.{model_name}"
-                attrs["data-forward"] = f'{{"model": "{model_label}"}}'
+                forward = {"model": model_label}
+                exclude_subtree = getattr(self, "exclude_subtree", None)
+                if exclude_subtree is not None:
+                    forward["exclude_subtree"] = str(exclude_subtree)
+                attrs["data-forward"] = json.dumps(forward)
             except AttributeError as e:
                 raise ValueError(
                     "TreeWidget: model object is not a valid Django model"
@@ -78,4 +85,38 @@ class TreeWidget(forms.Select):
 
         return attrs
 
+    def optgroups(self, name, value, attrs=None):
+        """
+        Return the options to render.
+
+        For tree models only the empty option and the selected values are
+        rendered (one query for the selected values); the rest is loaded
+        via AJAX.
+        """
+        choices = self.choices
+        queryset = getattr(choices, "queryset", None)
+        if queryset is None or not hasattr(queryset.model, "closure_model"):
+            return super().optgroups(name, value, attrs)
+
+        field = choices.field
+        selected = [v for v in value if v not in ("", None)]
+        options = []
+        if field.empty_label is not None:
+            options.append(("", field.empty_label))
+        if selected:
+            try:
+                objs = list(queryset.filter(pk__in=selected))
+            except (TypeError, ValueError, ValidationError):
+                objs = []
+            options.extend(
+                (field.prepare_value(obj), field.label_from_instance(obj))
+                for obj in objs
+            )
+
+        self.choices = options
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = choices
+
 # The End